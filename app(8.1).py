@@ -3,8 +3,21 @@
 # Author: Hyeok Hwang + Copilot
 # Last update: 2025-12-17
 
+import contextlib
+import difflib
+import io
 import os
 import re
+import hashlib
+import importlib.util
+import tempfile
+import threading
+import time
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+import numpy as np
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -23,11 +36,122 @@ st.set_page_config(
 # ------------------------------------------------------------------------------
 # Constants / Assumptions
 # ------------------------------------------------------------------------------
+# Background precomputation: extra folder to watch and polling interval (seconds)
+DATA_WATCH_DIR = "data"
+PRECOMPUTE_POLL_SECONDS = 5
+
+# Auto-refresh: sessions poll a cheap fingerprint of what they show (seconds between checks)
+AUTO_REFRESH_INTERVALS = [5, 15, 30, 60]
+AUTO_REFRESH_DEFAULT_SECONDS = 15
+
+# Downloads: format → (extension, mime); bytes are built on click and cached (LRU, max entries)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+# Optional writer packages: a format is offered only if one of its modules can be imported
+EXPORT_FORMAT_MODULES = {
+    'Parquet': ('pyarrow',),
+    'Excel': ('xlsxwriter', 'openpyxl'),
+}
+EXPORT_CACHE_ENTRIES = 32
+EXPORT_CHUNK_ROWS = 50000  # 파일 writer에 한 번에 넘기는 행 수 (전체 데이터 export도 이 단위로 씀)
+# Full-dataset exports are written here once per (dataset version, filter, format)
+EXPORT_DIR = "exports"
+# st.download_button keeps a download's whole payload in server memory (no streaming from disk),
+# so the full-dataset download is offered only up to this many filtered rows (~70 MB as CSV)
+EXPORT_MAX_ROWS = 200000
+
+# Paged tables: rows sent to the browser per page (search / sort / paging run server-side)
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+TABLE_DEFAULT_PAGE_SIZE = 50
+
+# Versioned snapshots: every published dataset version is stored here (Parquet, keyed by content hash)
+SNAPSHOT_DIR = "snapshots"
+# Stable row key used to match schemes between two versions
+SNAPSHOT_KEY_COLS = ['office', 'palika', 'ward#', 'community name']
+
+# Duplicate-scheme rules (defaults; editable on the Duplicate Schemes page)
+DUPLICATE_IDENTITY_COLS = SNAPSHOT_KEY_COLS
+DUPLICATE_DISTINCT_COLS = ['system new or rehabilated']  # 값이 다르면 같은 community라도 별개 scheme
+DUPLICATE_MATCH_TYPES = ['Exact', 'Same identity', 'Near']
+
+# Data-quality profiler thresholds
+DQ_BENEFICIARY_MAX = 50000    # scheme 하나의 수혜 인구가 이보다 크면 입력 오류 의심
+DQ_YEAR_RANGE = (2015, 2035)  # 보고 연도 허용 범위
+
+# Default reporting year (sidebar selector falls back to this when present in data)
+DEFAULT_REPORTING_YEAR = 2025
+
 # Assumption for 3.1.3:
 SAN_BENEFICIARY_PER_TOILET = 5  # assumption: 5 people benefit per additional toilet
 
-# Default office targets (adjust as needed for sanitation)
-SANITATION_TARGETS = {
+# Disaggregated beneficiaries carried next to every indicator total: label → (standard column, derived column)
+DISAGG_COLUMNS = {
+    'Male': ('beneficiary population male # (current)', '_male'),
+    'Female': ('beneficiary population female # (current)', '_female'),
+    'PWD': ('beneficiary population person with disability # (current)', '_pwd'),
+}
+
+# JMP drinking-water service ladder, lowest → highest (source labels are matched onto these)
+JMP_LADDER = ['Surface water', 'Unimproved', 'Improved', 'Limited', 'Basic', 'Basic+', 'Safely managed']
+
+# Water Safety Plan process steps, in order (label → standardized column)
+WSP_STEPS = {
+    'Team formation': 'team formation',
+    'System analysis': 'system analysis',
+    'Hazard mapping & risk analysis': 'hazard mapping and risk analysis',
+    'Climate change in hazard mapping': 'does the hazard mapping include climate change component',
+    'Preventive measures': 'preventive measures',
+    'Repair / rehab / upgrade': 'repair/rehabilitation/upgrade',
+    'Monitoring': 'monitoring',
+    'Certification': 'certification',
+    'Supporting activities': 'wsp supporting activities',
+    'Consumer satisfaction': 'consumer satisfaction',
+    'Documentation / reverification': 'documentation/reverification of plan',
+}
+# Step counts as done for Yes/Y and for free-text answers that describe the work as done
+WSP_DONE_PATTERN = r'\b(?:yes|y|done|completed?|rehab\w*|repair\w*|upgraded?|new)\b'
+
+# Cost columns (standardized) by (basis, component); per-capita cost = total cost / total beneficiaries
+COST_SHARES = ['Govt', 'UNICEF', 'Community']
+COST_COLUMNS = {
+    ('Estimated', 'Govt'): 'estimated total cost (npr)- govt',
+    ('Estimated', 'UNICEF'): 'estimated total cost (npr)- unicef',
+    ('Estimated', 'Community'): 'estimated total cost (npr)- community',
+    ('Estimated', 'Total'): 'estimated total cost (npr)',
+    ('Estimated', 'Reported per capita'): 'average per capita estimate',
+    ('Actual', 'Govt'): 'actual total cost (npr)- govt',
+    ('Actual', 'UNICEF'): 'actual total cost (npr)- unicef',
+    ('Actual', 'Community'): 'actual total cost (npr)- community',
+    ('Actual', 'Total'): 'actual total cost (npr)',
+    ('Actual', 'Reported per capita'): 'average per capita actual',
+}
+# Robust outlier rule: modified z = 0.6745 · (x − median) / MAD, flagged when |z| exceeds this
+COST_OUTLIER_Z = 3.5
+
+# Humanitarian sitreps: append-only event store + inbox folder ingested by the background worker
+EVENT_STORE_PATH = os.path.join("events", "events.jsonl")
+EVENT_INBOX_DIR = os.path.join("events", "inbox")
+# Writers (sessions, worker, other server processes) hold an OS lock on <store>.lock
+# around the duplicate check + append
+# 3.3 page → event key stored with every record ("Emergency response" shows all events)
+HUMANITARIAN_EVENTS = {
+    'Flood 2024': 'flood-2024',
+    'Cholera outbreak 2025': 'cholera-2025',
+}
+EVENT_ROLLING_DAYS = 7
+
+# Office target table (per indicator / office / year / palika), hot-reloaded by mtime
+TARGETS_PATH = "targets.csv"
+
+# Reference gazetteer (province, district, palika) for fuzzy place-name reconciliation
+GAZETTEER_PATH = "gazetteer.csv"
+PLACE_MATCH_THRESHOLD = 0.8  # difflib ratio 이상이면 gazetteer 표기로 치환
+
+# Built-in fallback targets, used for every indicator when TARGETS_PATH is missing
+DEFAULT_OFFICE_TARGETS = {
     'nco':       {'name': 'NCO',       'target': 13648},
     'janakpur':  {'name': 'Janakpur',  'target': 7987},
     'dhangadi':  {'name': 'Dhangadi',  'target': 6432},
@@ -50,6 +174,8 @@ main_menu = st.sidebar.selectbox(
         "Bhairahawa",
         "Surkhet",
         "End Year Progress against Annual target",
+        "📊 Program Analytics",
+        "🛠️ Data Management",
     ]
 )
 
@@ -110,6 +236,18 @@ elif main_menu == "Surkhet":
         ["Progress against Annual target"]  # ✅ same for Surkhet
     )
 
+elif main_menu == "📊 Program Analytics":
+    page = st.sidebar.radio(
+        "Select Indicator:",
+        ["JMP Ladder Transitions", "WSP Step Funnel", "Cost Efficiency"]
+    )
+
+elif main_menu == "🛠️ Data Management":
+    page = st.sidebar.radio(
+        "Select Indicator:",
+        ["Data Quality Profile", "Version History & Diff", "Duplicate Schemes", "Place Names"]
+    )
+
 else:  # End Year Progress ...
     page = None  # no radio here; shows "coming soon" in main logic
 
@@ -146,6 +284,19 @@ else:
 # 컬럼 디버그 표시 여부
 show_columns = st.sidebar.checkbox("🔍 CSV 컬럼 확인(디버그)", value=False)
 
+# 다운로드 형식: Parquet은 pyarrow, Excel은 xlsxwriter/openpyxl이 설치된 경우에만
+export_format = st.sidebar.selectbox(
+    "📥 Download format:",
+    [f for f in EXPORT_FORMATS if any(importlib.util.find_spec(m) for m in EXPORT_FORMAT_MODULES.get(f, ('pandas',)))],
+    key="export_format",
+)
+
+# 자동 새로고침: 새 데이터 버전이 게시되면 페이지를 다시 그림 (변경 없으면 확인만)
+auto_refresh = st.sidebar.toggle("🔄 Auto-refresh", value=False, key="auto_refresh")
+refresh_seconds = st.sidebar.select_slider(
+    "확인 간격 (초):", AUTO_REFRESH_INTERVALS, value=AUTO_REFRESH_DEFAULT_SECONDS, key="auto_refresh_seconds"
+) if auto_refresh else None
+
 # ------------------------------------------------------------------------------
 # Nepal Field Office Coordinates
 # ------------------------------------------------------------------------------
@@ -216,130 +367,786 @@ def ensure_columns(df: pd.DataFrame, required: list):
 # ------------------------------------------------------------------------------
 # Data loader
 # ------------------------------------------------------------------------------
-@st.cache_data
-def load_data(path):
-    df = pd.read_csv(path, dtype=str)
+def dataset_version(path: str) -> str:
+    """파일 경로 + 수정시각 + 크기로 데이터셋 버전 키 생성 (파일이 바뀌면 캐시가 자동 무효화됨)"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+def _version_size(version: str) -> int:
+    return int(version.rsplit(':', 1)[1])
+
+def _read_csv_bytes(path: str, start: int = 0, end=None) -> io.BytesIO:
+    """파일의 [start, end) 바이트만 읽기. start > 0이면 헤더 줄을 앞에 붙여 tail만 파싱 가능하게 함"""
+    with open(path, 'rb') as f:
+        header = f.readline() if start > 0 else b''
+        f.seek(start)
+        data = f.read(-1 if end is None else max(end - start, 0))
+    return io.BytesIO(header + data)
+
+def load_data(path, start: int = 0, end=None):
+    """start/end(바이트)를 주면 해당 구간만 파싱 (버전 크기까지만 읽어 파일이 커져도 버전 일관성 유지)"""
+    return standardize_columns(pd.read_csv(_read_csv_bytes(path, start, end), dtype=str))
+
+# 표준 컬럼명 → CSV에서 허용하는 변형들 (standardize_columns / data quality 점검에서 공용)
+STANDARD_COLUMNS = {
+    # --- 3.1.2 ---
+    'community declared water safe?': [
+        'community declared water safe?', 'community declared water safe',
+        'is community declared water safe?', 'community declared watersafe?',
+        'wsc confirmed water safe?', 'community water safe?'
+    ],
+    'wsc reporting year': [
+        'wsc reporting year', 'water safe community reporting year',
+        'wsc (reporting year)', 'reporting year (wsc)', 'year (wsc)'
+    ],
+
+    # --- 3.1.3 (NEW) ---
+    'additional toilets built': [
+        'additional toilets built', 'no. of additional toilets built',
+        '# of additional toilets built', 'additional toilets constructed',
+        'new toilets built', 'toilets built (additional)'
+    ],
+    'sanitation beneficiaries reporting year': [
+        'sanitation beneficiaries reporting year',
+        'reporting year (sanitation beneficiaries)',
+        'toilet beneficiaries reporting year',
+        'sanitation reporting year',
+        # 일반화된 연도 표기(폴백 지원)
+        'reporting year', 'year', 'year of reporting', 'fiscal year', 'fy'
+    ],
+
+    # --- 공통/3.1.1 ---
+    'office': ['office', 'field office', 'fo'],
+    'palika': ['palika', 'municipality', 'rural municipality'],
+    'district': ['district'],
+    'province2': ['province2', 'province', 'province name', 'province-2', 'province_no'],
+    'total beneficiary population # (current)': [
+        'total beneficiary population # (current)',
+        'total beneficiary population (current)',
+        'total beneficiary population',
+        'beneficiary_total_current',
+        'total beneficiaries'
+    ],
+    'progress': ['progress', 'status'],
+    'water quality test carried out within last one year shows safe water?': [
+        'water quality test carried out within last one year shows safe water?',
+        'water quality test safe within last one year?',
+        'safe water last year?', 'wqt last one year safe?',
+        'water quality test (last one year) safe?'
+    ],
+    'water supply beneficiaries reporting year': [
+        'water supply beneficiaries reporting year',
+        'reporting year (water supply beneficiaries)',
+        'beneficiaries reporting year', 'wsb reporting year',
+        # 일반화된 연도 표기
+        'reporting year', 'year', 'fiscal year', 'fy'
+    ],
+
+    # --- 3.1.4 / HCF (시설 수) ---
+    '# of schools benefitted': ['# of schools benefitted', 'no. of schools benefitted', 'schools benefitted'],
+    "# of hcf's benefitted": [
+        "# of hcf's benefitted", '# of hcfs benefitted', 'no. of hcfs benefitted',
+        'health care facilities benefitted', 'hcfs benefitted'
+    ],
+
+    # --- 성별/장애 분리 (data quality 점검 + 지표 세부 집계) ---
+    'beneficiary population male # (current)': [
+        'beneficiary population male # (current)', 'beneficiary population male (current)',
+        'male beneficiary population', 'male beneficiaries'
+    ],
+    'beneficiary population female # (current)': [
+        'beneficiary population female # (current)', 'beneficiary population female (current)',
+        'female beneficiary population', 'female beneficiaries'
+    ],
+    'beneficiary population person with disability # (current)': [
+        'beneficiary population person with disability # (current)',
+        'beneficiary population pwd # (current)', 'persons with disability', 'pwd beneficiaries'
+    ],
+
+    # --- 비용 (cost analytics) ---
+    'estimated total cost (npr)- govt': ['estimated total cost (npr)- govt', 'estimated total cost (npr) - govt'],
+    'estimated total cost (npr)- unicef': ['estimated total cost (npr)- unicef', 'estimated total cost (npr) - unicef'],
+    'estimated total cost (npr)- community': ['estimated total cost (npr)- community', 'estimated total cost (npr) - community'],
+    'estimated total cost (npr)': ['estimated total cost (npr)', 'estimated total cost'],
+    'average per capita estimate': ['average per capita estimate', 'avegare per capita estimate'],
+    'actual total cost (npr)- govt': ['actual total cost (npr)- govt', 'actual total cost (npr)- govt2', 'actual total cost (npr) - govt'],
+    'actual total cost (npr)- unicef': ['actual total cost (npr)- unicef', 'actual total cost (npr) - unicef'],
+    'actual total cost (npr)- community': ['actual total cost (npr)- community', 'actual total cost (npr) - community'],
+    'actual total cost (npr)': ['actual total cost (npr)', 'actual total cost'],
+    'average per capita actual': ['average per capita actual', 'avegare per capita actual'],
+}
+
+def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """CSV 원본 컬럼명 → 표준 컬럼명 (원본 파일과 append 업로드 파일이 같은 규칙 사용)"""
     # 1) 1차 정리(소문자/공백)
     df.columns = [_normalize_col(c) for c in df.columns]
 
     # 2) 표준 컬럼명으로 강건하게 rename
-    df = robust_rename_columns(df, {
-        # --- 3.1.2 ---
-        'community declared water safe?': [
-            'community declared water safe?', 'community declared water safe',
-            'is community declared water safe?', 'community declared watersafe?',
-            'wsc confirmed water safe?', 'community water safe?'
-        ],
-        'wsc reporting year': [
-            'wsc reporting year', 'water safe community reporting year',
-            'wsc (reporting year)', 'reporting year (wsc)', 'year (wsc)'
-        ],
-
-        # --- 3.1.3 (NEW) ---
-        'additional toilets built': [
-            'additional toilets built', 'no. of additional toilets built',
-            '# of additional toilets built', 'additional toilets constructed',
-            'new toilets built', 'toilets built (additional)'
-        ],
-        'sanitation beneficiaries reporting year': [
-            'sanitation beneficiaries reporting year',
-            'reporting year (sanitation beneficiaries)',
-            'toilet beneficiaries reporting year',
-            'sanitation reporting year',
-            # 일반화된 연도 표기(폴백 지원)
-            'reporting year', 'year', 'year of reporting', 'fiscal year', 'fy'
-        ],
-
-        # --- 공통/3.1.1 ---
-        'office': ['office', 'field office', 'fo'],
-        'palika': ['palika', 'municipality', 'rural municipality'],
-        'district': ['district'],
-        'province2': ['province2', 'province', 'province name', 'province-2', 'province_no'],
-        'total beneficiary population # (current)': [
-            'total beneficiary population # (current)',
-            'total beneficiary population (current)',
-            'total beneficiary population',
-            'beneficiary_total_current',
-            'total beneficiaries'
-        ],
-        'progress': ['progress', 'status'],
-        'water quality test carried out within last one year shows safe water?': [
-            'water quality test carried out within last one year shows safe water?',
-            'water quality test safe within last one year?',
-            'safe water last year?', 'wqt last one year safe?',
-            'water quality test (last one year) safe?'
-        ],
-        'water supply beneficiaries reporting year': [
-            'water supply beneficiaries reporting year',
-            'reporting year (water supply beneficiaries)',
-            'beneficiaries reporting year', 'wsb reporting year',
-            # 일반화된 연도 표기
-            'reporting year', 'year', 'fiscal year', 'fy'
-        ],
-    })
+    return robust_rename_columns(df, STANDARD_COLUMNS)
+
+# ------------------------------------------------------------------------------
+# Normalized dataset (cleaned once per dataset version, shared by every page)
+# ------------------------------------------------------------------------------
+OFFICE_NAMES = {
+    'nco': 'NCO', 'janakpur': 'Janakpur', 'dhangadi': 'Dhangadi',
+    'bhairahawa': 'Bhairahawa', 'surkhet': 'Surkhet'
+}
+
+def _clean_lower(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.strip().str.lower()
+
+def _to_number(s: pd.Series) -> pd.Series:
+    """'1,234' / 'NPR 500' 같은 문자열에서 숫자만 추출 (파싱 불가 → 0)"""
+    s = s.astype(str).str.replace(r'[^\d.]', '', regex=True).replace('', '0')
+    return pd.to_numeric(s, errors='coerce').fillna(0)
+
+def _to_year(s: pd.Series) -> pd.Series:
+    """괄호 유무 모두 허용 (2025 또는 (2025) 모두 인식)"""
+    return pd.to_numeric(s.astype(str).str.extract(r'(\d{4})')[0], errors='coerce')
+
+def _is_yes(s: pd.Series) -> pd.Series:
+    return _clean_lower(s).str.contains(r'\b(?:yes|y)\b', na=False)
+
+def _jmp_key(label: str) -> str:
+    return re.sub(r'[^a-z+]', '', str(label).casefold())
+
+def _jmp_level(s: pd.Series) -> pd.Series:
+    """JMP ladder 표기('BASIC +', 'Baisc' 등) → JMP_LADDER 순서의 categorical (매칭 실패 → 'Other')"""
+    keys = {_jmp_key(level): level for level in JMP_LADDER}
+    raw = s.astype(str).str.replace('\xa0', ' ').str.strip()
+    raw = raw.where(~raw.str.casefold().isin(['', 'nan', 'none']))
+    mapping = {}
+    for value in raw.dropna().unique():
+        key = _jmp_key(value)
+        if not key:
+            continue
+        close = difflib.get_close_matches(key, list(keys), n=1, cutoff=0.8)
+        mapping[value] = keys.get(key) or (keys[close[0]] if close else 'Other')
+    return pd.Categorical(raw.map(mapping), categories=JMP_LADDER + ['Other'], ordered=True)
+
+def canonical_offices(office: pd.Series) -> pd.Series:
+    """office 표기 → OFFICE_NAMES 표기 (매칭 실패 → 'Unknown')"""
+    pattern = rf"\b({'|'.join(map(re.escape, OFFICE_NAMES))})\b"
+    return _clean_lower(office).str.extract(pattern)[0].map(OFFICE_NAMES).fillna('Unknown')
+
+def normalize_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    공통 정리(office 매핑, 연도/숫자 파싱, Yes/No 플래그).
+    원본 표준 컬럼은 그대로 두고 '_' 접두사 파생 컬럼을 추가한다.
+    """
+    cols = df.columns
+
+    if 'office' in cols:
+        df['_office'] = canonical_offices(df['office'])
+    if 'progress' in cols:
+        df['_completed'] = _clean_lower(df['progress']).str.contains(r'\bcompleted\b', na=False)
+    if 'water quality test carried out within last one year shows safe water?' in cols:
+        df['_wq_safe'] = _is_yes(df['water quality test carried out within last one year shows safe water?'])
+    if 'community declared water safe?' in cols:
+        df['_wsc_safe'] = _is_yes(df['community declared water safe?'])
+
+    if 'water supply beneficiaries reporting year' in cols:
+        df['_ws_year'] = _to_year(df['water supply beneficiaries reporting year'])
+    if 'wsc reporting year' in cols:
+        df['_wsc_year'] = _to_year(df['wsc reporting year'])
+    # 3.1.3 year fallback: 컬럼이 없으면 기본 보고 연도로 간주 (페이지에서 경고 표시)
+    df.attrs['san_year_fallback'] = 'sanitation beneficiaries reporting year' not in cols
+    if df.attrs['san_year_fallback']:
+        df['_san_year'] = float(DEFAULT_REPORTING_YEAR)
+    else:
+        df['_san_year'] = _to_year(df['sanitation beneficiaries reporting year'])
+
+    # 표기가 제각각인 district/palika → gazetteer 표기 (고유 이름당 한 번만 매칭)
+    if 'district' in cols:
+        df['_district'] = canonical_districts(df['district'])
+    if 'palika' in cols:
+        df['_palika'] = canonical_palikas(df['palika'], df.get('_district'))
+
+    if 'jmp service ladder - start' in cols:
+        df['_jmp_start'] = _jmp_level(df['jmp service ladder - start'])
+    if 'jmp service ladder - finish' in cols:
+        df['_jmp_finish'] = _jmp_level(df['jmp service ladder - finish'])
+
+    if 'total beneficiary population # (current)' in cols:
+        df['_total'] = _to_number(df['total beneficiary population # (current)'])
+    if 'additional toilets built' in cols:
+        df['_toilets'] = _to_number(df['additional toilets built'])
+    if '# of schools benefitted' in cols:
+        df['_schools'] = _to_number(df['# of schools benefitted'])
+    if "# of hcf's benefitted" in cols:
+        df['_hcfs'] = _to_number(df["# of hcf's benefitted"])
+    for source_col, derived in DISAGG_COLUMNS.values():
+        if source_col in cols:
+            df[derived] = _to_number(df[source_col])
+
     return df
 
+@st.cache_resource(max_entries=4, show_spinner=False)
+def prepare_dataset(path: str, version: str) -> pd.DataFrame:
+    """
+    load_data + normalize_dataset를 버전당 한 번만 수행.
+    append로 생긴 버전이면 이전 버전 결과 + 새 tail 행만 정규화해 이어붙인다 (전체 재파싱 없음).
+    반환된 DataFrame은 모든 세션이 공유하므로 읽기 전용으로 취급할 것.
+    """
+    lineage = dataset_lineage(version)
+    if lineage:
+        base = prepare_dataset(path, lineage['parent'])
+        ds = pd.concat([base, prepare_tail(path, version)], ignore_index=True)
+        ds.attrs = dict(base.attrs)
+        return ds
+    return normalize_dataset(load_data(path, end=_version_size(version)))
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def prepare_tail(path: str, version: str) -> pd.DataFrame:
+    """append 버전에서 새로 추가된 행만 정규화"""
+    lineage = dataset_lineage(version)
+    return normalize_dataset(load_data(path, start=lineage['offset'], end=_version_size(version)))
+
+# ------------------------------------------------------------------------------
+# Targets: external table, reloaded when the file's mtime changes
+# (data caches are keyed by the dataset version only, so they are not invalidated)
+# ------------------------------------------------------------------------------
+def targets_version(path: str = TARGETS_PATH) -> int:
+    """targets 파일 mtime(ns). 파일이 없으면 -1 (내장 기본값 사용)"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_targets(path: str, mtime_ns: int) -> dict:
+    """
+    targets.csv → {'version': str, 'table': Series}
+    table index = (indicator, office, year, palika). year=-1 / palika='' 는 '모든 연도' / 'office 단위'.
+    """
+    if mtime_ns < 0:
+        rows = [
+            {'indicator': code, 'office': info['name'], 'year': -1, 'palika': '', 'target': info['target']}
+            for code in ('3.1.1', '3.1.2', '3.1.3') for info in DEFAULT_OFFICE_TARGETS.values()
+        ]
+        t = pd.DataFrame(rows)
+        version = "built-in defaults"
+    else:
+        version = "unversioned"
+        with open(path, encoding='utf-8-sig') as f:
+            for line in f:
+                if not line.startswith('#'):
+                    break
+                m = re.match(r'#\s*version:\s*(.+)', line.strip())
+                if m:
+                    version = m.group(1).strip()
+        t = pd.read_csv(path, dtype=str, comment='#', encoding='utf-8-sig')
+        t.columns = [_normalize_col(c) for c in t.columns]
+        ensure_columns(t, ['indicator', 'office', 'target'])
+        for c in ('year', 'palika'):
+            if c not in t.columns:
+                t[c] = None
+        t['indicator'] = t['indicator'].astype(str).str.strip()
+        office_key = _clean_lower(t['office'])
+        t['office'] = office_key.map(OFFICE_NAMES).fillna(t['office'].astype(str).str.strip())
+        t['year'] = _to_year(t['year']).fillna(-1).astype(int)
+        t['palika'] = t['palika'].fillna('').astype(str).str.strip().str.casefold()
+        t['target'] = _to_number(t['target'])
+
+    table = t.groupby(['indicator', 'office', 'year', 'palika'])['target'].sum().sort_index()
+    return {'version': version, 'table': table}
+
+def current_targets() -> dict:
+    return load_targets(TARGETS_PATH, targets_version())
+
+def _targets_for(code: str, year: int, palika_level: bool) -> pd.Series:
+    """연도 지정 target이 있으면 우선, 없으면 year=-1(모든 연도) target 사용"""
+    table = current_targets()['table']
+    if code not in table.index.get_level_values('indicator'):
+        return pd.Series(dtype=float)
+    sub = table.xs(code, level='indicator')
+    is_palika = sub.index.get_level_values('palika') != ''
+    sub = sub[is_palika] if palika_level else sub[~is_palika].droplevel('palika')
+    years = sub.index.get_level_values('year')
+    exact = sub[years == year].droplevel('year')
+    generic = sub[years == -1].droplevel('year')
+    return exact.combine_first(generic)
+
+def office_targets(code: str, year: int) -> pd.Series:
+    """Office → target (OFFICE_NAMES 순서)"""
+    targets = _targets_for(code, year, palika_level=False)
+    order = [o for o in OFFICE_NAMES.values() if o in targets.index]
+    return targets.reindex(order + [o for o in targets.index if o not in order])
+
+def palika_targets(code: str, year: int) -> pd.Series:
+    """(Office, palika casefold) → target"""
+    return _targets_for(code, year, palika_level=True)
+
+def source_columns(ds: pd.DataFrame) -> list:
+    """디버그 표시용: 파생('_') 컬럼을 제외한 표준 컬럼 목록"""
+    return [c for c in ds.columns if not c.startswith('_')]
+
+# ------------------------------------------------------------------------------
+# Gazetteer: fuzzy palika/district reconciliation
+# Trigram index narrows candidates, difflib ratio picks the match; results are
+# memoized per unique raw name, so cost is O(unique names), not O(rows × gazetteer).
+# ------------------------------------------------------------------------------
+PLACE_SUFFIXES = r'(?:ruralmunicipality|submetropolitancity|metropolitancity|municipality|gaunpalika|nagarpalika|mun|rm)$'
+
+def gazetteer_version(path: str = GAZETTEER_PATH) -> int:
+    """gazetteer 파일 mtime(ns). 파일이 없으면 -1 (정리만 하고 매칭 생략)"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+def _place_key(name: str, palika: bool = False) -> str:
+    """비교용 키: 소문자 + 문자/숫자만. palika는 'Rural Municipality', 'Mun' 등 접미사 제거"""
+    key = re.sub(r'[\W_]+', '', str(name).casefold())
+    if palika:
+        key = re.sub(PLACE_SUFFIXES, '', key) or key
+    return key
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _ngram_index(labels: pd.Series, districts: pd.Series, palika: bool) -> dict:
+    keys = [_place_key(label, palika) for label in labels]
+    grams = {}
+    for i, key in enumerate(keys):
+        for gram in _trigrams(key):
+            grams.setdefault(gram, []).append(i)
+    return {
+        'labels': list(labels), 'keys': keys, 'district': np.array(list(districts), dtype=object),
+        'grams': {gram: np.array(ids) for gram, ids in grams.items()},
+    }
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_gazetteer(path: str, mtime_ns: int):
+    """gazetteer.csv → district/palika trigram 인덱스 + raw 이름별 매칭 메모 (파일이 없으면 None)"""
+    if mtime_ns < 0:
+        return None
+    g = pd.read_csv(path, dtype=str, comment='#', encoding='utf-8-sig').fillna('')
+    g.columns = [_normalize_col(c) for c in g.columns]
+    ensure_columns(g, ['district', 'palika'])
+    for c in g.columns:
+        g[c] = g[c].str.strip()
+    districts = g[g['district'] != ''].drop_duplicates('district')
+    palikas = g[g['palika'] != ''].drop_duplicates(['district', 'palika'])
+    return {
+        'districts': _ngram_index(districts['district'], districts['district'], palika=False),
+        'palikas': _ngram_index(palikas['palika'], palikas['district'], palika=True),
+        'memo': {},
+    }
+
+def _best_match(index: dict, key: str, district=None) -> tuple:
+    """공유 trigram 수 상위 후보 중 difflib ratio 최고값 → (label, score). 기준 미달이면 label=None"""
+    hits = [index['grams'][g] for g in _trigrams(key) if g in index['grams']]
+    if not hits:
+        return None, 0.0
+    counts = np.bincount(np.concatenate(hits), minlength=len(index['keys']))
+    if district is not None:
+        counts = counts * (index['district'] == district)
+    best, score = None, 0.0
+    for i in np.argsort(-counts, kind='stable')[:5]:
+        if counts[i] == 0:
+            break
+        ratio = difflib.SequenceMatcher(None, key, index['keys'][i]).ratio()
+        if ratio > score:
+            best, score = i, ratio
+    if best is None or score < PLACE_MATCH_THRESHOLD:
+        return None, score
+    return index['labels'][best], score
+
+def match_place(kind: str, raw: str, district=None) -> tuple:
+    """
+    raw 이름 하나의 gazetteer 매칭 (memo). palika는 같은 district 안에서 먼저 찾고 실패하면 전체에서 찾음.
+    반환: (canonical label 또는 None, score)
+    """
+    gaz = load_gazetteer(GAZETTEER_PATH, gazetteer_version())
+    if gaz is None:
+        return None, 0.0
+    memo_key = (kind, district, raw)
+    if memo_key not in gaz['memo']:
+        if kind == 'district':
+            result = _best_match(gaz['districts'], _place_key(raw))
+        else:
+            key = _place_key(raw, palika=True)
+            result = _best_match(gaz['palikas'], key, district) if district else (None, 0.0)
+            if result[0] is None:
+                result = _best_match(gaz['palikas'], key)
+        gaz['memo'][memo_key] = result
+    return gaz['memo'][memo_key]
+
+def _clean_place(s: pd.Series) -> pd.Series:
+    s = s.astype(str).str.replace('\xa0', ' ').str.strip().str.replace(r'\s+', ' ', regex=True)
+    return s.where(~s.str.casefold().isin(['', 'nan', 'none']))
+
+def canonical_districts(district: pd.Series) -> pd.Series:
+    raw = _clean_place(district)
+    mapping = {name: match_place('district', name)[0] or name for name in raw.dropna().unique()}
+    return raw.map(mapping)
+
+def canonical_palikas(palika: pd.Series, district: pd.Series = None) -> pd.Series:
+    """(canonical district, raw palika) 고유 쌍마다 한 번 매칭 후 행 전체에 map"""
+    raw = _clean_place(palika)
+    context = district.fillna('') if district is not None else pd.Series('', index=raw.index)
+    pairs = pd.DataFrame({'district': context, 'palika': raw}).dropna().drop_duplicates()
+    mapping = {
+        (d, p): match_place('palika', p, d or None)[0] or p
+        for d, p in zip(pairs['district'], pairs['palika'])
+    }
+    return pd.Series(list(zip(context, raw)), index=raw.index).map(mapping).where(raw.notna())
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def place_reconciliation(_ds: pd.DataFrame, version: str, gazetteer_key: int) -> pd.DataFrame:
+    """고유 raw district/palika 이름별 매칭 결과 (행 수, canonical, score, 상태)"""
+    frames = []
+    for level, col in (('District', 'district'), ('Palika', 'palika')):
+        if col not in _ds.columns:
+            continue
+        raw = _clean_place(_ds[col])
+        context = _ds['_district'].fillna('') if level == 'Palika' and '_district' in _ds.columns else ''
+        counts = pd.DataFrame({'District': context, 'Raw': raw}).groupby(['District', 'Raw']).size()
+        rows = []
+        for (d, name), n in counts.items():
+            label, score = match_place(level.lower(), name, (d or None) if level == 'Palika' else None)
+            rows.append({'Level': level, 'District': d if level == 'Palika' else '', 'Raw': name,
+                         'Canonical': label or name, 'Score': round(score, 2), 'Rows': n,
+                         'Status': 'Unmatched' if label is None else ('Exact' if label == name else 'Reconciled')})
+        frames.append(pd.DataFrame(rows))
+    if not frames:
+        return pd.DataFrame(columns=['Level', 'District', 'Raw', 'Canonical', 'Score', 'Rows', 'Status'])
+    return pd.concat(frames, ignore_index=True)
+
+# ------------------------------------------------------------------------------
+# Filter builder: cached (column, value) → row index, combined per selection
+# ------------------------------------------------------------------------------
+FILTER_FIELDS = {
+    'Office': '_office',
+    'Province': 'province2',
+    'District': '_district',
+    'Palika': '_palika',
+    'Rural/Urban': 'rural/ urban',
+    'Funding source': 'unicef funding source',
+    'New vs Rehab': 'system new or rehabilated',
+    'Status': 'status',
+    'JMP ladder - start': 'jmp service ladder - start',
+    'JMP ladder - finish': 'jmp service ladder - finish',
+    'Water supply reporting year': '_ws_year',
+    'WSC reporting year': '_wsc_year',
+}
+
+FLAG_FILTER_FIELDS = {
+    'Scheme functioning?': 'is the scheme functioning?',
+    'WSP implemented?': 'is wsp implemented?',
+    'Solar powered?': 'is the wsc solar powered?',
+    'Palikawide WQ monitoring?': 'palikawide water quality monitoring mechanism established?',
+    'Water at HH premises?': 'water available at hh premises?',
+    'Within 30 mins?': 'within 30 mins?',
+    'O & M fund available?': 'provision of o & m fund available?',
+    'Flood/landslide past year?': 'has there been a flood or landslide during the past year?',
+}
+
+def _filter_values(s: pd.Series) -> pd.Series:
+    """필터 값 정규화: 공백/대소문자만 다른 값은 하나로 합치고 처음 나온 표기를 라벨로 사용"""
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype('Int64').astype(str).where(s.notna())
+    s = s.astype(str).str.replace('\xa0', ' ').str.strip().str.replace(r'\s+', ' ', regex=True)
+    key = s.str.casefold()
+    s = s.where(~key.isin(['', 'nan', 'none']))
+    key = key.where(s.notna())
+    labels = s.groupby(key).first()
+    return key.map(labels)
+
+def _filter_index_rows(ds: pd.DataFrame) -> dict:
+    fields = {}
+    for label, col in {**FILTER_FIELDS, **FLAG_FILTER_FIELDS}.items():
+        if col not in ds.columns:
+            continue
+        values = _filter_values(ds[col]).reset_index(drop=True)
+        rows = values.groupby(values).indices
+        if rows:
+            fields[label] = rows
+    return fields
+
+def _merge_filter_index(base: dict, tail_fields: dict, offset: int, n: int) -> dict:
+    """append된 행의 위치 배열을 offset만큼 밀어 기존 인덱스에 합침 (대소문자만 다른 값은 기존 라벨로)"""
+    fields = {label: {'options': list(f['options']), 'rows': dict(f['rows'])} for label, f in base['fields'].items()}
+    for label, rows in tail_fields.items():
+        field = fields.setdefault(label, {'options': [], 'rows': {}})
+        known = {v.casefold(): v for v in field['rows']}
+        for value, pos in rows.items():
+            value = known.get(value.casefold(), value)
+            prev = field['rows'].get(value)
+            field['rows'][value] = pos + offset if prev is None else np.concatenate([prev, pos + offset])
+        field['options'] = sorted(field['rows'])
+    return {'n': n, 'fields': fields}
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_filter_index(_ds: pd.DataFrame, version: str) -> dict:
+    """
+    데이터셋 버전당 한 번: 필터 필드별 {값: 행 위치 배열} 인덱스 생성.
+    (bool 마스크 대신 위치 배열을 저장해 필드당 메모리는 O(rows))
+    append 버전이면 이전 버전 인덱스에 tail 행만 추가.
+    """
+    lineage = dataset_lineage(version)
+    if lineage:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = build_filter_index(base_ds, lineage['parent'])
+        tail = prepare_tail(lineage['path'], version)
+        return _merge_filter_index(base, _filter_index_rows(tail), len(base_ds), len(_ds))
+    fields = {label: {'options': sorted(rows), 'rows': rows} for label, rows in _filter_index_rows(_ds).items()}
+    return {'n': len(_ds), 'fields': fields}
+
+def combine_filter_masks(index: dict, selections: dict):
+    """필드 내 선택값은 OR, 필드 간은 AND. 선택이 없으면 None (= 전체)"""
+    mask = None
+    for field, values in selections.items():
+        if not values or field not in index['fields']:
+            continue
+        rows = index['fields'][field]['rows']
+        m = np.zeros(index['n'], dtype=bool)
+        for v in values:
+            pos = rows.get(v)  # 데이터가 바뀌어 사라진 값은 건너뜀 (선택 목록에서도 정리됨)
+            if pos is not None:
+                m[pos] = True
+        mask = m if mask is None else (mask & m)
+    return mask
+
+def _filter_multiselect(field: dict, label: str) -> list:
+    key = f"filter_{label}"
+    saved = st.session_state.get(key)
+    if saved and any(v not in field['rows'] for v in saved):
+        # 새 데이터 버전에 없는 값은 선택에서 제거 (남겨두면 multiselect/마스크 조합이 실패)
+        st.session_state[key] = [v for v in saved if v in field['rows']]
+    return st.multiselect(label, field['options'], key=key)
+
+def render_filter_sidebar(index: dict) -> dict:
+    fields = index['fields']
+    selections = {}
+    with st.sidebar.expander("🔎 Filter Builder", expanded=False):
+        for label in FILTER_FIELDS:
+            if label in fields:
+                selections[label] = _filter_multiselect(fields[label], label)
+    with st.sidebar.expander("🚩 Flag Filters", expanded=False):
+        for label in FLAG_FILTER_FIELDS:
+            if label in fields:
+                selections[label] = _filter_multiselect(fields[label], label)
+    return selections
+
+@st.cache_data(show_spinner=False)
+def available_years(_ds: pd.DataFrame, version: str) -> list:
+    """데이터에 존재하는 보고 연도 (모든 지표 연도 컬럼의 합집합)"""
+    cols = [c for c in INDICATOR_YEAR_COLS.values() if c in _ds.columns]
+    if not cols:
+        return [DEFAULT_REPORTING_YEAR]
+    years = pd.concat([_ds[c] for c in cols]).dropna()
+    years = years[(years >= 2000) & (years <= 2100)].astype(int).unique()
+    return sorted(int(y) for y in years) or [DEFAULT_REPORTING_YEAR]
+
+def render_year_selector(years: list) -> int:
+    default = years.index(DEFAULT_REPORTING_YEAR) if DEFAULT_REPORTING_YEAR in years else len(years) - 1
+    return st.sidebar.selectbox("📅 Reporting Year:", years, index=default, key="reporting_year")
+
+def load_dashboard_data(path: str):
+    """
+    정규화 데이터셋 + 사이드바 연도/필터 → (ds, mask, view_key, year).
+    mask=None이면 필터 없음. view_key = (데이터셋 버전, 필터 선택)으로 파생 캐시의 키로 사용.
+    """
+    version = served_dataset_version(path)
+    if version is None:
+        # 최초 1회만 포그라운드에서 빌드, 이후 변경분은 백그라운드 워커가 준비
+        version = dataset_version(path)
+        with st.spinner("데이터 준비 중..."):
+            warm_dataset_caches(path, version)
+        publish_dataset_version(path, version)
+    elif version != dataset_version(path):
+        st.sidebar.caption("⏳ 새 데이터 버전을 백그라운드에서 준비 중입니다 (준비될 때까지 이전 버전 표시).")
+    ds = prepare_dataset(path, version)
+    year = render_year_selector(available_years(ds, version))
+    # Targets 파일 상태 (mtime 변경 시 자동 재로딩)
+    if targets_version() >= 0:
+        st.sidebar.caption(f"🎯 Targets: {TARGETS_PATH} (version {current_targets()['version']})")
+    else:
+        st.sidebar.caption(f"🎯 Targets: {TARGETS_PATH} 없음 → 내장 기본값 사용")
+    index = build_filter_index(ds, version)
+    selections = render_filter_sidebar(index)
+    mask = combine_filter_masks(index, selections)
+    render_scenario_sidebar()
+    render_append_sidebar(path)
+    if mask is not None:
+        active = ", ".join(f"{k}: {', '.join(v)}" for k, v in selections.items() if v)
+        st.info(f"🔎 필터 적용 중 ({int(mask.sum()):,} / {len(ds):,} rows) — {active}")
+    changed = [f"{c}×{scenario_multiplier(c):g}" for c in INDICATOR_NAMES if scenario_multiplier(c) != 1.0]
+    if changed:
+        st.info(f"🧪 What-if 시나리오 적용 중 — {', '.join(changed)}")
+    view_key = (version, tuple((k, tuple(v)) for k, v in selections.items() if v))
+    return ds, mask, view_key, year
+
+# ------------------------------------------------------------------------------
+# Shared aggregation helpers (masked groupby over the normalized dataset)
+# ------------------------------------------------------------------------------
+def _whole(sums, rounding: bool = True):
+    """
+    합계 → 정수. rounding=False면 소수점 이하를 버림 (기존 3.1.1/3.1.2 표).
+    먼저 소수 6자리로 정리해 합산 순서 차이(append 합산 vs 전체 합산)로 생긴 20.9999… 같은 값이 버려지지 않게 함.
+    """
+    sums = sums.round(6)
+    return (sums.round() if rounding else sums).astype(int)
+
+def _office_rows(totals: pd.DataFrame, code: str, year: int, rounding: bool = True) -> pd.DataFrame:
+    """
+    office 합계(Beneficiaries + Male/Female/PWD)에 target 테이블을 벡터 조인 (target이 없거나 0인 office는 제외).
+    지표에 target이 하나도 없으면 (예: 3.1.4/HCF) 모든 office를 Target 0으로 표시.
+    rounding=False면 기존 3.1.1/3.1.2 표처럼 소수점 이하를 버림. Achievement는 정수화 전 합계로 계산.
+    """
+    targets = office_targets(code, year)
+    has_targets = not targets.empty
+    if not has_targets:
+        targets = pd.Series(0.0, index=list(dict.fromkeys(OFFICE_NAMES.values())))
+    sums = totals.reindex(targets.index, fill_value=0)
+    out = pd.DataFrame({'Office': targets.index})
+    for col in INDICATOR_VALUE_COLS:
+        out[col] = _whole(sums[col], rounding).to_numpy()
+    out['Target'] = targets.round().astype(int).to_numpy()
+    out['Achievement'] = (sums['Beneficiaries'].to_numpy() / out['Target'].where(out['Target'] > 0) * 100).fillna(0.0)
+    if has_targets:
+        out = out[out['Target'] > 0].reset_index(drop=True)
+    return out
+
+def _join_palika_targets(palika_summary: pd.DataFrame, code: str, year: int) -> pd.DataFrame:
+    """palika 단위 target이 설정된 경우에만 Target/Achievement 컬럼 추가"""
+    targets = palika_targets(code, year)
+    if targets.empty:
+        return palika_summary
+    key = pd.MultiIndex.from_arrays([
+        palika_summary['Office'],
+        palika_summary['Palika'].astype(str).str.strip().str.casefold()
+    ])
+    palika_summary['Target'] = targets.reindex(key).to_numpy()
+    palika_summary['Achievement'] = palika_summary['Beneficiaries'] / palika_summary['Target'].where(palika_summary['Target'] > 0) * 100
+    return palika_summary
+
+def _palika_summary(ds: pd.DataFrame, cond: pd.Series, values: pd.DataFrame, rounding: bool = True) -> pd.DataFrame:
+    """palika별 합계. rounding=False면 기존 3.1.1/3.1.2 표처럼 소수점 이하를 버림 (astype(int))"""
+    return _palika_rows(_palika_sums(ds, cond, values), rounding)
+
+def _palika_sums(ds: pd.DataFrame, cond: pd.Series, values: pd.DataFrame) -> pd.DataFrame:
+    """(office, palika, district, province)별 원시 합계 (정수화 전 float)"""
+    df_filtered = ds.loc[cond]
+    return (
+        values[cond]
+        .groupby([df_filtered['_office'], df_filtered['_palika'], df_filtered['_district'], df_filtered['province2']])
+        .sum()
+    )
+
+def _palika_rows(sums: pd.DataFrame, rounding: bool = True) -> pd.DataFrame:
+    """원시 합계 → palika 표 (정수화, Unknown office 제외, Beneficiaries 내림차순)"""
+    palika_summary = sums.reset_index()
+    palika_summary.columns = ['Office', 'Palika', 'District', 'Province'] + INDICATOR_VALUE_COLS
+    palika_summary[INDICATOR_VALUE_COLS] = _whole(palika_summary[INDICATOR_VALUE_COLS], rounding)
+    palika_summary = palika_summary[palika_summary['Office'] != 'Unknown']
+    palika_summary = palika_summary.sort_values('Beneficiaries', ascending=False)
+    return palika_summary
+
+def _with_mask(cond: pd.Series, mask) -> pd.Series:
+    return cond if mask is None else (cond & mask)
+
+INDICATOR_NAMES = {
+    '3.1.1': 'Safe water access',
+    '3.1.2': 'Water-safe communities',
+    '3.1.3': 'Basic sanitation gained',
+    '3.1.4': 'Schools with WASH',
+    'HCF': 'HCFs with WASH',
+}
+
+INDICATOR_YEAR_COLS = {
+    '3.1.1': '_ws_year',
+    '3.1.2': '_wsc_year',
+    '3.1.3': '_san_year',
+    '3.1.4': '_ws_year',
+    'HCF': '_ws_year',
+}
+
+# 시설 수 지표: 집계 컬럼은 'Beneficiaries'를 그대로 쓰고 화면에서만 단위를 바꿔 표시 (세부값 없음)
+INDICATOR_UNITS = {
+    '3.1.4': 'Schools',
+    'HCF': 'HCFs',
+}
+FACILITY_COLUMNS = {
+    '3.1.4': '_schools',
+    'HCF': '_hcfs',
+}
+
+def indicator_condition(ds: pd.DataFrame, code: str, year=DEFAULT_REPORTING_YEAR) -> pd.Series:
+    """지표별 행 필터 조건 (processor/hierarchy 공용). year=None이면 연도 조건 없음"""
+    if code == '3.1.1':
+        cond = ds['_completed'] & ds['_wq_safe']
+    elif code == '3.1.2':
+        cond = ds['_wsc_safe']
+    elif code in ('3.1.3', '3.1.4', 'HCF'):
+        cond = ds['_completed']
+    else:
+        raise KeyError(f"알 수 없는 지표: {code}")
+    if year is not None:
+        cond = cond & (ds[INDICATOR_YEAR_COLS[code]] == year)
+    return cond
+
+def indicator_value(ds: pd.DataFrame, code: str) -> pd.Series:
+    """지표별 행 단위 수혜자 수 (3.1.3은 화장실 수 × SAN_BENEFICIARY_PER_TOILET, 3.1.4/HCF는 시설 수)"""
+    if code == '3.1.3':
+        return ds['_toilets'] * SAN_BENEFICIARY_PER_TOILET
+    if code in FACILITY_COLUMNS:
+        return ds[FACILITY_COLUMNS[code]]
+    return ds['_total']
+
+# 지표 집계 결과의 값 컬럼: 합계 + 세부값을 같은 groupby에서 함께 합산
+INDICATOR_VALUE_COLS = ['Beneficiaries'] + list(DISAGG_COLUMNS)
+# office/palika 합계의 소수점 이하를 버리는 지표 (기존 표와 동일). 나머지는 반올림
+TRUNCATED_INDICATORS = ('3.1.1', '3.1.2')
+
+def indicator_frame(ds: pd.DataFrame, code: str) -> pd.DataFrame:
+    """
+    지표 값 + Male/Female/PWD 세부값 (행 단위). 세부 컬럼이 없거나 시설 수 지표면 0.
+    3.1.3은 화장실 수 기반 추정치이므로 scheme의 총 인구 대비 세부 비율(최대 1)로 배분한다 (행 단위 반올림 → append 합산과 일치).
+    """
+    value = indicator_value(ds, code)
+    parts = {
+        label: ds[derived] if derived in ds.columns and code not in FACILITY_COLUMNS else pd.Series(0.0, index=ds.index)
+        for label, (_, derived) in DISAGG_COLUMNS.items()
+    }
+    if code == '3.1.3':
+        total = ds['_total'] if '_total' in ds.columns else pd.Series(0.0, index=ds.index)
+        total = total.where(total > 0)
+        parts = {label: (part / total).clip(upper=1).mul(value).fillna(0.0).round() for label, part in parts.items()}
+    return pd.DataFrame({'Beneficiaries': value, **parts}, index=ds.index)
+
+def indicator_values(ds: pd.DataFrame, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
+    """모든 지표의 행 단위 기여값 (조건 불충족 행은 0). 필요한 컬럼이 없는 지표는 생략"""
+    vals = {}
+    for code in INDICATOR_NAMES:
+        try:
+            vals[code] = indicator_value(ds, code).where(indicator_condition(ds, code, year), 0.0)
+        except KeyError:
+            continue
+    return pd.DataFrame(vals, index=ds.index)
+
 # ------------------------------------------------------------------------------
 # Processing: 3.1.2 (Water-safe communities)  ✅ 이전과 동일한 로직/흐름
 # ------------------------------------------------------------------------------
-@st.cache_data
-def process_office_data_312(df: pd.DataFrame) -> pd.DataFrame:
+def process_office_data_312(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     office_col = 'office'
     wsc_col = 'community declared water safe?'
     wsc_year_col = 'wsc reporting year'
     total_col = 'total beneficiary population # (current)'
 
-    ensure_columns(df, [office_col, wsc_col, wsc_year_col, total_col])
+    ensure_columns(ds, [office_col, wsc_col, wsc_year_col, total_col])
 
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[wsc_col] = df[wsc_col].astype(str).str.strip().str.lower()
-    # Year: 괄호 유무 모두 허용 (2025 또는 (2025) 모두 인식)
-    df[wsc_year_col] = df[wsc_year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[wsc_year_col] = pd.to_numeric(df[wsc_year_col], errors='coerce')
+    # Filters (Yes/Y & reporting year)
+    cond = _with_mask(indicator_condition(ds, '3.1.2', year), mask)
 
-    df[total_col] = (
-        df[total_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
-    )
-    df[total_col] = pd.to_numeric(df[total_col], errors='coerce').fillna(0)
-
-    # Filters (Yes/Y & 2025)
-    cond_water_safe = df[wsc_col].str.contains(r'\b(yes|y)\b', na=False)
-    cond_2025 = df[wsc_year_col] == 2025
-
-    office_mapping = {
-        'nco': {'name': 'NCO', 'target': 13648},
-        'janakpur': {'name': 'Janakpur', 'target': 7987},
-        'dhangadi': {'name': 'Dhangadi', 'target': 6432},
-        'bhairahawa': {'name': 'Bhairahawa', 'target': 9659},
-        'surkhet': {'name': 'Surkhet', 'target': 13822}
-    }
 
-    offices = list(office_mapping.keys())
-    rows = []
-
-    for key in offices:
-        cond_office = df[office_col].str.contains(rf'\b{re.escape(key)}\b', na=False)
-        df_filtered = df[cond_office & cond_water_safe & cond_2025]
-        total = df_filtered[total_col].sum()
-        info = office_mapping[key]
-        target = info['target']
-        ach = (total / target * 100) if target > 0 else 0.0
-        rows.append({
-            'Office': info['name'],
-            'Beneficiaries': int(total),
-            'Target': target,
-            'Achievement': ach
-        })
-
-    out = pd.DataFrame(rows)
-    out = out[out['Target'] > 0].copy()
-    return out
+    totals = indicator_frame(ds, '3.1.2')[cond].groupby(ds.loc[cond, '_office']).sum()
+    return _office_rows(totals, '3.1.2', year, rounding=False)
 
-@st.cache_data
-def process_palika_data_312(df: pd.DataFrame) -> pd.DataFrame:
+def process_palika_data_312(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     office_col = 'office'
     wsc_col = 'community declared water safe?'
     wsc_year_col = 'wsc reporting year'
@@ -348,116 +1155,33 @@ def process_palika_data_312(df: pd.DataFrame) -> pd.DataFrame:
     district_col = 'district'
     province_col = 'province2'
 
-    ensure_columns(df, [office_col, wsc_col, wsc_year_col, total_col, palika_col, district_col, province_col])
-
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[wsc_col] = df[wsc_col].astype(str).str.strip().str.lower()
-    df[wsc_year_col] = df[wsc_year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[wsc_year_col] = pd.to_numeric(df[wsc_year_col], errors='coerce')
-
-    df[total_col] = (
-        df[total_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
-    )
-    df[total_col] = pd.to_numeric(df[total_col], errors='coerce').fillna(0)
+    ensure_columns(ds, [office_col, wsc_col, wsc_year_col, total_col, palika_col, district_col, province_col])
 
     # Filters
-    cond_water_safe = df[wsc_col].str.contains(r'\b(yes|y)\b', na=False)
-    cond_2025 = df[wsc_year_col] == 2025
-
-    df_filtered = df[cond_water_safe & cond_2025].copy()
-
-    office_mapping = {
-        'nco': 'NCO', 'janakpur': 'Janakpur', 'dhangadi': 'Dhangadi',
-        'bhairahawa': 'Bhairahawa', 'surkhet': 'Surkhet'
-    }
-
-    def map_office(s: str) -> str:
-        lower = str(s).lower()
-        for k, v in office_mapping.items():
-            if re.search(rf'\b{re.escape(k)}\b', lower):
-                return v
-        return 'Unknown'
+    cond = _with_mask(indicator_condition(ds, '3.1.2', year), mask)
 
-    df_filtered['Office'] = df_filtered[office_col].apply(map_office)
-
-    palika_summary = (
-        df_filtered
-        .groupby(['Office', palika_col, district_col, province_col])[total_col]
-        .sum()
-        .reset_index()
-    )
-    palika_summary.columns = ['Office', 'Palika', 'District', 'Province', 'Beneficiaries']
-    palika_summary['Beneficiaries'] = palika_summary['Beneficiaries'].astype(int)
-    palika_summary = palika_summary[palika_summary['Office'] != 'Unknown']
-    palika_summary = palika_summary.sort_values('Beneficiaries', ascending=False)
-    return palika_summary
+    return _join_palika_targets(_palika_summary(ds, cond, indicator_frame(ds, '3.1.2'), rounding=False), '3.1.2', year)
 
 # ------------------------------------------------------------------------------
 # Processing: 3.1.1 (Safe water access)
 # ------------------------------------------------------------------------------
-@st.cache_data
-def process_office_data(df: pd.DataFrame) -> pd.DataFrame:
+def process_office_data(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     office_col = 'office'
     progress_col= 'progress'
     wq_col = 'water quality test carried out within last one year shows safe water?'
     year_col = 'water supply beneficiaries reporting year'
     total_col = 'total beneficiary population # (current)'
 
-    ensure_columns(df, [office_col, progress_col, wq_col, year_col, total_col])
-
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[progress_col] = df[progress_col].astype(str).str.strip().str.lower()
-    df[wq_col] = df[wq_col].astype(str).str.strip().str.lower()
-    df[year_col] = df[year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[year_col] = pd.to_numeric(df[year_col], errors='coerce')
-
-    df[total_col] = (
-        df[total_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
-    )
-    df[total_col] = pd.to_numeric(df[total_col], errors='coerce').fillna(0)
+    ensure_columns(ds, [office_col, progress_col, wq_col, year_col, total_col])
 
     # Filters
-    cond_completed = df[progress_col].str.contains(r'\bcompleted\b', na=False)
-    cond_safe = df[wq_col].str.contains(r'\b(yes|y)\b', na=False)
-    cond_2025 = df[year_col] == 2025
-
-    office_mapping = {
-        'nco': {'name': 'NCO', 'target': 13648},
-        'janakpur': {'name': 'Janakpur', 'target': 7987},
-        'dhangadi': {'name': 'Dhangadi', 'target': 6432},
-        'bhairahawa':{'name': 'Bhairahawa', 'target': 9659},
-        'surkhet': {'name': 'Surkhet', 'target': 13822}
-    }
+    cond = _with_mask(indicator_condition(ds, '3.1.1', year), mask)
 
-    offices = list(office_mapping.keys())
-    rows = []
-
-    for key in offices:
-        cond_office = df[office_col].str.contains(rf'\b{re.escape(key)}\b', na=False)
-        df_filtered = df[cond_office & cond_completed & cond_safe & cond_2025]
-        total = df_filtered[total_col].sum()
-        info = office_mapping[key]
-        target = info['target']
-        ach = (total / target * 100) if target > 0 else 0.0
-        rows.append({
-            'Office': info['name'],
-            'Beneficiaries': int(total),
-            'Target': target,
-            'Achievement': ach
-        })
-
-    out = pd.DataFrame(rows)
-    out = out[out['Target'] > 0].copy()
-    return out
 
-@st.cache_data
-def process_palika_data(df: pd.DataFrame) -> pd.DataFrame:
+    totals = indicator_frame(ds, '3.1.1')[cond].groupby(ds.loc[cond, '_office']).sum()
+    return _office_rows(totals, '3.1.1', year, rounding=False)
+
+def process_palika_data(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     office_col = 'office'
     progress_col= 'progress'
     wq_col = 'water quality test carried out within last one year shows safe water?'
@@ -467,118 +1191,40 @@ def process_palika_data(df: pd.DataFrame) -> pd.DataFrame:
     district_col= 'district'
     province_col= 'province2'
 
-    ensure_columns(df, [office_col, progress_col, wq_col, year_col, total_col, palika_col, district_col, province_col])
-
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[progress_col] = df[progress_col].astype(str).str.strip().str.lower()
-    df[wq_col] = df[wq_col].astype(str).str.strip().str.lower()
-    df[year_col] = df[year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[year_col] = pd.to_numeric(df[year_col], errors='coerce')
-
-    df[total_col] = (
-        df[total_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
-    )
-    df[total_col] = pd.to_numeric(df[total_col], errors='coerce').fillna(0)
-
-    cond_completed = df[progress_col].str.contains(r'\bcompleted\b', na=False)
-    cond_safe = df[wq_col].str.contains(r'\b(yes|y)\b', na=False)
-    cond_2025 = df[year_col] == 2025
-
-    df_filtered = df[cond_completed & cond_safe & cond_2025].copy()
+    ensure_columns(ds, [office_col, progress_col, wq_col, year_col, total_col, palika_col, district_col, province_col])
 
-    office_mapping = {
-        'nco': 'NCO', 'janakpur': 'Janakpur', 'dhangadi': 'Dhangadi',
-        'bhairahawa': 'Bhairahawa', 'surkhet': 'Surkhet'
-    }
-
-    def map_office(s: str) -> str:
-        lower = str(s).lower()
-        for k, v in office_mapping.items():
-            if re.search(rf'\b{re.escape(k)}\b', lower):
-                return v
-        return 'Unknown'
+    cond = _with_mask(indicator_condition(ds, '3.1.1', year), mask)
 
-    df_filtered['Office'] = df_filtered[office_col].apply(map_office)
-
-    palika_summary = (
-        df_filtered
-        .groupby(['Office', palika_col, district_col, province_col])[total_col]
-        .sum()
-        .reset_index()
-    )
-    palika_summary.columns = ['Office', 'Palika', 'District', 'Province', 'Beneficiaries']
-    palika_summary['Beneficiaries'] = palika_summary['Beneficiaries'].astype(int)
-    palika_summary = palika_summary[palika_summary['Office'] != 'Unknown']
-    palika_summary = palika_summary.sort_values('Beneficiaries', ascending=False)
-    return palika_summary
+    return _join_palika_targets(_palika_summary(ds, cond, indicator_frame(ds, '3.1.1'), rounding=False), '3.1.1', year)
 
 # ------------------------------------------------------------------------------
 # Processing: 3.1.3 (Basic sanitation gained) NEW
 # ------------------------------------------------------------------------------
-@st.cache_data
-def process_office_data_313(df: pd.DataFrame) -> pd.DataFrame:
+def _warn_san_year_fallback(ds: pd.DataFrame):
+    if ds.attrs.get('san_year_fallback'):
+        st.warning(f"ℹ️ 'sanitation beneficiaries reporting year' 컬럼이 없어 {DEFAULT_REPORTING_YEAR}로 폴백 적용했습니다.")
+
+def process_office_data_313(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     """
     Beneficiaries = additional_toilets_built * SAN_BENEFICIARY_PER_TOILET
-    Filters mirror 3.1.1/3.1.2 (completed + year 2025).
+    Filters mirror 3.1.1/3.1.2 (completed + reporting year).
     """
     office_col = 'office'
     progress_col = 'progress'
     toilets_col = 'additional toilets built'
-    year_col = 'sanitation beneficiaries reporting year'
-
-    # ── year fallback ──
-    if year_col not in df.columns:
-        st.warning("ℹ️ 'sanitation beneficiaries reporting year' 컬럼이 없어 2025로 폴백 적용했습니다.")
-        df[year_col] = '2025'
-
-    ensure_columns(df, [office_col, progress_col, toilets_col, year_col])
-
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[progress_col] = df[progress_col].astype(str).str.strip().str.lower()
-    df[year_col] = df[year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[year_col] = pd.to_numeric(df[year_col], errors='coerce')
 
-    df[toilets_col] = (
-        df[toilets_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
-    )
-    df[toilets_col] = pd.to_numeric(df[toilets_col], errors='coerce').fillna(0)
+    ensure_columns(ds, [office_col, progress_col, toilets_col])
 
-    # Derived beneficiaries
-    df['_beneficiaries_313'] = (df[toilets_col] * SAN_BENEFICIARY_PER_TOILET).astype(float)
+    # Derived beneficiaries (+ Male/Female/PWD apportioned by scheme share)
+    beneficiaries = indicator_frame(ds, '3.1.3')
 
     # Filters
-    cond_completed = df[progress_col].str.contains(r'\bcompleted\b', na=False)
-    cond_2025 = df[year_col] == 2025
-
-    offices = list(SANITATION_TARGETS.keys())
-    rows = []
-
-    for key in offices:
-        cond_office = df[office_col].str.contains(rf'\b{re.escape(key)}\b', na=False)
-        df_filtered = df[cond_office & cond_completed & cond_2025]
-        total = df_filtered['_beneficiaries_313'].sum()
-        info = SANITATION_TARGETS[key]
-        target = info['target']
-        ach = (total / target * 100) if target > 0 else 0.0
-        rows.append({
-            'Office': info['name'],
-            'Beneficiaries': int(round(total)),
-            'Target': target,
-            'Achievement': ach
-        })
-
-    out = pd.DataFrame(rows)
-    out = out[out['Target'] > 0].copy()
-    return out
+    cond = _with_mask(indicator_condition(ds, '3.1.3', year), mask)
 
-@st.cache_data
-def process_palika_data_313(df: pd.DataFrame) -> pd.DataFrame:
+    totals = beneficiaries[cond].groupby(ds.loc[cond, '_office']).sum()
+    return _office_rows(totals, '3.1.3', year)
+
+def process_palika_data_313(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
     """
     Palika-level beneficiaries for 3.1.3:
     beneficiaries = additional_toilets_built * SAN_BENEFICIARY_PER_TOILET
@@ -586,70 +1232,1700 @@ def process_palika_data_313(df: pd.DataFrame) -> pd.DataFrame:
     office_col = 'office'
     progress_col = 'progress'
     toilets_col = 'additional toilets built'
-    year_col = 'sanitation beneficiaries reporting year'
     palika_col = 'palika'
     district_col = 'district'
     province_col = 'province2'
 
-    # year fallback
-    if year_col not in df.columns:
-        st.warning("ℹ️ 'sanitation beneficiaries reporting year' 컬럼이 없어 2025로 폴백 적용했습니다.")
-        df[year_col] = '2025'
+    ensure_columns(ds, [office_col, progress_col, toilets_col, palika_col, district_col, province_col])
+
+    # Derived beneficiaries (+ Male/Female/PWD apportioned by scheme share)
+    beneficiaries = indicator_frame(ds, '3.1.3')
 
-    ensure_columns(df, [office_col, progress_col, toilets_col, year_col, palika_col, district_col, province_col])
+    # Filters
+    cond = _with_mask(indicator_condition(ds, '3.1.3', year), mask)
+
+    return _join_palika_targets(_palika_summary(ds, cond, beneficiaries), '3.1.3', year)
+
+# ------------------------------------------------------------------------------
+# Processing: 3.1.4 (Schools with WASH) / HCFs with WASH
+# 'Beneficiaries' = number of schools / HCFs benefitted by completed schemes
+# (reported against the water-supply reporting year)
+# ------------------------------------------------------------------------------
+def process_office_data_314(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
+    ensure_columns(ds, ['office', 'progress', 'water supply beneficiaries reporting year', '# of schools benefitted'])
+    cond = _with_mask(indicator_condition(ds, '3.1.4', year), mask)
+    totals = indicator_frame(ds, '3.1.4')[cond].groupby(ds.loc[cond, '_office']).sum()
+    return _office_rows(totals, '3.1.4', year)
+
+def process_palika_data_314(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
+    ensure_columns(ds, ['office', 'progress', 'water supply beneficiaries reporting year', '# of schools benefitted',
+                        'palika', 'district', 'province2'])
+    cond = _with_mask(indicator_condition(ds, '3.1.4', year), mask)
+    return _join_palika_targets(_palika_summary(ds, cond, indicator_frame(ds, '3.1.4')), '3.1.4', year)
+
+def process_office_data_hcf(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
+    ensure_columns(ds, ['office', 'progress', 'water supply beneficiaries reporting year', "# of hcf's benefitted"])
+    cond = _with_mask(indicator_condition(ds, 'HCF', year), mask)
+    totals = indicator_frame(ds, 'HCF')[cond].groupby(ds.loc[cond, '_office']).sum()
+    return _office_rows(totals, 'HCF', year)
+
+def process_palika_data_hcf(ds: pd.DataFrame, mask=None, year: int = DEFAULT_REPORTING_YEAR) -> pd.DataFrame:
+    ensure_columns(ds, ['office', 'progress', 'water supply beneficiaries reporting year', "# of hcf's benefitted",
+                        'palika', 'district', 'province2'])
+    cond = _with_mask(indicator_condition(ds, 'HCF', year), mask)
+    return _join_palika_targets(_palika_summary(ds, cond, indicator_frame(ds, 'HCF')), 'HCF', year)
+
+# ------------------------------------------------------------------------------
+# Per-year cached indicator tables + multi-year trend
+# ------------------------------------------------------------------------------
+INDICATOR_PROCESSORS = {
+    '3.1.1': (process_office_data, process_palika_data),
+    '3.1.2': (process_office_data_312, process_palika_data_312),
+    '3.1.3': (process_office_data_313, process_palika_data_313),
+    '3.1.4': (process_office_data_314, process_palika_data_314),
+    'HCF': (process_office_data_hcf, process_palika_data_hcf),
+}
 
-    # Cleaning
-    df[office_col] = df[office_col].astype(str).str.strip().str.lower()
-    df[progress_col] = df[progress_col].astype(str).str.strip().str.lower()
-    df[year_col] = df[year_col].astype(str).str.extract(r'(\d{4})')[0]
-    df[year_col] = pd.to_numeric(df[year_col], errors='coerce')
+@st.cache_data(max_entries=64, show_spinner=False)
+def indicator_tables(_ds: pd.DataFrame, _mask, view_key: tuple, code: str, year: int, targets_key: int = 0):
+    """
+    (데이터셋 버전, 필터, 지표, 연도, targets mtime)별 (office, palika) 결과 캐시 → 연도 전환 시 재계산 없음.
+    targets 파일이 바뀌면 이 작은 결과만 다시 계산되고 데이터셋/인덱스 캐시는 유지된다.
+    """
+    office_fn, palika_fn = INDICATOR_PROCESSORS[code]
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        # append 버전: 원시 합계(이전 버전 + tail)를 합친 뒤 한 번만 정수화 → 전체 재빌드와 같은 값
+        office_sums, palika_sums = indicator_sums(_ds, view_key, code, year)
+        rounding = code not in TRUNCATED_INDICATORS
+        return (
+            _office_rows(office_sums, code, year, rounding),
+            _join_palika_targets(_palika_rows(palika_sums, rounding), code, year),
+        )
+    return office_fn(_ds, _mask, year), palika_fn(_ds, _mask, year)
 
-    df[toilets_col] = (
-        df[toilets_col].astype(str)
-        .str.replace(r'[^\d.]', '', regex=True)
-        .replace('', '0')
+@st.cache_data(max_entries=64, show_spinner=False)
+def indicator_sums(_ds: pd.DataFrame, view_key: tuple, code: str, year: int) -> tuple:
+    """
+    (필터 없는) 데이터셋 버전의 office / palika 원시 합계 (정수화 전 float, targets와 무관).
+    append 버전이면 이전 버전 합계 + tail 행 합계.
+    """
+    lineage = dataset_lineage(view_key[0])
+    if lineage:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = indicator_sums(base_ds, (lineage['parent'], ()), code, year)
+        tail = _indicator_sums(prepare_tail(lineage['path'], view_key[0]), code, year)
+        return tuple(b.add(t, fill_value=0) for b, t in zip(base, tail))
+    return _indicator_sums(_ds, code, year)
+
+def _indicator_sums(ds: pd.DataFrame, code: str, year: int) -> tuple:
+    cond = indicator_condition(ds, code, year)
+    values = indicator_frame(ds, code)
+    return values[cond].groupby(ds.loc[cond, '_office']).sum(), _palika_sums(ds, cond, values)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def build_year_trend(_ds: pd.DataFrame, _mask, view_key: tuple, code: str) -> pd.DataFrame:
+    """모든 연도를 한 번의 groupby로 집계: index=Office, columns=Year, values=Beneficiaries (합산 후 반올림)"""
+    return _whole(year_trend_sums(_ds, _mask, view_key, code))
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def year_trend_sums(_ds: pd.DataFrame, _mask, view_key: tuple, code: str) -> pd.DataFrame:
+    """반올림 전 (Office × Year) 합계. append 버전이면 이전 버전 합계 + tail 합계"""
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = year_trend_sums(base_ds, None, (lineage['parent'], ()), code)
+        tail = _year_trend(prepare_tail(lineage['path'], view_key[0]), None, code)
+        trend = base.add(tail, fill_value=0).fillna(0)
+        trend.index.name, trend.columns.name = 'Office', 'Year'
+        return trend
+    return _year_trend(_ds, _mask, code)
+
+def _year_trend(ds: pd.DataFrame, mask, code: str) -> pd.DataFrame:
+    year_col = ds[INDICATOR_YEAR_COLS[code]]
+    cond = _with_mask(indicator_condition(ds, code, year=None), mask)
+    cond = cond & (ds['_office'] != 'Unknown') & year_col.notna()
+    trend = (
+        indicator_value(ds, code)[cond]
+        .groupby([ds.loc[cond, '_office'], year_col[cond].astype(int)])
+        .sum()
+        .unstack(fill_value=0)
     )
-    df[toilets_col] = pd.to_numeric(df[toilets_col], errors='coerce').fillna(0)
+    trend.index.name = 'Office'
+    trend.columns.name = 'Year'
+    return trend
 
-    # Derived beneficiaries
-    df['_beneficiaries_313'] = (df[toilets_col] * SAN_BENEFICIARY_PER_TOILET).astype(float)
+# ------------------------------------------------------------------------------
+# End-year progress: every indicator × office × year in one groupby
+# ------------------------------------------------------------------------------
+# 아직 데이터 소스가 없는 지표 (메뉴 페이지 준비 중) → 행렬에는 빈 행으로 표시
+PENDING_INDICATORS = {
+    '3.1.5': 'Humanitarian water support',
+    '3.1.6': 'Humanitarian sanitation & hygiene',
+}
+PROGRESS_INDICATORS = list(INDICATOR_NAMES) + list(PENDING_INDICATORS)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_progress_cube(_ds: pd.DataFrame, _mask, view_key: tuple) -> pd.Series:
+    """모든 지표의 (Indicator, Office, Year) 합계. 지표별 값/연도 컬럼을 세로로 쌓아 groupby 한 번으로 집계"""
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = build_progress_cube(base_ds, None, (lineage['parent'], ()))
+        tail = _progress_cube(prepare_tail(lineage['path'], view_key[0]), None)
+        return base.add(tail, fill_value=0)
+    return _progress_cube(_ds, _mask)
+
+def _progress_cube(ds: pd.DataFrame, mask) -> pd.Series:
+    parts = []
+    for code in INDICATOR_NAMES:
+        try:
+            year_col = ds[INDICATOR_YEAR_COLS[code]]
+            cond = _with_mask(indicator_condition(ds, code, year=None), mask)
+            cond = (cond & (ds['_office'] != 'Unknown') & year_col.notna()).to_numpy()
+            value = indicator_value(ds, code).to_numpy()[cond]
+        except KeyError:
+            continue  # 지표에 필요한 컬럼이 없음 → 빈 행
+        parts.append(pd.DataFrame({
+            'Indicator': code, 'Office': ds['_office'].to_numpy()[cond],
+            'Year': year_col.to_numpy()[cond].astype(int), 'Value': value,
+        }))
+    if not parts:
+        return pd.Series(dtype=float, index=pd.MultiIndex.from_arrays([[], [], []], names=['Indicator', 'Office', 'Year']))
+    return pd.concat(parts, ignore_index=True).groupby(['Indicator', 'Office', 'Year'])['Value'].sum()
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def progress_matrix(_ds: pd.DataFrame, _mask, view_key: tuple, year: int, targets_key: int = 0) -> pd.DataFrame:
+    """
+    (Indicator, Office) 행마다 Achieved / Target / Achievement(%) / History(해당 연도까지의 연도별 값).
+    office 합계는 각 지표 페이지의 Office Summary와 같은 값 (연도 합계 후 반올림).
+    """
+    cube = build_progress_cube(_ds, _mask, view_key)
+    offices = list(dict.fromkeys(OFFICE_NAMES.values()))
+    index = pd.MultiIndex.from_product([PROGRESS_INDICATORS, offices], names=['Indicator', 'Office'])
+    history = cube.unstack('Year', fill_value=0).reindex(index)
+    history = history.loc[:, history.columns <= year]
+    available = index.get_level_values('Indicator').isin(list(INDICATOR_NAMES))
+    history.loc[available] = history.loc[available].fillna(0)
+    achieved = history[year] if year in history.columns else pd.Series(np.where(available, 0.0, np.nan), index=index)
+
+    targets = pd.concat({code: office_targets(code, year) for code in PROGRESS_INDICATORS})
+    targets = targets.reindex(index) if not targets.empty else pd.Series(np.nan, index=index)
+    out = pd.DataFrame({'Achieved': achieved.round(), 'Target': targets.round()}, index=index)
+    out['Achievement'] = out['Achieved'] / out['Target'].where(out['Target'] > 0) * 100
+    out['History'] = history.round().fillna(0).astype(int).to_numpy().tolist()
+    out['History'] = out['History'].where(available, None)
+    return out.reset_index()
 
-    # Filters
-    cond_completed = df[progress_col].str.contains(r'\bcompleted\b', na=False)
-    cond_2025 = df[year_col] == 2025
+# ------------------------------------------------------------------------------
+# Office partitions: row positions per field office, built once per dataset version
+# Office pages work on their own slice (ds.take) and never scan the full dataset.
+# ------------------------------------------------------------------------------
+FIELD_OFFICES = ['Janakpur', 'Dhangadi', 'Bhairahawa', 'Surkhet']
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_office_partitions(_ds: pd.DataFrame, version: str) -> dict:
+    """office → 행 위치 배열. append 버전이면 이전 버전 분할에 tail 행 위치만 offset 만큼 밀어 추가"""
+    lineage = dataset_lineage(version)
+    if lineage:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        parts = dict(build_office_partitions(base_ds, lineage['parent']))
+        for office, pos in _office_positions(prepare_tail(lineage['path'], version)).items():
+            prev = parts.get(office)
+            parts[office] = pos + len(base_ds) if prev is None else np.concatenate([prev, pos + len(base_ds)])
+        return parts
+    return _office_positions(_ds)
+
+def _office_positions(ds: pd.DataFrame) -> dict:
+    if '_office' not in ds.columns:
+        return {}
+    return ds.groupby('_office').indices
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def office_slice(_ds: pd.DataFrame, version: str, office: str) -> pd.DataFrame:
+    """office 행만 담은 공유 DataFrame (읽기 전용)"""
+    pos = build_office_partitions(_ds, version).get(office, np.array([], dtype=np.intp))
+    part = _ds.take(pos)
+    part.attrs = dict(_ds.attrs)
+    return part
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def office_indicator_tables(_part: pd.DataFrame, _mask, view_key: tuple, office: str, code: str, year: int, targets_key: int = 0):
+    """office slice 기준 (office 합계 1행, palika 표). _mask는 slice 행에 맞춘 마스크"""
+    _, palika_fn = INDICATOR_PROCESSORS[code]
+    palika_df = palika_fn(_part, _mask, year)
+    cond = _with_mask(indicator_condition(_part, code, year), _mask)
+    totals = indicator_frame(_part, code)[cond].sum().round().astype(int)
+    row = pd.DataFrame([{'Office': office, **totals.to_dict()}])
+    target = office_targets(code, year).get(office)
+    row['Target'] = int(round(target)) if pd.notna(target) else 0
+    row['Achievement'] = (row['Beneficiaries'] / row['Target'].where(row['Target'] > 0) * 100).fillna(0.0)
+    return row, palika_df
+
+# ------------------------------------------------------------------------------
+# Palika table services: office partitions + top-N partial selection
+# Both work on the cached palika tables and are keyed by the key that built the
+# table, so an office switch or a new N never regroups or re-sorts the table.
+# ------------------------------------------------------------------------------
+@st.cache_data(max_entries=64, show_spinner=False)
+def palika_partitions(_palika_df: pd.DataFrame, table_key: tuple) -> dict:
+    """
+    palika 표당 한 번: office별 행 위치 배열 + office별 고유 palika 수 + 전체 고유 palika 수.
+    table_key = 표를 만든 캐시 키 (view_key, 지표, 연도, targets mtime).
+    """
+    offices = _palika_df['Office'].to_numpy()
+    rows = pd.Series(offices).groupby(offices).indices if len(offices) else {}
+    return {
+        'rows': rows,
+        'palikas': _palika_df.groupby('Office')['Palika'].nunique().to_dict(),
+        'total': _palika_df['Palika'].nunique(),
+    }
+
+def office_palika_positions(palika_df: pd.DataFrame, table_key: tuple, office: str):
+    """office의 행 위치 배열 ("All Offices"면 None = 전체)"""
+    if office == "All Offices":
+        return None
+    return palika_partitions(palika_df, table_key)['rows'].get(office, np.array([], dtype=np.intp))
+
+def office_palika_rows(palika_df: pd.DataFrame, table_key: tuple, office: str) -> pd.DataFrame:
+    """office 필터: bool 마스크 대신 미리 나눠 둔 위치 배열로 바로 꺼냄"""
+    pos = office_palika_positions(palika_df, table_key, office)
+    return palika_df if pos is None else palika_df.iloc[pos]
+
+TOP_N_CHOICES = [5, 10, 15, 20, 30]
+TOP_N_METRICS = INDICATOR_VALUE_COLS + ['Achievement']
+
+def top_n_positions(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    값이 큰 순 상위 n개의 위치 = 내림차순 stable sort의 head(n) (동점은 원래 순서, NaN은 제외).
+    partition(O(rows))으로 n번째 값만 구해 그보다 큰 위치 + 같은 값은 앞쪽 위치부터 채운 뒤, 그 n개만 정렬.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = np.flatnonzero(~np.isnan(values))
+    if n < len(valid):
+        v = values[valid]
+        kth = -np.partition(-v, n - 1)[n - 1]
+        above = valid[v > kth]
+        valid = np.concatenate([above, valid[v == kth][:n - len(above)]])
+    return valid[np.lexsort((valid, -values[valid]))]
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def top_palikas(_palika_df: pd.DataFrame, table_key: tuple, office: str, metric: str, n: int) -> np.ndarray:
+    """
+    palika 표에서 (office, 기준 컬럼, N)별 상위 행의 index label.
+    table_key = 표를 만든 캐시 키 (view_key, 지표, 연도, targets mtime). What-if 배수는 순서를 바꾸지 않으므로 키에서 제외.
+    """
+    if office == "All Offices":
+        rows = np.arange(len(_palika_df))
+    else:
+        rows = palika_partitions(_palika_df, table_key)['rows'].get(office, np.array([], dtype=np.intp))
+    pos = rows[top_n_positions(_palika_df[metric].to_numpy(dtype=float)[rows], n)]
+    return _palika_df.index.to_numpy()[pos]
+
+def render_top_n_controls(metrics: list, key: str) -> tuple:
+    c1, c2 = st.columns(2)
+    with c1:
+        n = st.select_slider("Top N", TOP_N_CHOICES, value=10, key=f"{key}_top_n")
+    with c2:
+        metric = st.selectbox("Rank by", metrics, key=f"{key}_top_metric")
+    return n, metric
+
+# ------------------------------------------------------------------------------
+# Paged tables: search, sort and paging run on the server; only the current page
+# is sent to the browser. Sort orders are argsorts cached per (table key, column,
+# direction) on the whole table, so filters and page changes never re-sort.
+# ------------------------------------------------------------------------------
+TABLE_ORIGINAL_ORDER = "(original order)"
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def table_sort_index(_df: pd.DataFrame, table_key: tuple, column: str, ascending: bool) -> np.ndarray:
+    """column 기준 행 위치 순서 (stable, NaN은 끝). 공유 객체이므로 읽기 전용"""
+    values = _df[column].reset_index(drop=True)
+    try:
+        order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    except TypeError:  # 숫자/문자 혼합 object 컬럼
+        order = values.astype(str).where(values.notna()).sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    order.flags.writeable = False
+    return order
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def table_search_text(_df: pd.DataFrame, table_key: tuple) -> pd.Series:
+    """행마다 문자열 컬럼을 ' | '로 이은 소문자 텍스트 (검색 = 이 컬럼 하나에 대한 substring 비교)"""
+    text = pd.Series('', index=pd.RangeIndex(len(_df)), dtype='str')
+    for c in _df.columns:
+        if pd.api.types.is_numeric_dtype(_df[c]) or pd.api.types.is_bool_dtype(_df[c]):
+            continue
+        text = text + ' | ' + _df[c].reset_index(drop=True).fillna('').astype(str).str.lower()
+    return text
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def table_search_rows(_df: pd.DataFrame, table_key: tuple, query: str) -> np.ndarray:
+    return table_search_text(_df, table_key).str.contains(query, regex=False).to_numpy(dtype=bool)
+
+def render_paged_table(df: pd.DataFrame, table_key: tuple, key: str, rows=None, column_config: dict = None):
+    """
+    검색/정렬/페이지 표. table_key = df를 만든 캐시 키 (같은 key → 같은 df).
+    rows = 표시 대상 행 위치 (예: office partition), None이면 전체.
+    """
+    page_key = f"{key}_page"
+    reset_page = lambda: st.session_state.update({page_key: 1})
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    with c1:
+        query = st.text_input("🔍 Search", key=f"{key}_search", on_change=reset_page).strip().lower()
+    with c2:
+        sort_by = st.selectbox("Sort by", [TABLE_ORIGINAL_ORDER] + list(df.columns), key=f"{key}_sort", on_change=reset_page)
+    with c3:
+        ascending = st.checkbox("Ascending", key=f"{key}_asc", on_change=reset_page)
+    with c4:
+        size = st.selectbox("Rows / page", TABLE_PAGE_SIZES, index=TABLE_PAGE_SIZES.index(TABLE_DEFAULT_PAGE_SIZE),
+                            key=f"{key}_size", on_change=reset_page)
+
+    if sort_by == TABLE_ORIGINAL_ORDER:
+        order = np.arange(len(df)) if rows is None else np.asarray(rows)
+        keep = None
+    else:
+        order = table_sort_index(df, table_key, sort_by, ascending)
+        keep = None if rows is None else np.zeros(len(df), dtype=bool)
+        if keep is not None:
+            keep[rows] = True
+    if query:
+        match = table_search_rows(df, table_key, query)
+        keep = match if keep is None else keep & match
+    if keep is not None:
+        order = order[keep[order]]
+
+    pages = max(1, -(-len(order) // size))
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    start = (int(st.session_state.get(page_key, 1)) - 1) * size
+    st.dataframe(df.iloc[order[start:start + size]], use_container_width=True, hide_index=True, column_config=column_config)
+    c1, c2 = st.columns([1, 3])
+    with c1:
+        st.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    with c2:
+        st.caption(f"{min(start + 1, len(order)):,}–{min(start + size, len(order)):,} / {len(order):,} rows · {pages:,} pages")
+
+# ------------------------------------------------------------------------------
+# What-if scenario: linear multipliers applied to cached aggregates (no raw-row work)
+# ------------------------------------------------------------------------------
+def render_scenario_sidebar():
+    with st.sidebar.expander("🧪 What-if Scenario", expanded=False):
+        st.slider("3.1.3 people per additional toilet", 1.0, 10.0, float(SAN_BENEFICIARY_PER_TOILET), 0.5,
+                  key="scenario_per_toilet")
+        for code in ('3.1.1', '3.1.2'):
+            st.slider(f"{code} beneficiary multiplier", 0.5, 2.0, 1.0, 0.05, key=f"scenario_mult_{code}")
+
+def people_per_toilet() -> float:
+    return st.session_state.get("scenario_per_toilet", float(SAN_BENEFICIARY_PER_TOILET))
+
+def scenario_multiplier(code: str) -> float:
+    """캐시된 결과에 곱할 배수. 3.1.3은 (슬라이더 값 / SAN_BENEFICIARY_PER_TOILET)"""
+    if code == '3.1.3':
+        return people_per_toilet() / SAN_BENEFICIARY_PER_TOILET
+    return st.session_state.get(f"scenario_mult_{code}", 1.0)
+
+def _rescale(df: pd.DataFrame, m: float, fill_achievement: bool) -> pd.DataFrame:
+    df = df.copy()
+    df[INDICATOR_VALUE_COLS] = (df[INDICATOR_VALUE_COLS] * m).round().astype(int)
+    if 'Target' in df.columns:
+        ach = df['Beneficiaries'] / df['Target'].where(df['Target'] > 0) * 100
+        df['Achievement'] = ach.fillna(0.0) if fill_achievement else ach
+    return df
+
+def apply_scenario(plot_df: pd.DataFrame, palika_df: pd.DataFrame, code: str):
+    """지표가 선형이므로 사전 집계된 office/palika 합계만 재스케일하고 달성률을 다시 계산"""
+    m = scenario_multiplier(code)
+    if m == 1.0:
+        return plot_df, palika_df
+    return _rescale(plot_df, m, fill_achievement=True), _rescale(palika_df, m, fill_achievement=False)
+
+def scale_indicator_columns(frame):
+    """드릴다운 결과(Series/DataFrame)의 지표 컬럼에 시나리오 배수 적용"""
+    frame = frame.copy()
+    keys = frame.index if isinstance(frame, pd.Series) else frame.columns
+    for code in INDICATOR_NAMES:
+        if code in keys:
+            frame[code] = frame[code] * scenario_multiplier(code)
+    return frame
+
+# ------------------------------------------------------------------------------
+# Disaggregation consistency: schemes whose Male/Female/PWD parts don't match the total
+# ------------------------------------------------------------------------------
+@st.cache_data(max_entries=16, show_spinner=False)
+def disaggregation_gaps(_ds: pd.DataFrame, _mask, view_key: tuple, code: str, year: int) -> pd.DataFrame:
+    """
+    지표에 기여하는 scheme 중 Male + Female ≠ Total 이거나 PWD > Total 인 행 (정규화된 숫자 기준).
+    세부 컬럼이 없는 데이터셋이면 빈 테이블.
+    """
+    derived = [d for _, d in DISAGG_COLUMNS.values()]
+    if not set(derived + ['_total']) <= set(_ds.columns):
+        return pd.DataFrame()
+    cond = _with_mask(indicator_condition(_ds, code, year), _mask)
+    male, female, pwd = (_ds[d] for d in derived)
+    gap = male + female - _ds['_total']
+    flagged = cond & ((gap.abs() > 0.5) | (pwd > _ds['_total']))
+    context = [c for c in ('office', 'palika', 'ward#', 'community name') if c in _ds.columns]
+    out = _ds.loc[flagged, context].copy()
+    out.insert(0, 'CSV line', out.index + 2)  # 헤더 = 1행
+    out['Total'] = _ds.loc[flagged, '_total'].round().astype(int)
+    for label, (_, d) in DISAGG_COLUMNS.items():
+        out[label] = _ds.loc[flagged, d].round().astype(int)
+    out['Male + Female − Total'] = gap[flagged].round().astype(int)
+    return out.reset_index(drop=True)
+
+# ------------------------------------------------------------------------------
+# Geographic hierarchy: province → district → palika → ward → community
+# ------------------------------------------------------------------------------
+HIERARCHY_LEVELS = {
+    'Province': 'province2',
+    'District': '_district',
+    'Palika': '_palika',
+    'Ward': 'ward#',
+    'Community': 'community name',
+}
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_geo_hierarchy(_ds: pd.DataFrame, _mask, view_key: tuple, year: int = DEFAULT_REPORTING_YEAR) -> dict:
+    """
+    (데이터셋 버전, 필터)당 한 번: 가장 하위 레벨(community)에서 한 번 groupby 후
+    상위 레벨은 그 결과를 롤업해 모든 지표의 소계를 계산.
+    children[depth][부모 경로 tuple] → 자식 소계 DataFrame (드릴다운 시 O(자식 수) 조회)
+    """
+    levels = [lvl for lvl, col in HIERARCHY_LEVELS.items() if col in _ds.columns]
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        # append 버전: 이전 버전의 community 단위 합계 + tail 합계 후 롤업만 다시 수행
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = build_geo_hierarchy(base_ds, None, (lineage['parent'], ()), year)
+        tail = _hierarchy_finest(prepare_tail(lineage['path'], view_key[0]), None, levels, year)
+        finest = _merge_hierarchy_finest(base['finest'], tail)
+    else:
+        finest = _hierarchy_finest(_ds, _mask, levels, year)
+    return _hierarchy_from_finest(finest, levels)
+
+def _hierarchy_finest(ds: pd.DataFrame, mask, levels: list, year: int) -> pd.DataFrame:
+    keep = _with_mask(ds['_office'] != 'Unknown', mask)
+    rows = ds.loc[keep]
+
+    frame = indicator_values(rows, year)
+    frame['Schemes'] = 1
+    for lvl in levels:
+        frame[lvl] = _filter_values(rows[HIERARCHY_LEVELS[lvl]]).fillna('(Unknown)')
+    return frame.groupby(levels, sort=True)[list(frame.columns.difference(levels))].sum()
+
+def _merge_hierarchy_finest(base: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """tail 라벨 중 대소문자만 다른 값은 기존 라벨로 맞춘 뒤 합산 (전체 재빌드와 같은 결과)"""
+    if tail.empty:
+        return base
+    keys = []
+    for depth, name in enumerate(tail.index.names):
+        known = {v.casefold(): v for v in base.index.get_level_values(depth).unique()}
+        keys.append(tail.index.get_level_values(depth).map(lambda v: known.get(v.casefold(), v)))
+    tail = tail.set_axis(pd.MultiIndex.from_arrays(keys, names=tail.index.names))
+    merged = pd.concat([base, tail])
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=True).sum()
+
+def _hierarchy_from_finest(finest: pd.DataFrame, levels: list) -> dict:
+    if not levels:
+        return {'levels': [], 'children': {}, 'total': pd.Series(dtype=float), 'finest': finest}
+    tables = {}
+    table = finest
+    for depth in range(len(levels), 0, -1):
+        if depth < len(levels):
+            table = table.groupby(level=list(range(depth))).sum()
+        tables[depth] = table
+
+    children = {0: {(): tables[1]}}
+    for depth in range(1, len(levels)):
+        children[depth] = {
+            parent if isinstance(parent, tuple) else (parent,): sub.droplevel(list(range(depth)))
+            for parent, sub in tables[depth + 1].groupby(level=list(range(depth)))
+        }
+    total = finest.sum()
+    return {'levels': levels, 'children': children, 'total': total, 'finest': finest}
+
+# ------------------------------------------------------------------------------
+# Program analytics: JMP service-ladder transitions
+# One grouped crosstab (office × palika × year × start × finish) per (version, filter);
+# the page slices/sums this cube, so no per-row work happens on interaction.
+# ------------------------------------------------------------------------------
+JMP_CUBE_LEVELS = ['_office', '_palika', '_ws_year', '_jmp_start', '_jmp_finish']
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_jmp_cube(_ds: pd.DataFrame, _mask, view_key: tuple) -> pd.DataFrame:
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = build_jmp_cube(base_ds, None, (lineage['parent'], ()))
+        tail = _jmp_cube(prepare_tail(lineage['path'], view_key[0]), None)
+        return base.add(tail, fill_value=0).astype(base.dtypes.to_dict())
+    return _jmp_cube(_ds, _mask)
+
+def _jmp_cube(ds: pd.DataFrame, mask) -> pd.DataFrame:
+    """행: (office, palika, 연도, start, finish) → Beneficiaries(_total 합) / Schemes(행 수)"""
+    if not {'_jmp_start', '_jmp_finish'} <= set(ds.columns):
+        return pd.DataFrame(columns=['Beneficiaries', 'Schemes'])
+    keep = _with_mask(ds['_jmp_start'].notna() & ds['_jmp_finish'].notna() & (ds['_office'] != 'Unknown'), mask)
+    rows = ds.loc[keep]
+    keys = [rows[c].fillna('') if c == '_palika' else rows[c] for c in JMP_CUBE_LEVELS]
+    return (
+        rows['_total'].groupby(keys, observed=True, dropna=False)
+        .agg(Beneficiaries='sum', Schemes='size')
+    )
+
+def jmp_transition_matrix(cube: pd.DataFrame, weight: str, office=None, palika=None, year=None) -> pd.DataFrame:
+    """큐브 부분합 → start × finish 행렬 (JMP_LADDER 순서, 데이터에 있는 단계만)"""
+    sub = cube
+    for level, value in (('_office', office), ('_palika', palika), ('_ws_year', year)):
+        if value is not None and not sub.empty:
+            sub = sub[sub.index.get_level_values(level) == value]
+    matrix = sub[weight].groupby(level=['_jmp_start', '_jmp_finish'], observed=True).sum().unstack(fill_value=0)
+    levels = [lvl for lvl in JMP_LADDER + ['Other'] if lvl in matrix.index or lvl in matrix.columns]
+    matrix = matrix.reindex(index=levels, columns=levels, fill_value=0).round().astype(int)
+    matrix.index.name, matrix.columns.name = 'Start', 'Finish'
+    return matrix
+
+# ------------------------------------------------------------------------------
+# Program analytics: Water Safety Plan step funnel
+# Step flags for all WSP columns come from one factorized matrix lookup (regex only on
+# unique answers), then one groupby by office × palika per (version, filter).
+# ------------------------------------------------------------------------------
+def wsp_step_matrix(ds: pd.DataFrame) -> tuple:
+    """(done, answered): rows × steps bool 행렬. 데이터에 있는 단계만 포함"""
+    steps = {label: col for label, col in WSP_STEPS.items() if col in ds.columns}
+    values = ds[list(steps.values())].to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    answers = pd.Series(uniques, dtype=object).astype(str).str.replace('\xa0', ' ').str.strip().str.lower()
+    done_u = answers.str.contains(WSP_DONE_PATTERN, regex=True).to_numpy()
+    answered_u = (answers != '').to_numpy()
+    shape = values.shape
+    done = np.where(codes >= 0, done_u[codes], False).reshape(shape)
+    answered = np.where(codes >= 0, answered_u[codes], False).reshape(shape)
+    return list(steps), done, answered
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_wsp_funnel(_ds: pd.DataFrame, _mask, view_key: tuple) -> pd.DataFrame:
+    """
+    (office, palika)별: Schemes/Beneficiaries(WSP 응답이 있는 scheme) +
+    단계별 done(순서 무관) / reached(앞 단계 모두 완료) scheme 수와 수혜 인구.
+    """
+    lineage = dataset_lineage(view_key[0])
+    if lineage and _mask is None and not view_key[1]:
+        base_ds = prepare_dataset(lineage['path'], lineage['parent'])
+        base = build_wsp_funnel(base_ds, None, (lineage['parent'], ()))
+        tail = _wsp_funnel(prepare_tail(lineage['path'], view_key[0]), None)
+        return base.add(tail, fill_value=0)
+    return _wsp_funnel(_ds, _mask)
+
+def _wsp_funnel(ds: pd.DataFrame, mask) -> pd.DataFrame:
+    steps, done, answered = wsp_step_matrix(ds)
+    keep = _with_mask(pd.Series(answered.any(axis=1), index=ds.index) & (ds['_office'] != 'Unknown'), mask).to_numpy()
+    done = done[keep]
+    reached = np.logical_and.accumulate(done, axis=1)
+    weight = ds['_total'].to_numpy()[keep][:, None]
+    frame = pd.DataFrame(
+        np.hstack([np.ones((len(done), 1)), weight, done, reached, done * weight, reached * weight]),
+        columns=pd.MultiIndex.from_tuples(
+            [('Schemes', ''), ('Beneficiaries', '')]
+            + [(kind, step) for kind in ('done', 'reached', 'done_ben', 'reached_ben') for step in steps]
+        ),
+    )
+    rows = ds.loc[keep]
+    return frame.groupby([rows['_office'].to_numpy(), rows['_palika'].fillna('').to_numpy()]).sum().rename_axis(['Office', 'Palika'])
+
+# ------------------------------------------------------------------------------
+# Program analytics: cost efficiency
+# Money strings are parsed once per unique value (factorize → parse → take), and the
+# median/MAD outlier scores for every cost metric come from one NumPy pass.
+# ------------------------------------------------------------------------------
+COST_GROUPS = ['Office', 'Palika', 'New vs Rehab', 'Funding source']
+COST_OUTLIER_METRICS = ['Estimated per capita', 'Actual per capita', 'Variance %']
+
+def _parse_money(s: pd.Series) -> np.ndarray:
+    """'1,234.50' / 'NPR 500' → float, '-' / '#VALUE!' / 공백 → NaN (고유값만 파싱 후 코드로 펼침)"""
+    codes, uniques = pd.factorize(s)
+    values = np.append(_parse_number(pd.Series(uniques, dtype=object)).to_numpy(dtype=float), np.nan)
+    return values[codes]  # code -1(결측) → 마지막 NaN
+
+def _system_type(s: pd.Series) -> np.ndarray:
+    raw = _clean_lower(s)
+    kind = np.select(
+        [raw.str.contains('new'), raw.str.contains(r'rehab|repair'), raw.str.contains('recon')],
+        ['New', 'Rehab', 'Reconstruction'], 'Other'
+    )
+    return np.where(s.isna().to_numpy() | raw.eq('').to_numpy(), 'Unknown', kind)
+
+def _cost_values(ds: pd.DataFrame) -> pd.DataFrame:
+    """행 단위 비용(NPR, 결측=NaN) + 1인당 비용 + 예상 대비 실제 차이(%) + 그룹 키"""
+    missing = np.full(len(ds), np.nan)
+    values = pd.DataFrame({
+        f"{basis} {part}": _parse_money(ds[col]) if col in ds.columns else missing
+        for (basis, part), col in COST_COLUMNS.items()
+    }, index=ds.index)
+    pop = ds['_total'] if '_total' in ds.columns else pd.Series(0.0, index=ds.index)
+    pop = pop.where(pop > 0)
+    for basis in ('Estimated', 'Actual'):
+        # Total이 비어 있거나 0이면 Govt + UNICEF + Community 합계로 대체
+        parts = values[[f"{basis} {p}" for p in COST_SHARES]].sum(axis=1, min_count=1)
+        total = values[f"{basis} Total"]
+        values[f"{basis} Total"] = total.where(total > 0).fillna(parts.where(parts > 0))
+        values[f"{basis} per capita"] = values[f"{basis} Total"] / pop
+    values['Variance %'] = (values['Actual Total'] / values['Estimated Total'] - 1) * 100
+
+    def key(col):
+        if col not in ds.columns:
+            return 'Unknown'
+        return ds[col].astype(str).str.strip().where(ds[col].notna(), 'Unknown').replace('', 'Unknown')
+    values['Office'] = ds['_office'] if '_office' in ds.columns else 'Unknown'
+    values['Palika'] = key('_palika')
+    values['New vs Rehab'] = _system_type(ds['system new or rehabilated']) if 'system new or rehabilated' in ds.columns else 'Unknown'
+    values['Funding source'] = key('unicef funding source')
+    return values
+
+def _flag_cost_outliers(values: pd.DataFrame) -> pd.DataFrame:
+    """
+    1인당 비용은 log10, Variance %는 그대로 modified z-score 계산 (모든 지표를 한 행렬로).
+    MAD가 0인 지표(대부분 값이 같음)는 평균 절대편차 × 1.2533로 대체.
+    |z| > COST_OUTLIER_Z → 'Outlier' 플래그 + 'Outlier detail'(지표별 high/low).
+    """
+    m = values[COST_OUTLIER_METRICS].to_numpy(dtype=float, copy=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m[:, :2] = np.log10(np.where(m[:, :2] > 0, m[:, :2], np.nan))
+        m[:, np.isnan(m).all(axis=0)] = 0.0  # 데이터가 없는 지표 → MAD 0 → 플래그 없음
+        med = np.nanmedian(m, axis=0)
+        dev = np.abs(m - med)
+        mad = np.nanmedian(dev, axis=0)
+        scale = np.where(mad > 0, mad / 0.6745, 1.253314 * np.nanmean(dev, axis=0))
+        z = (m - med) / np.where(scale > 0, scale, np.nan)
+    flags = np.abs(np.nan_to_num(z)) > COST_OUTLIER_Z
+    out = values.copy()
+    for j, metric in enumerate(COST_OUTLIER_METRICS):
+        out[f"z {metric}"] = z[:, j]
+    out['Outlier'] = flags.any(axis=1)
+    detail = np.full(len(out), '', dtype=object)
+    for i in np.flatnonzero(out['Outlier'].to_numpy()):  # 플래그된 행만 문자열 생성
+        detail[i] = ", ".join(f"{COST_OUTLIER_METRICS[j]} ({'high' if z[i, j] > 0 else 'low'})" for j in np.flatnonzero(flags[i]))
+    out['Outlier detail'] = detail
+    return out
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_cost_table(_ds: pd.DataFrame, version: str) -> pd.DataFrame:
+    """
+    버전당 한 번: 비용 파싱 + 파생 지표 + 전체 데이터셋 기준 이상치 플래그 (index = 데이터셋 index).
+    append 버전은 이전 버전의 파싱 결과에 tail 행만 파싱해 붙이고, median/MAD는 전체로 다시 계산.
+    """
+    lineage = dataset_lineage(version)
+    if lineage:
+        base = build_cost_table(prepare_dataset(lineage['path'], lineage['parent']), lineage['parent'])
+        values = pd.concat([
+            base.drop(columns=[f"z {m}" for m in COST_OUTLIER_METRICS] + ['Outlier', 'Outlier detail']),
+            _cost_values(prepare_tail(lineage['path'], version)),
+        ], ignore_index=True)
+    else:
+        values = _cost_values(_ds)
+    return _flag_cost_outliers(values)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cost_summary(_ds: pd.DataFrame, _mask, view_key: tuple, group: str, basis: str) -> pd.DataFrame:
+    """그룹별 scheme 수 / 예상·실제 합계 / 차이(%) / 1인당 비용 중앙값 / 재원 분담(%) / 이상치 수 (한 번의 groupby)"""
+    table = build_cost_table(_ds, view_key[0])
+    rows = table if _mask is None else table[_mask]
+    both = rows['Estimated Total'].notna() & rows['Actual Total'].notna()
+    frame = pd.DataFrame({
+        group: rows[group],
+        'Schemes': rows[f"{basis} Total"].notna(),
+        'Estimated (NPR)': rows['Estimated Total'],
+        'Actual (NPR)': rows['Actual Total'],
+        '_est_both': rows['Estimated Total'].where(both),
+        '_act_both': rows['Actual Total'].where(both),
+        'Median per capita (NPR)': rows[f"{basis} per capita"],
+        **{f"_{p}": rows[f"{basis} {p}"] for p in COST_SHARES},
+        'Outliers': rows['Outlier'],
+    })
+    agg = {c: 'sum' for c in frame.columns if c != group}
+    agg['Median per capita (NPR)'] = 'median'
+    summary = frame.groupby(group, sort=False).agg(agg)
+    summary = summary[summary['Schemes'] > 0]
+    summary.insert(3, 'Variance %', (summary['_act_both'] / summary['_est_both'].where(summary['_est_both'] > 0) - 1) * 100)
+    share_total = summary[[f"_{p}" for p in COST_SHARES]].sum(axis=1)
+    for p in COST_SHARES:
+        summary[f"{p} share %"] = summary[f"_{p}"] / share_total.where(share_total > 0) * 100
+    summary = summary.drop(columns=['_est_both', '_act_both'] + [f"_{p}" for p in COST_SHARES])
+    return summary.sort_values('Schemes', ascending=False).round(1).reset_index()
+
+# ------------------------------------------------------------------------------
+# Palika scorecard (3.2 LGPAS / Palikas)
+# One row per palika per (view, year); ranks and percentiles are column-wise
+# rank() calls over that table, so search/sort on the page never touches raw rows.
+# ------------------------------------------------------------------------------
+# 거버넌스(LGPAS) 항목: scheme 응답 중 Yes 비율 (Yes/No 외 응답은 제외)
+SCORECARD_FLAGS = {
+    'Palikawide WQ monitoring': 'palikawide water quality monitoring mechanism established?',
+    'WSP implemented': 'is wsp implemented?',
+    'O & M fund': 'provision of o & m fund available?',
+    'O & M SOP': 'o & m sop in place?',
+    'WUSC bank account': 'bank account of wusc in place?',
+    'Caretaker': 'caretaker in place?',
+    'Scheme functioning': 'is the scheme functioning?',
+}
+SCORECARD_COST_COL = 'Cost per capita (NPR)'
+# Composite score = 가중 평균 percentile (비용은 낮을수록 높은 percentile)
+SCORECARD_WEIGHTS = {'3.1.1': 1.0, '3.1.2': 1.0, '3.1.3': 1.0, 'LGPAS score': 1.0, SCORECARD_COST_COL: 1.0}
+
+def _yes_no(s: pd.Series) -> pd.Series:
+    """Yes → 1, No → 0, 그 외(빈칸/기타) → NaN"""
+    key = _clean_lower(s)
+    out = pd.Series(np.nan, index=s.index)
+    out[key.str.contains(r'\b(?:no|n)\b', na=False)] = 0.0
+    out[_is_yes(s)] = 1.0
+    return out
+
+def _percentiles(table: pd.DataFrame, cols: list, lower_is_better=()) -> pd.DataFrame:
+    signs = pd.Series([-1.0 if c in lower_is_better else 1.0 for c in cols], index=cols)
+    return table[cols].mul(signs).rank(pct=True)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_palika_scorecard(_ds: pd.DataFrame, _mask, view_key: tuple, year: int) -> pd.DataFrame:
+    """
+    palika별 scheme 수 · 지표 합계(연도) · 거버넌스 항목 Yes 비율 · 1인당 비용 · LGPAS/composite 점수와 순위.
+    index = 행 위치 (정렬/검색 결과는 이 테이블의 부분집합)
+    """
+    ensure_columns(_ds, ['_office', '_palika', '_district', 'province2'])
+    keep = ((_ds['_office'] != 'Unknown') & _ds['_palika'].notna()).to_numpy()
+    if _mask is not None:
+        keep = keep & _mask
+    rows = _ds[keep]
+    costs = build_cost_table(_ds, view_key[0])[keep]
+    spent = costs['Actual Total'].fillna(costs['Estimated Total'])
+    pop = rows['_total'] if '_total' in rows.columns else pd.Series(0.0, index=rows.index)
+
+    frame = indicator_values(rows, year)
+    codes = list(frame.columns)
+    flags = [label for label, col in SCORECARD_FLAGS.items() if col in rows.columns]
+    for label in flags:
+        frame[label] = _yes_no(rows[SCORECARD_FLAGS[label]])
+    frame['Schemes'] = 1
+    frame['_spent'] = spent.where(pop > 0)
+    frame['_pop'] = pop.where(spent.notna() & (pop > 0))
+    frame['Province'] = rows['province2'].astype(str).str.strip().str.title()
+    agg = {c: 'sum' for c in codes + ['Schemes', '_spent', '_pop']}
+    agg.update({label: 'mean' for label in flags})
+    agg['Province'] = 'first'
+    card = frame.groupby([rows['_office'], rows['_district'], rows['_palika']], sort=False).agg(agg)
+    card.index.names = ['Office', 'District', 'Palika']
+    card = card.reset_index()
+
+    card[codes] = card[codes].round().astype(int)
+    card['LGPAS score'] = (card[flags].mean(axis=1) * 100).round(1)
+    card[flags] = (card[flags] * 100).round(1)
+    card[SCORECARD_COST_COL] = (card['_spent'] / card['_pop'].where(card['_pop'] > 0)).round(1)
+    card = card.drop(columns=['_spent', '_pop'])
+
+    components = [c for c in SCORECARD_WEIGHTS if c in card.columns]
+    pct = _percentiles(card, components, lower_is_better=(SCORECARD_COST_COL,))
+    weights = pd.Series(SCORECARD_WEIGHTS)[components]
+    card['Composite score'] = (pct.mul(weights).sum(axis=1) / pct.notna().mul(weights).sum(axis=1).where(lambda w: w > 0) * 100).round(1)
+    for score, rank, percentile in (('Composite score', 'Rank', 'Percentile'), ('LGPAS score', 'LGPAS rank', 'LGPAS percentile')):
+        card[rank] = card[score].rank(ascending=False, method='min').astype('Int64')
+        card[percentile] = (card[score].rank(pct=True, method='max') * 100).round(1)
+    for c in components:
+        card[f"_pct {c}"] = pct[c] * 100
+    card['_search'] = (card['Palika'].astype(str) + ' ' + card['District'].astype(str) + ' ' + card['Office']).str.casefold()
+    return card
+
+# ------------------------------------------------------------------------------
+# Versioned snapshots (content-addressed Parquet) + row-level diff
+# ------------------------------------------------------------------------------
+def content_hash(path: str, version: str) -> str:
+    """버전 크기까지의 파일 내용 sha1 (같은 내용이면 mtime이 달라도 같은 스냅샷)"""
+    digest = hashlib.sha1()
+    remaining = _version_size(version)
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def _snapshot_file(digest: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{digest}.parquet")
+
+def record_snapshot(path: str, version: str):
+    """버전을 표준 컬럼 Parquet(zstd)로 저장하고 index.csv에 기록 (내용이 같으면 재사용)"""
+    digest = content_hash(path, version)
+    index = snapshot_index()
+    source = os.path.abspath(path)
+    if ((index['hash'] == digest) & (index['source'] == source)).any():
+        return digest
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    if not os.path.exists(_snapshot_file(digest)):
+        df = load_data(path, end=_version_size(version))
+        df.to_parquet(_snapshot_file(digest) + '.tmp', compression='zstd', index=False)
+        os.replace(_snapshot_file(digest) + '.tmp', _snapshot_file(digest))
+        rows = len(df)
+    else:
+        rows = int(index.loc[index['hash'] == digest, 'rows'].iloc[0])
+    entry = pd.DataFrame([{
+        'hash': digest, 'source': source, 'version': version,
+        'ingested_at': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': rows, 'bytes': _version_size(version),
+    }])
+    index_path = os.path.join(SNAPSHOT_DIR, 'index.csv')
+    entry.to_csv(index_path, mode='a', header=not os.path.exists(index_path), index=False)
+    return digest
+
+@st.cache_data(show_spinner=False)
+def load_snapshot_index(path: str, mtime_ns: int) -> pd.DataFrame:
+    return pd.read_csv(path, dtype={'hash': str, 'source': str, 'version': str})
+
+def snapshot_index() -> pd.DataFrame:
+    """스냅샷 목록 (ingest 순서). index.csv mtime이 바뀌면 자동 재로딩"""
+    index_path = os.path.join(SNAPSHOT_DIR, 'index.csv')
+    try:
+        return load_snapshot_index(index_path, os.stat(index_path).st_mtime_ns)
+    except OSError:
+        return pd.DataFrame(columns=['hash', 'source', 'version', 'ingested_at', 'rows', 'bytes'])
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_snapshot(digest: str) -> pd.DataFrame:
+    """스냅샷 → 정규화 데이터셋 (읽기 전용으로 공유)"""
+    df = pd.read_parquet(_snapshot_file(digest))
+    df = df.astype(object).where(df.notna(), np.nan)  # Parquet None → read_csv와 같은 NaN
+    return normalize_dataset(df)
+
+def _key_text(s: pd.Series) -> pd.Series:
+    return s.fillna('').astype(str).str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def snapshot_row_hashes(digest: str) -> dict:
+    """
+    행 키 해시(office+palika+ward+community, 같은 키의 n번째 등장 포함)와 행 내용 해시.
+    둘 다 uint64 배열이라 두 버전 비교는 해시 조인 한 번으로 끝남.
+    """
+    ds = load_snapshot(digest)
+    key_cols = [c for c in SNAPSHOT_KEY_COLS if c in ds.columns]
+    key = pd.util.hash_pandas_object(pd.DataFrame({c: _key_text(ds[c]) for c in key_cols}), index=False)
+    occurrence = key.groupby(key.to_numpy()).cumcount()
+    keys = pd.util.hash_pandas_object(pd.DataFrame({'key': key, 'n': occurrence}), index=False).to_numpy()
+    raw_cols = sorted(c for c in ds.columns if not c.startswith('_'))
+    content = pd.util.hash_pandas_object(ds[raw_cols].fillna(''), index=False).to_numpy()
+    return {'keys': keys, 'content': content, 'raw_cols': raw_cols, 'key_cols': key_cols}
+
+@st.cache_data(max_entries=16, show_spinner="버전 비교 중...")
+def diff_snapshots(old: str, new: str, year: int = DEFAULT_REPORTING_YEAR) -> dict:
+    """
+    두 스냅샷의 행 단위 diff: 추가/삭제/변경 scheme + 지표별 증감 분해.
+    키 해시 조인(get_indexer) + 내용 해시 비교만 하므로 O(rows).
+    """
+    a, b = load_snapshot(old), load_snapshot(new)
+    ha, hb = snapshot_row_hashes(old), snapshot_row_hashes(new)
+    pos = pd.Index(ha['keys']).get_indexer(hb['keys'])
+    added = pos < 0
+    common_b = np.flatnonzero(~added)
+    common_a = pos[common_b]
+    removed = np.ones(len(a), dtype=bool)
+    removed[common_a] = False
+
+    # 스키마가 바뀐 경우 공통 컬럼만으로 변경 여부 판정
+    shared = [c for c in ha['raw_cols'] if c in hb['raw_cols']]
+    if shared == ha['raw_cols'] == hb['raw_cols']:
+        changed = ha['content'][common_a] != hb['content'][common_b]
+    else:
+        changed = (
+            pd.util.hash_pandas_object(a[shared].iloc[common_a].fillna(''), index=False).to_numpy()
+            != pd.util.hash_pandas_object(b[shared].iloc[common_b].fillna(''), index=False).to_numpy()
+        )
+    ch_a, ch_b = common_a[changed], common_b[changed]
+
+    # 변경된 행의 컬럼별 변경 여부 (변경 행 × 공통 컬럼 bool 행렬)
+    field_changes = np.column_stack([
+        a[c].iloc[ch_a].fillna('').to_numpy() != b[c].iloc[ch_b].fillna('').to_numpy()
+        for c in shared
+    ]) if len(shared) else np.zeros((len(ch_a), 0), dtype=bool)
+
+    va, vb = indicator_values(a, year), indicator_values(b, year)
+    codes = [c for c in INDICATOR_NAMES if c in va.columns and c in vb.columns]
+    va, vb = va[codes], vb[codes]
+    indicators = pd.DataFrame({
+        'Previous': va.sum(),
+        'Current': vb.sum(),
+        'Added': vb[added].sum(),
+        'Removed': -va[removed].sum(),
+        'Changed': vb.iloc[ch_b].sum() - va.iloc[ch_a].sum(),
+    })
+    indicators['Net Δ'] = indicators['Current'] - indicators['Previous']
+    indicators = indicators.round().astype(int).rename_axis('Indicator')
 
-    df_filtered = df[cond_completed & cond_2025].copy()
+    offices = (
+        vb.groupby(b['_office']).sum().sub(va.groupby(a['_office']).sum(), fill_value=0)
+        .round().astype(int).rename_axis('Office')
+    )
 
-    office_mapping = {
-        'nco': 'NCO', 'janakpur': 'Janakpur', 'dhangadi': 'Dhangadi',
-        'bhairahawa': 'Bhairahawa', 'surkhet': 'Surkhet'
+    key_cols = hb['key_cols']
+    def rows(ds, idx, values):
+        out = ds[key_cols].iloc[idx].reset_index(drop=True)
+        return pd.concat([out, values.iloc[idx].round().astype(int).reset_index(drop=True)], axis=1)
+
+    changed_rows = rows(b, ch_b, vb)
+    for code in codes:
+        changed_rows[f"{code} Δ"] = (vb[code].to_numpy()[ch_b] - va[code].to_numpy()[ch_a]).round().astype(int)
+    names = np.array(shared, dtype=object)
+    changed_rows['Changed fields'] = [", ".join(names[r]) for r in field_changes]
+
+    return {
+        'counts': {
+            'added': int(added.sum()), 'removed': int(removed.sum()),
+            'changed': int(changed.sum()), 'unchanged': int(len(changed) - changed.sum()),
+        },
+        'indicators': indicators,
+        'offices': offices,
+        'fields': pd.Series(field_changes.sum(axis=0), index=shared, name='Rows changed')
+                    .loc[lambda x: x > 0].sort_values(ascending=False),
+        'added': rows(b, np.flatnonzero(added), vb),
+        'removed': rows(a, np.flatnonzero(removed), va),
+        'changed': changed_rows,
     }
 
-    def map_office(s: str) -> str:
-        lower = str(s).lower()
-        for k, v in office_mapping.items():
-            if re.search(rf'\b{re.escape(k)}\b', lower):
-                return v
-        return 'Unknown'
+# ------------------------------------------------------------------------------
+# Duplicate-scheme detection (hash index over normalized identity columns)
+# ------------------------------------------------------------------------------
+def _loose_text(s: pd.Series) -> pd.Series:
+    """near-duplicate용 느슨한 정규화: 문자/숫자만 남김 ('Sirad Scheme-1' == 'sirad scheme 1')"""
+    return _key_text(s).str.replace(r'[\W_]+', '', regex=True)
 
-    df_filtered['Office'] = df_filtered[office_col].apply(map_office)
+def _hash_columns(columns: dict) -> pd.Series:
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False)
 
-    palika_summary = (
-        df_filtered
-        .groupby(['Office', palika_col, district_col, province_col])['_beneficiaries_313']
-        .sum()
-        .reset_index()
+@st.cache_data(max_entries=8, show_spinner=False)
+def find_duplicates(_ds: pd.DataFrame, version: str, identity: tuple, distinct: tuple) -> pd.DataFrame:
+    """
+    행마다 중복 그룹과 매치 유형을 반환 (해시 + duplicated 한 번씩이라 O(rows)).
+      Exact         : 모든 원본 컬럼이 앞선 행과 동일
+      Same identity : identity(+distinct) 컬럼이 공백/대소문자 정규화 후 동일
+      Near          : 문자/숫자만 남긴 느슨한 정규화 후 동일
+    그룹의 첫 행은 'Original', 중복이 아닌 행은 ''. identity가 모두 비어 있는 행(합계/빈 행)은 제외.
+    """
+    identity = [c for c in identity if c in _ds.columns]
+    distinct = [c for c in distinct if c in _ds.columns and c not in identity]
+    out = pd.DataFrame({'group': -1, 'match': ''}, index=_ds.index)
+    if not identity:
+        return out
+
+    light = {c: _key_text(_ds[c]) for c in identity + distinct}
+    candidate = pd.concat([light[c] != '' for c in identity], axis=1).any(axis=1).to_numpy()
+    raw_cols = sorted(c for c in _ds.columns if not c.startswith('_'))
+    content = pd.util.hash_pandas_object(_ds[raw_cols].fillna(''), index=False)[candidate]
+    strict = _hash_columns(light)[candidate]
+    loose = _hash_columns({
+        **{c: _loose_text(_ds[c]) for c in identity}, **{c: light[c] for c in distinct}
+    })[candidate]
+
+    match = np.select(
+        [content.duplicated().to_numpy(), strict.duplicated().to_numpy(), loose.duplicated().to_numpy()],
+        DUPLICATE_MATCH_TYPES, default=''
+    )
+    in_group = loose.duplicated(keep=False).to_numpy()
+    match = np.where(in_group & (match == ''), 'Original', match)
+    group = np.where(in_group, pd.factorize(loose)[0], -1)
+
+    out.loc[candidate, 'group'] = group
+    out.loc[candidate, 'match'] = match
+    return out
+
+def duplicate_impact(ds: pd.DataFrame, mask, duplicates: pd.DataFrame, drop_types: list, year: int) -> tuple:
+    """선택한 매치 유형의 중복 행을 제외했을 때 지표별/Office별 변화"""
+    keep = _with_mask(pd.Series(True, index=ds.index), mask)
+    drop = keep & duplicates['match'].isin(drop_types)
+    values = indicator_values(ds, year)
+    current = values[keep].sum()
+    deduped = values[keep & ~drop].sum()
+    indicators = pd.DataFrame({'Current': current, 'Deduplicated': deduped}).round().astype(int)
+    indicators['Δ'] = indicators['Deduplicated'] - indicators['Current']
+    indicators['Δ %'] = (indicators['Δ'] / indicators['Current'].where(indicators['Current'] > 0) * 100).round(1)
+    offices = (
+        -values[drop].groupby(ds.loc[drop, '_office']).sum()
+        .reindex(OFFICE_NAMES.values(), fill_value=0).round().astype(int)
+    ).rename_axis('Office')
+    return indicators.rename_axis('Indicator'), offices
+
+# ------------------------------------------------------------------------------
+# Data-quality profiler (one vectorized pass per dataset version)
+# ------------------------------------------------------------------------------
+DQ_POPULATION_COLS = {
+    'Total': 'total beneficiary population # (current)',
+    'Male': 'beneficiary population male # (current)',
+    'Female': 'beneficiary population female # (current)',
+    'PWD': 'beneficiary population person with disability # (current)',
+}
+DQ_YEAR_COLS = [
+    'water supply beneficiaries reporting year', 'wsc reporting year', 'sanitation beneficiaries reporting year'
+]
+
+def _parse_number(s: pd.Series) -> pd.Series:
+    """엄격한 숫자 파싱 ('1,234' / 'NPR 500' 허용, 'N/A'·'-' 등은 NaN) — _to_number와 달리 0으로 메우지 않음"""
+    s = s.astype(str).str.strip().str.replace(r'^(?i:npr|rs\.?)\s*', '', regex=True).str.replace(',', '')
+    return pd.to_numeric(s, errors='coerce')
+
+def _join_labels(labels: pd.DataFrame) -> pd.Series:
+    """행마다 빈 문자열이 아닌 라벨을 ', '로 연결 (컬럼 단위 문자열 연산, 행별 apply 없음)"""
+    joined = np.full(len(labels), '', dtype=object)
+    for _, label in labels.items():
+        label = label.to_numpy(dtype=object)
+        joined = joined + np.where((joined != '') & (label != ''), ', ', '') + label
+    return pd.Series(joined, index=labels.index)
+
+@st.cache_data(max_entries=4, show_spinner="데이터 품질 점검 중...")
+def profile_dataset(_ds: pd.DataFrame, version: str) -> dict:
+    """
+    컬럼별 결측률/파싱 실패/범위 초과 + 행별 이슈 플래그를 한 번에 계산.
+    빈 행(모든 원본 컬럼 공백)은 이슈 점검에서 제외.
+    """
+    raw_cols = [c for c in _ds.columns if not c.startswith('_')]
+    raw = _ds[raw_cols]
+    blank = raw.isna() | raw.apply(lambda s: s.astype(str).str.strip().eq(''))
+    empty_row = blank.all(axis=1)
+    checked = ~empty_row
+
+    numeric_cols = [c for c in raw_cols if re.search(r'^#|population|cost|per capita|toilets built', c)]
+    year_cols = [c for c in DQ_YEAR_COLS if c in raw_cols]
+    numbers = pd.DataFrame({c: _parse_number(raw[c]) for c in numeric_cols}, index=_ds.index)
+    years = pd.DataFrame({c: _to_year(raw[c]) for c in year_cols}, index=_ds.index)
+    bad_number = ~blank[numeric_cols] & numbers.isna()
+    bad_year = ~blank[year_cols] & years.isna()
+    year_out = years.notna() & ((years < DQ_YEAR_RANGE[0]) | (years > DQ_YEAR_RANGE[1]))
+    pop_cols = [c for c in DQ_POPULATION_COLS.values() if c in numeric_cols]
+    pop_out = numbers[pop_cols].notna() & ((numbers[pop_cols] < 0) | (numbers[pop_cols] > DQ_BENEFICIARY_MAX))
+
+    checks = {}
+    if 'office' in raw_cols:
+        checks['Missing office'] = blank['office']
+        checks['Unmapped office'] = ~blank['office'] & (_ds['_office'] == 'Unknown')
+    checks['Unparsable number'] = bad_number.any(axis=1)
+    checks['Unparsable year'] = bad_year.any(axis=1)
+    checks['Year out of range'] = year_out.any(axis=1)
+    checks['Beneficiaries out of range'] = pop_out.any(axis=1)
+    total, male, female, pwd = (DQ_POPULATION_COLS[k] for k in ('Total', 'Male', 'Female', 'PWD'))
+    sex_mismatch = pd.Series('', index=_ds.index)
+    if {total, male, female} <= set(numeric_cols):
+        both = numbers[[total, male, female]].notna().all(axis=1)
+        sex_sum = numbers[male] + numbers[female]
+        checks['Male + Female ≠ Total'] = both & ((sex_sum - numbers[total]).abs() > 0.5)
+        sex_mismatch = ("male+female " + sex_sum.map('{:,.0f}'.format) + " vs total "
+                        + numbers[total].map('{:,.0f}'.format)).where(checks['Male + Female ≠ Total'], '')
+    if {total, pwd} <= set(numeric_cols):
+        checks['PWD > Total'] = numbers[pwd] > numbers[total]
+    flags = pd.DataFrame(checks, index=_ds.index).fillna(False) & checked.to_numpy()[:, None]
+
+    columns = pd.DataFrame({
+        'Column': raw_cols,
+        'Null %': (blank[checked].mean() * 100).round(1).to_numpy(),
+        'Unique': raw[checked].nunique().to_numpy(),
+        'Unparsable': bad_number.sum().add(bad_year.sum(), fill_value=0).reindex(raw_cols, fill_value=0).astype(int).to_numpy(),
+        'Out of range': pop_out.sum().add(year_out.sum(), fill_value=0).reindex(raw_cols, fill_value=0).astype(int).to_numpy(),
+    })
+    # 행별 상세: 어떤 컬럼이 문제인지 (플래그된 행만 문자열로 만듦)
+    rows = flags.any(axis=1)
+    flagged = flags[rows]
+    issues = _join_labels(pd.DataFrame(np.where(flagged, flagged.columns.to_numpy(), ''), index=flagged.index))
+    detail = pd.concat([
+        pd.DataFrame(np.where(frame[rows], [f"{label}: {c}" for c in frame.columns], ''), index=flagged.index)
+        for label, frame in (('unparsable', bad_number), ('unparsable', bad_year),
+                             ('out of range', pop_out), ('out of range', year_out))
+        if len(frame.columns)
+    ] + [sex_mismatch[rows]], axis=1)
+    context = [c for c in ('office', 'palika', 'ward#', 'community name') if c in raw_cols]
+    row_table = _ds.loc[rows, context].copy()
+    row_table.insert(0, 'CSV line', row_table.index + 2)  # 헤더 = 1행
+    row_table['Issues'] = issues
+    row_table['Detail'] = _join_labels(detail)
+
+    unmapped = flags['Unmapped office'] if 'Unmapped office' in flags else pd.Series(False, index=_ds.index)
+
+    expected = pd.DataFrame({
+        'Standard column': list(STANDARD_COLUMNS),
+        'Present': [c in raw_cols for c in STANDARD_COLUMNS],
+    })
+    return {
+        'rows': len(_ds), 'empty_rows': int(empty_row.sum()), 'issue_rows': int(rows.sum()),
+        'checks': flags.sum().rename('Rows').rename_axis('Check').reset_index(),
+        'columns': columns, 'row_issues': row_table, 'expected': expected,
+        'unmapped_offices': _ds.loc[unmapped, 'office'].value_counts(),
+    }
+
+# ------------------------------------------------------------------------------
+# Humanitarian event store (append-only JSONL) + incrementally folded aggregates
+# Sitreps arrive via the page uploader or EVENT_INBOX_DIR (ingested by the background
+# worker). Each read only parses the bytes appended since the previous read and folds
+# them into per (event, date, office, palika) sums, so cost grows with new reports only.
+# ------------------------------------------------------------------------------
+EVENT_KEYS = ['event', 'date', 'office', 'palika']
+EVENT_VALUE_COLS = ['people_reached', 'male', 'female', 'pwd']
+EVENT_RECENT_ROWS = 200
+# sitrep 컬럼 변형 → 저장 필드 (정확히 일치하는 변형만 사용: 'male'이 'female'에 부분일치하지 않도록)
+SITREP_COLUMNS = {
+    'event': ['event', 'emergency', 'event name'],
+    'date': ['date', 'report date', 'reporting date', 'sitrep date'],
+    'office': ['office', 'field office'],
+    'district': ['district'],
+    'palika': ['palika', 'municipality', 'rural municipality'],
+    'activity': ['activity', 'sector', 'response', 'intervention'],
+    'people_reached': ['people reached', 'people_reached', '# of people reached', 'people', 'beneficiaries'],
+    'male': ['male', 'people reached male', 'male reached'],
+    'female': ['female', 'people reached female', 'female reached'],
+    'pwd': ['pwd', 'people reached pwd', 'persons with disability'],
+    'report_id': ['report id', 'report_id', 'sitrep id', 'sitrep no'],
+}
+
+def _event_from_name(name: str):
+    """파일 이름에 HUMANITARIAN_EVENTS 키가 들어 있으면 그 이벤트 (예: 'flood-2024_sitrep12.csv')"""
+    name = str(name).casefold()
+    return next((key for key in HUMANITARIAN_EVENTS.values() if key in name), None)
+
+def read_sitrep(source, name: str) -> pd.DataFrame:
+    """CSV / JSON / JSONL sitrep → 원본 DataFrame (모든 값 문자열)"""
+    lower = name.lower()
+    if lower.endswith('.jsonl'):
+        return pd.read_json(source, lines=True, dtype=False).astype(str)
+    if lower.endswith('.json'):
+        return pd.read_json(source, dtype=False).astype(str)
+    return pd.read_csv(source, dtype=str)
+
+def parse_sitrep(raw: pd.DataFrame, event: str = None) -> pd.DataFrame:
+    """sitrep 행 → 저장 레코드 (날짜/office/palika 정리, 숫자 파싱). date·people reached가 없으면 ValueError"""
+    variants = {_normalize_col(v): std for std, vs in SITREP_COLUMNS.items() for v in vs}
+    raw = raw.rename(columns=lambda c: variants.get(_normalize_col(c), c))
+    raw = raw.loc[:, ~raw.columns.duplicated()]
+    missing = [c for c in ('date', 'people_reached') if c not in raw.columns]
+    if missing:
+        raise ValueError(f"sitrep 필수 컬럼 누락: {', '.join(missing)}")
+    if 'event' not in raw.columns:
+        if event is None:
+            raise ValueError("event 컬럼이 없고 이벤트도 지정되지 않았습니다.")
+        raw['event'] = event
+    out = pd.DataFrame(index=raw.index)
+    slug = _clean_lower(raw['event']).str.replace(r'\s+', '-', regex=True)
+    known = {re.sub(r'\s+', '-', label.casefold()): key for label, key in HUMANITARIAN_EVENTS.items()}
+    out['event'] = slug.map(known).fillna(slug)  # 'Flood 2024' 같은 페이지 이름도 이벤트 키로
+    out['date'] = pd.to_datetime(raw['date'], errors='coerce').dt.strftime('%Y-%m-%d')
+    out['office'] = canonical_offices(raw['office']) if 'office' in raw.columns else 'Unknown'
+    out['district'] = canonical_districts(raw['district']) if 'district' in raw.columns else None
+    out['palika'] = (
+        canonical_palikas(raw['palika'], out['district'] if 'district' in raw.columns else None).fillna('Unknown')
+        if 'palika' in raw.columns else 'Unknown'
+    )
+    out['activity'] = raw['activity'].fillna('').str.strip() if 'activity' in raw.columns else ''
+    for col in EVENT_VALUE_COLS:
+        out[col] = _to_number(raw[col]) if col in raw.columns else 0.0
+    out['report_id'] = raw['report_id'].fillna('') if 'report_id' in raw.columns else ''
+    return out[out['date'].notna()].reset_index(drop=True)
+
+@st.cache_resource(show_spinner=False)
+def _event_state(path: str) -> dict:
+    """프로세스당 하나: 저장소에서 이미 접은 byte offset + 누적 집계 (모든 세션 공유)"""
+    return {'lock': threading.Lock(), 'offset': -1, 'daily': None, 'recent': None, 'batches': set(), 'reports': 0}
+
+def event_aggregates(path: str = EVENT_STORE_PATH) -> dict:
+    """
+    저장소 끝에 새로 추가된 완전한 줄만 읽어 누적 집계에 더함 (파일이 줄었으면 처음부터 다시).
+    반환: {'daily': (event, date, office, palika) 합계, 'recent': 최근 레코드, 'reports', 'offset'}
+    반환된 DataFrame은 공유 객체이므로 읽기 전용으로 취급할 것.
+    """
+    state = _event_state(os.path.abspath(path))
+    with state['lock']:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < state['offset'] or state['offset'] < 0:
+            state.update(offset=0, daily=None, recent=None, batches=set(), reports=0)
+        if size > state['offset']:
+            with open(path, 'rb') as f:
+                f.seek(state['offset'])
+                chunk = f.read(size - state['offset'])
+            end = chunk.rfind(b'\n') + 1  # 쓰는 중인 마지막 줄은 다음 읽기로
+            if end:
+                new = pd.read_json(io.BytesIO(chunk[:end]), lines=True, dtype=False)
+                # 직접 추가한 줄에 필드가 없어도 접기는 계속 (없는 키의 행은 groupby에서 빠짐)
+                new = new.reindex(columns=new.columns.union(EVENT_KEYS + EVENT_VALUE_COLS, sort=False))
+                new['date'] = new['date'].astype(str)
+                daily = new.assign(reports=1).groupby(EVENT_KEYS)[EVENT_VALUE_COLS + ['reports']].sum()
+                recent = new
+                if state['daily'] is not None:
+                    daily = pd.concat([state['daily'], daily]).groupby(level=EVENT_KEYS).sum()
+                    recent = pd.concat([state['recent'], new], ignore_index=True)
+                state['daily'], state['recent'] = daily, recent.tail(EVENT_RECENT_ROWS)
+                if new.get('batch') is not None:
+                    state['batches'].update(new['batch'].dropna().unique())
+                state['reports'] += len(new)
+                state['offset'] += end
+        return {
+            'daily': state['daily'], 'recent': state['recent'], 'reports': state['reports'],
+            'offset': state['offset'], 'batches': set(state['batches']),
+        }
+
+@contextlib.contextmanager
+def _store_lock(path: str):
+    """<path>.lock에 대한 배타적 OS lock (스레드/프로세스 공통, writer가 죽으면 OS가 해제)"""
+    with open(path + '.lock', 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # 잠겨 있으면 재시도, 약 10초 후 OSError
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def append_events(records: pd.DataFrame, source: str, path: str = EVENT_STORE_PATH) -> int:
+    """레코드를 JSONL 저장소 끝에 추가 (같은 내용의 sitrep은 한 번만). 추가한 행 수 반환"""
+    if records.empty:
+        return 0
+    batch = hashlib.sha1(records.to_csv(index=False).encode('utf-8')).hexdigest()
+    lines = records.assign(batch=batch, source=source, received=pd.Timestamp.now().isoformat(timespec='seconds'))
+    payload = lines.to_json(orient='records', lines=True, force_ascii=False)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _store_lock(path):  # 중복 확인과 쓰기 사이에 다른 writer가 끼지 못하게
+        if batch in event_aggregates(path)['batches']:
+            return 0
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(payload if payload.endswith('\n') else payload + '\n')
+    return len(records)
+
+def ingest_event_inbox(errors: dict, inbox: str = EVENT_INBOX_DIR):
+    """inbox의 sitrep 파일을 저장소에 추가하고 processed/ (실패 시 failed/)로 이동"""
+    if not os.path.isdir(inbox):
+        return
+    for name in sorted(os.listdir(inbox)):
+        src = os.path.join(inbox, name)
+        if not os.path.isfile(src) or not name.lower().endswith(('.csv', '.json', '.jsonl')):
+            continue
+        try:
+            append_events(parse_sitrep(read_sitrep(src, name), _event_from_name(name)), source=name)
+            target = 'processed'
+            errors.pop(src, None)
+        except Exception as e:
+            target = 'failed'
+            errors[src] = f"sitrep 처리 실패: {e}"
+        os.makedirs(os.path.join(inbox, target), exist_ok=True)
+        os.replace(src, os.path.join(inbox, target, name))
+
+# ------------------------------------------------------------------------------
+# Background precomputation worker
+# Watches the paths sessions use (+ DATA_WATCH_DIR/*.csv); when a file changes it
+# warms every dataset-level cache for the new version and only then publishes it.
+# Sessions keep reading the previously published version until the swap.
+# ------------------------------------------------------------------------------
+def warm_dataset_caches(path: str, version: str):
+    """데이터셋 버전의 정규화 데이터 + 필터 인덱스 + 모든 지표 집계(필터 없음)를 미리 계산"""
+    ds = prepare_dataset(path, version)
+    build_filter_index(ds, version)
+    years = available_years(ds, version)
+    view_key = (version, ())
+    tkey = targets_version()
+    for code in INDICATOR_PROCESSORS:
+        try:
+            build_year_trend(ds, None, view_key, code)
+            for year in years:
+                _, palika_df = indicator_tables(ds, None, view_key, code, year, tkey)
+                palika_partitions(palika_df, (view_key, code, year, tkey))
+        except KeyError:
+            continue  # 지표에 필요한 컬럼이 없음 → 페이지에서 ensure_columns 에러로 안내
+    for year in years:
+        build_geo_hierarchy(ds, None, view_key, year)
+        build_palika_scorecard(ds, None, view_key, year)
+    build_progress_cube(ds, None, view_key)
+    build_office_partitions(ds, version)
+    build_jmp_cube(ds, None, view_key)
+    build_wsp_funnel(ds, None, view_key)
+    build_cost_table(ds, version)
+
+def _file_meta(path: str, version: str) -> dict:
+    """append 판정용: 헤더(스키마) + 버전 크기까지의 전체 내용 해시 + 줄바꿈 종료 여부"""
+    size = _version_size(version)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(size - 1, 0))
+        last = f.read(1) if size > 0 else b''
+    return {
+        'version': version, 'size': size, 'header': header,
+        'content_hash': content_hash(path, version), 'ends_with_newline': last in (b'\n', b'\r'),
+    }
+
+def _detect_append(path: str, meta: dict, version: str):
+    """
+    새 버전이 이전 버전 파일 끝에 행만 추가된 것이면 이전 버전 크기(byte offset)를 반환.
+    이전 크기까지의 내용 전체를 다시 해시해 비교하므로, 길이가 같은 제자리 수정 + append도
+    revision으로 판정 → None (전체 재빌드).
+    """
+    if not meta or _version_size(version) <= meta['size'] or not meta['ends_with_newline']:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            header = f.readline()
+        prefix_hash = content_hash(path, meta['version'])
+    except OSError:
+        return None
+    if header != meta['header'] or prefix_hash != meta['content_hash']:
+        return None
+    return meta['size']
+
+def append_field_reports(path: str, upload) -> int:
+    """
+    업로드된 CSV 행을 원본 파일 끝에 추가 (원본 헤더 순서/이름에 맞춰 재배열).
+    원본에 없는 컬럼은 버림. 추가한 행 수 반환.
+    """
+    raw_cols = list(pd.read_csv(path, nrows=0, dtype=str).columns)
+    std_cols = standardize_columns(pd.DataFrame(columns=raw_cols)).columns
+    delta = standardize_columns(pd.read_csv(upload, dtype=str))
+    delta = delta.loc[:, ~delta.columns.duplicated()]
+    delta = delta.reindex(columns=std_cols)
+    delta.columns = raw_cols
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) not in (b'\n', b'\r'):
+                f.write(b'\n')
+        f.write(delta.to_csv(header=False, index=False).encode('utf-8'))
+    return len(delta)
+
+def render_append_sidebar(path: str):
+    """현장 보고 CSV append 업로더 (append는 워커가 tail만 파싱해 증분 반영)"""
+    with st.sidebar.expander("📥 Append field reports", expanded=False):
+        upload = st.file_uploader("CSV (원본과 같은 컬럼 구성)", type=['csv'], key="append_upload")
+        if upload is None:
+            return
+        done = st.session_state.setdefault('appended_uploads', set())
+        if upload.file_id in done:
+            st.caption(f"✅ {upload.name} 추가 완료 — 다음 갱신 시 반영됩니다.")
+            return
+        if st.button("Append", key="append_button"):
+            try:
+                n = append_field_reports(path, upload)
+            except Exception as e:
+                st.error(f"Append 실패: {e}")
+                return
+            done.add(upload.file_id)
+            st.success(f"{n:,} rows appended → 백그라운드에서 증분 반영 중")
+
+def dataset_lineage(version: str):
+    """append로 생긴 버전이면 {'path', 'parent', 'offset'}, 아니면 None"""
+    return get_precompute_worker()['lineage'].get(version)
+
+def _watched_paths(worker: dict) -> list:
+    paths = set(worker['paths'])
+    if os.path.isdir(DATA_WATCH_DIR):
+        paths.update(
+            os.path.join(DATA_WATCH_DIR, f) for f in os.listdir(DATA_WATCH_DIR)
+            if f.lower().endswith('.csv')
+        )
+    return sorted(paths)
+
+def _prepare_and_publish(worker: dict, path: str, version: str):
+    try:
+        offset = _detect_append(path, worker['meta'].get(path), version)
+        if offset is not None:
+            worker['lineage'][version] = {
+                'path': path, 'parent': worker['meta'][path]['version'], 'offset': offset
+            }
+        warm_dataset_caches(path, version)
+        meta = _file_meta(path, version)
+    except Exception as e:
+        worker['failed'][path] = version  # 같은 버전은 재시도하지 않음 (파일이 다시 바뀌면 재시도)
+        worker['errors'][path] = str(e)
+        return
+    with worker['lock']:
+        if worker['stop'].is_set():
+            return  # 해제된 워커는 게시하지 않음 (새 워커가 다시 준비)
+        worker['published'][path] = version  # atomic swap
+        worker['meta'][path] = meta
+        worker['errors'].pop(path, None)
+
+def _precompute_loop(worker: dict):
+    stop = worker['stop']
+    while not stop.is_set():
+        for path in _watched_paths(worker):
+            if stop.is_set():
+                return
+            try:
+                version = dataset_version(path)
+            except OSError:
+                continue
+            if version not in (worker['published'].get(path), worker['failed'].get(path)):
+                _prepare_and_publish(worker, path, version)
+            # 게시된 버전이 아직 파일의 현재 내용일 때만 스냅샷 저장 (그 사이 바뀌었으면 다음 버전에서 저장)
+            if version == worker['published'].get(path) and version not in worker['snapshots']:
+                worker['snapshots'].add(version)
+                try:
+                    snapshot_row_hashes(record_snapshot(path, version))  # diff용 해시도 미리 계산
+                except Exception as e:
+                    worker['errors'][path] = f"snapshot 저장 실패: {e}"
+        try:
+            ingest_event_inbox(worker['errors'])
+            event_aggregates()  # 새 sitrep을 미리 접어 페이지에서는 조회만
+        except Exception as e:
+            worker['errors'][EVENT_STORE_PATH] = f"event store 갱신 실패: {e}"
+        stop.wait(PRECOMPUTE_POLL_SECONDS)
+
+PRECOMPUTE_THREAD_NAME = "wash-precompute"
+
+def _stop_precompute_worker(worker: dict):
+    """캐시에서 해제된 워커를 멈추고 진행 중인 빌드가 끝날 때까지 기다림"""
+    worker['stop'].set()
+    thread = worker.get('thread')
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(timeout=PRECOMPUTE_POLL_SECONDS * 2)
+
+@st.cache_resource(show_spinner=False, on_release=_stop_precompute_worker)
+def get_precompute_worker() -> dict:
+    """
+    프로세스당 하나의 워커 스레드 (모든 세션 공유).
+    캐시가 비워져 다시 만들 때 이전 스레드가 남아 있으면 먼저 멈춤 (두 워커가 동시에 게시하지 않도록).
+    """
+    for thread in threading.enumerate():
+        if thread.name == PRECOMPUTE_THREAD_NAME and thread.is_alive() and hasattr(thread, 'worker'):
+            _stop_precompute_worker(thread.worker)
+    worker = {
+        'lock': threading.Lock(), 'stop': threading.Event(), 'paths': set(), 'published': {}, 'meta': {},
+        'lineage': {}, 'snapshots': set(), 'failed': {}, 'errors': {},
+    }
+    worker['thread'] = threading.Thread(target=_precompute_loop, args=(worker,), daemon=True, name=PRECOMPUTE_THREAD_NAME)
+    worker['thread'].worker = worker
+    worker['thread'].start()
+    return worker
+
+def served_dataset_version(path: str):
+    """세션이 사용할 (이미 준비 완료된) 데이터셋 버전. 아직 없으면 None"""
+    worker = get_precompute_worker()
+    if not os.path.exists(path):
+        dataset_version(path)  # FileNotFoundError → 기존 에러 안내
+    with worker['lock']:
+        worker['paths'].add(path)
+        return worker['published'].get(path)
+
+def publish_dataset_version(path: str, version: str):
+    worker = get_precompute_worker()
+    meta = _file_meta(path, version)
+    with worker['lock']:
+        worker['published'][path] = version
+        worker['meta'][path] = meta
+
+# ------------------------------------------------------------------------------
+# Auto-refresh
+# Pages that depend on the dataset run as run_every fragments: each tick compares
+# a fingerprint (published version / file stat) with what this session rendered
+# and re-renders only that fragment from the caches. A new dataset version still
+# falls back to a full app re-run, because the sidebar (years, filter options)
+# and the fragment's arguments were built from the previous version. Inline pages
+# (3.1.1–3.1.3) keep a sidebar ticker that re-runs the app only on a change.
+# ------------------------------------------------------------------------------
+def live_fingerprint(path: str, events: bool = False) -> tuple:
+    """페이지가 보여주는 데이터의 현재 fingerprint (dict 조회 + stat만, 데이터는 읽지 않음)"""
+    if events:
+        try:
+            return ('events', os.stat(EVENT_STORE_PATH).st_size)
+        except OSError:
+            return ('events', 0)
+    worker = get_precompute_worker()
+    with worker['lock']:
+        version = worker['published'].get(path)  # 워커가 캐시를 다 데운 뒤에만 바뀜
+    return ('dataset', version, targets_version())
+
+def _live_page(path: str, events: bool, render, args: tuple):
+    fingerprint = live_fingerprint(path, events)
+    rendered = st.session_state['rendered_fingerprint']
+    if fingerprint[:2] != rendered[:2] and not events:
+        st.rerun(scope="app")  # 새 데이터 버전: 사이드바/인자가 이전 버전 기준이므로 전체 re-run
+    st.session_state['rendered_fingerprint'] = fingerprint
+    render(*args)
+    if live_fingerprint(path, events) != fingerprint:
+        st.rerun(scope="fragment")  # 그리는 동안 targets/events가 바뀌었으면 다음 tick을 기다리지 않음
+
+def page_runner(path: str, events: bool, seconds):
+    """페이지 함수 호출기. auto-refresh가 켜져 있으면 run_every fragment 안에서 호출 (run.live = True)"""
+    def run(render, *args):
+        if seconds:
+            run.live = True
+            st.session_state['rendered_fingerprint'] = live_fingerprint(path, events)
+            st.fragment(run_every=seconds)(_live_page)(path, events, render, args)
+        else:
+            render(*args)
+    run.live = False
+    return run
+
+def _refresh_tick(path: str, events: bool):
+    if live_fingerprint(path, events) != st.session_state.get('rendered_fingerprint'):
+        st.rerun(scope="app")
+    st.caption(f"🔄 Auto-refresh · 마지막 확인 {time.strftime('%H:%M:%S')}")
+
+def watch_for_updates(path: str, events: bool, seconds: int):
+    """inline 페이지용: 방금 그린 페이지의 fingerprint를 기록하고 사이드바에 주기적 확인 fragment를 둠"""
+    st.session_state['rendered_fingerprint'] = live_fingerprint(path, events)
+    with st.sidebar:
+        st.fragment(run_every=seconds)(_refresh_tick)(path, events)
+
+# ------------------------------------------------------------------------------
+# Exports
+# Download buttons get a callable, so bytes are only built when the user clicks;
+# results are cached per (export key, format) with LRU eviction. Writers consume
+# EXPORT_CHUNK_ROWS rows at a time (CSV append, Parquet row groups, XLSX rows in
+# constant-memory mode) and the full dataset is written to EXPORT_DIR in chunks.
+# ------------------------------------------------------------------------------
+XLSX_MAX_ROWS = 1048575  # 헤더 1행을 뺀 Excel 시트당 최대 데이터 행 수
+
+def _chunks(df: pd.DataFrame, positions=None, columns=None):
+    """df(또는 positions 행, columns 열)를 EXPORT_CHUNK_ROWS 단위로 잘라 반환"""
+    cols = df.columns if columns is None else pd.Index(columns)
+    col_pos = df.columns.get_indexer(cols)
+    n = len(df) if positions is None else len(positions)
+    for start in range(0, n, EXPORT_CHUNK_ROWS):
+        rows = slice(start, start + EXPORT_CHUNK_ROWS) if positions is None else positions[start:start + EXPORT_CHUNK_ROWS]
+        yield df.iloc[rows, col_pos]
+    if n == 0:
+        yield df.iloc[:0, col_pos]
+
+def _arrow_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """object 컬럼(혼합 타입)은 string으로 통일해야 chunk마다 같은 Parquet schema가 나옴"""
+    obj = [c for c in chunk.columns if chunk[c].dtype == object]
+    return chunk.astype({c: 'string' for c in obj}) if obj else chunk
+
+def _write_csv(frames, f):
+    for i, chunk in enumerate(frames):
+        chunk.to_csv(f, header=(i == 0), index=False, encoding='utf-8')
+
+def _write_parquet(frames, f):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in frames:
+            if writer is None:
+                schema = pa.Schema.from_pandas(_arrow_chunk(chunk), preserve_index=False)
+                schema = pa.schema([pa.field(fl.name, pa.string()) if pa.types.is_null(fl.type) else fl for fl in schema])
+                writer = pq.ParquetWriter(f, schema, compression='zstd')
+            writer.write_table(pa.Table.from_pandas(_arrow_chunk(chunk), schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _xlsx_rows(chunk: pd.DataFrame) -> list:
+    return chunk.astype(object).where(chunk.notna(), None).to_numpy().tolist()
+
+def _write_xlsx(sheets: dict, f, positions=None, columns=None):
+    """시트별로 chunk를 행 단위로 기록; 한 시트가 Excel 행 한도를 넘으면 이름_2, _3 ... 로 이어감"""
+    try:
+        import xlsxwriter
+        wb = xlsxwriter.Workbook(f, {'constant_memory': True, 'strings_to_urls': False,
+                                     'strings_to_formulas': False, 'nan_inf_to_errors': True})
+        add_sheet, finish = wb.add_worksheet, wb.close
+        def append(ws, r, row):
+            ws.write_row(r, 0, row)
+    except ImportError:
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        add_sheet, finish = wb.create_sheet, lambda: wb.save(f)
+        def append(ws, r, row):
+            ws.append(row)
+
+    for name, df in sheets.items():
+        ws, part, r = None, 0, 0
+        for chunk in _chunks(df, positions, columns):
+            for row in _xlsx_rows(chunk) or [None]:
+                if ws is None or r > XLSX_MAX_ROWS:
+                    part += 1
+                    ws = add_sheet(str(name)[:31] if part == 1 else f"{str(name)[:27]}_{part}")
+                    append(ws, 0, [str(c) for c in chunk.columns])
+                    r = 1
+                if row is not None:
+                    append(ws, r, row)
+                    r += 1
+    finish()
+
+def write_export(sheets: dict, fmt: str, f, positions=None, columns=None):
+    """sheets(name → DataFrame)를 fmt 형식으로 f(binary file)에 기록. CSV/Parquet은 첫 시트만"""
+    if fmt == 'Excel':
+        _write_xlsx(sheets, f, positions, columns)
+        return
+    first = next(iter(sheets.values()))
+    (_write_parquet if fmt == 'Parquet' else _write_csv)(_chunks(first, positions, columns), f)
+
+@st.cache_data(show_spinner="📥 파일 생성 중...", max_entries=EXPORT_CACHE_ENTRIES)
+def export_bytes(_sheets: dict, export_key: tuple, fmt: str) -> bytes:
+    """export_key가 _sheets의 내용을 결정함 (같은 key → 같은 bytes, LRU로 오래된 항목부터 제거)"""
+    with tempfile.TemporaryFile() as f:
+        write_export(_sheets, fmt, f)
+        f.seek(0)
+        return f.read()
+
+def scenario_key() -> tuple:
+    """시나리오 배수가 반영된 표의 export key에 포함 (슬라이더가 바뀌면 다른 파일)"""
+    return tuple(scenario_multiplier(code) for code in INDICATOR_NAMES)
+
+def render_download(label: str, sheets: dict, export_key: tuple, file_stub: str, key: str = None):
+    """선택한 형식의 다운로드 버튼. 파일은 클릭할 때 export_bytes로 생성"""
+    fmt = st.session_state.get('export_format', 'CSV')
+    ext, mime = EXPORT_FORMATS[fmt]
+    st.download_button(
+        label=f"{label} as {fmt}",
+        data=lambda: export_bytes(sheets, export_key, fmt),
+        file_name=f"{file_stub}.{ext}",
+        mime=mime,
+        key=key,
+        on_click="ignore",
+    )
+
+def dataset_export_file(ds: pd.DataFrame, mask, view_key: tuple, fmt: str) -> str:
+    """필터된 전체 데이터(표준 컬럼)를 EXPORT_DIR에 chunk 단위로 기록하고 경로 반환.
+    같은 (version, 필터, 형식)은 기존 파일을 재사용하고, 최근 EXPORT_CACHE_ENTRIES개만 남김"""
+    digest = hashlib.sha1(repr((view_key, fmt)).encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(EXPORT_DIR, f"wash_{digest}.{EXPORT_FORMATS[fmt][0]}")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    positions = None if mask is None else np.flatnonzero(mask)
+    with tempfile.NamedTemporaryFile(dir=EXPORT_DIR, suffix='.tmp', delete=False) as f:
+        write_export({'WASH': ds}, fmt, f, positions, source_columns(ds))
+    os.replace(f.name, path)
+    files = sorted((os.path.join(EXPORT_DIR, n) for n in os.listdir(EXPORT_DIR) if n.startswith('wash_')),
+                   key=os.path.getmtime, reverse=True)
+    for old in files[EXPORT_CACHE_ENTRIES:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def render_dataset_download(ds: pd.DataFrame, mask, view_key: tuple):
+    fmt = st.session_state.get('export_format', 'CSV')
+    ext, mime = EXPORT_FORMATS[fmt]
+    rows = len(ds) if mask is None else int(mask.sum())
+    if rows > EXPORT_MAX_ROWS:
+        st.warning(f"⚠️ 필터된 데이터가 {rows:,}행으로 다운로드 한도({EXPORT_MAX_ROWS:,}행)를 넘습니다. "
+                   "사이드바 필터로 범위를 좁혀 주세요.")
+        return
+    st.download_button(
+        label=f"📥 Download filtered dataset ({rows:,} rows) as {fmt}",
+        data=lambda: _read_file(dataset_export_file(ds, mask, view_key, fmt)),
+        file_name=f"wash_dataset.{ext}",
+        mime=mime,
+        key="dataset_export",
+        on_click="ignore",
     )
-    palika_summary.columns = ['Office', 'Palika', 'District', 'Province', 'Beneficiaries']
-    palika_summary['Beneficiaries'] = palika_summary['Beneficiaries'].round().astype(int)
-    palika_summary = palika_summary[palika_summary['Office'] != 'Unknown']
-    palika_summary = palika_summary.sort_values('Beneficiaries', ascending=False)
-    return palika_summary
 
 # ------------------------------------------------------------------------------
 # Map builder
 # ------------------------------------------------------------------------------
-def create_nepal_map(office_df: pd.DataFrame, palika_df: pd.DataFrame):
+def create_nepal_map(office_df: pd.DataFrame, palika_counts: dict, year: int = DEFAULT_REPORTING_YEAR):
+    """palika_counts = office별 고유 palika 수 (palika_partitions에서 미리 계산)"""
     nepal_map = folium.Map(location=[28.3949, 84.1240], zoom_start=7, tiles='OpenStreetMap')
 
     for _, row in office_df.iterrows():
@@ -660,13 +2936,13 @@ def create_nepal_map(office_df: pd.DataFrame, palika_df: pd.DataFrame):
         lat = (coords or {}).get('lat', 28.3949)
         lon = (coords or {}).get('lon', 84.1240)
 
-        palikas_count = len(palika_df[palika_df['Office'] == office_name]['Palika'].unique())
+        palikas_count = palika_counts.get(office_name, 0)
 
         popup_html = f"""
         <div style="font-family: Arial; min-width: 220px;">
             <h4 style="color: {color}; margin-bottom: 10px;">{office_name}</h4>
             <b>Province:</b> {province}<br>
-            <b>Total Beneficiaries (2025):</b> {row['Beneficiaries']:,}<br>
+            <b>Total Beneficiaries ({year}):</b> {row['Beneficiaries']:,}<br>
             <b>Target:</b> {row['Target']:,}<br>
             <b>Achievement:</b> {row['Achievement']:.1f}%<br>
             <b>Palikas Covered:</b> {palikas_count}
@@ -730,36 +3006,1222 @@ def display_coming_soon(title: str):
     st.markdown("---")
     st.markdown("**Contact:** For more information, please contact the program team.")
 
+# ------------------------------------------------------------------------------
+# Palika Details tab (fragment: office filter / top-N changes rerun only this tab)
+# ------------------------------------------------------------------------------
+@st.fragment
+def display_palika_details(palika_df: pd.DataFrame, plot_df: pd.DataFrame, table_key: tuple, file_stub: str):
+    code = table_key[1]
+    st.subheader("🏘️ Palika-Level Beneficiary Details")
+    selected_office = st.selectbox("Filter by Field Office:", ["All Offices"] + list(plot_df['Office'].unique()))
+    filtered_palika_df = office_palika_rows(palika_df, table_key, selected_office)
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Palikas", len(filtered_palika_df))
+    with c2: st.metric("Total Beneficiaries", f"{filtered_palika_df['Beneficiaries'].sum():,}")
+    with c3:
+        avg_ben = int(filtered_palika_df['Beneficiaries'].mean()) if len(filtered_palika_df) > 0 else 0
+        st.metric("Avg per Palika", f"{avg_ben:,}")
+    with c4:
+        sel_ben = filtered_palika_df['Beneficiaries'].sum()
+        st.metric("Female / PWD share",
+                  f"{filtered_palika_df['Female'].sum() / sel_ben * 100:.1f}% / {filtered_palika_df['PWD'].sum() / sel_ben * 100:.1f}%" if sel_ben > 0 else "-")
+
+    st.markdown("---")
+    n, metric = render_top_n_controls([c for c in TOP_N_METRICS if c in palika_df.columns], key=f"palika_{code}")
+    st.markdown(f"**Top {n} Palikas by {metric}**")
+    top_n = palika_df.loc[top_palikas(palika_df, table_key, selected_office, metric, n)].copy()
+    if len(top_n) > 0:
+        top_n['Color'] = top_n['Office'].apply(lambda x: OFFICE_COORDINATES.get(x, {}).get('color', 'gray'))
+        fig3, ax3 = plt.subplots(figsize=(12, 6))
+        bars = ax3.barh(top_n['Palika'], top_n[metric], color=top_n['Color'], edgecolor='black')
+        ax3.set_xlabel('Achievement (%)' if metric == 'Achievement' else f'Total {metric}', fontsize=12, fontweight='bold')
+        ax3.invert_yaxis()
+        ax3.grid(axis='x', alpha=0.3)
+        palika_labels = [f"{r['Palika']} ({r['Office']})" for _, r in top_n.iterrows()]
+        ax3.set_yticks(list(range(len(palika_labels))))
+        ax3.set_yticklabels(palika_labels)
+        for b in bars:
+            w = b.get_width()
+            ax3.text(w, b.get_y() + b.get_height()/2., f'{w:.1f}%' if metric == 'Achievement' else f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
+        plt.tight_layout()
+        st.pyplot(fig3)
+    else:
+        st.info("선택된 조건에 해당하는 Palika 데이터가 없습니다.")
+
+    st.markdown("---")
+    st.markdown("**Complete Palika List**")
+    render_paged_table(palika_df, table_key, f"palika_list_{code}", office_palika_positions(palika_df, table_key, selected_office))
+    render_download(
+        "📥 Download Palika Data", {'Palika': filtered_palika_df}, (table_key, selected_office, scenario_key()),
+        f"palika_{file_stub}_{selected_office.replace(' ', '_') if selected_office!='All Offices' else 'all'}",
+    )
+
+# ------------------------------------------------------------------------------
+# Multi-year trend view
+# ------------------------------------------------------------------------------
+def display_disaggregation(ds: pd.DataFrame, mask, view_key: tuple, code: str, plot_df: pd.DataFrame, year: int):
+    """office별 Male/Female/PWD 세부 현황 + 세부값 합계 불일치 scheme 목록"""
+    st.subheader("👥 Gender & Disability Breakdown")
+    if code == '3.1.3':
+        st.caption("3.1.3 수혜자는 화장실 수 기반 추정치이므로 scheme별 Male/Female/PWD 비율로 배분한 값입니다.")
+    breakdown = plot_df[['Office'] + INDICATOR_VALUE_COLS].copy()
+    breakdown.loc[len(breakdown)] = ['TOTAL'] + [int(plot_df[c].sum()) for c in INDICATOR_VALUE_COLS]
+    base = breakdown['Beneficiaries'].where(breakdown['Beneficiaries'] > 0)
+    breakdown['Female %'] = (breakdown['Female'] / base * 100).round(1)
+    breakdown['PWD %'] = (breakdown['PWD'] / base * 100).round(1)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig, ax = plt.subplots(figsize=(8, 5))
+        ax.bar(plot_df['Office'], plot_df['Male'], label='Male', color='steelblue', edgecolor='black')
+        ax.bar(plot_df['Office'], plot_df['Female'], bottom=plot_df['Male'], label='Female', color='orchid', edgecolor='black')
+        ax.plot(plot_df['Office'], plot_df['PWD'], marker='D', color='darkorange', linewidth=0, label='PWD')
+        ax.set_ylabel('Beneficiaries', fontsize=12, fontweight='bold')
+        ax.legend(fontsize=10)
+        ax.grid(axis='y', alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig)
+    with col2:
+        st.dataframe(breakdown, use_container_width=True, hide_index=True)
+
+    if '_male' not in ds.columns:
+        st.info("ℹ️ Male/Female/PWD 컬럼이 없어 일치 여부를 점검할 수 없습니다.")
+        return
+    gaps = disaggregation_gaps(ds, mask, view_key, code, year)
+    if gaps.empty:
+        st.success("✅ 모든 scheme의 Male + Female 합계가 Total과 일치합니다.")
+        return
+    with st.expander(f"⚠️ 세부값이 Total과 맞지 않는 scheme {len(gaps):,}개", expanded=False):
+        render_paged_table(gaps, ('disagg_gaps', view_key, code, year), f"disagg_gaps_{code}_table")
+        render_download(
+            "📥 Download Inconsistent Schemes", {'Gaps': gaps}, ('disagg_gaps', view_key, code, year),
+            f"disaggregation_gaps_{code}_{year}", key=f"disagg_gaps_{code}",
+        )
+
+def display_year_trend(ds: pd.DataFrame, mask, view_key: tuple, code: str, title: str):
+    unit = INDICATOR_UNITS.get(code, 'Beneficiaries')
+    st.title(f"💧 WASH Program Dashboard - {title}")
+    st.markdown("### Multi-year Trend by Field Office")
+    st.markdown("---")
+
+    trend = build_year_trend(ds, mask, view_key, code)
+    trend = (trend * scenario_multiplier(code)).round().astype(int)
+    if trend.empty:
+        st.warning("⚠️ 연도별 추이를 계산할 데이터가 없습니다.")
+        return
+
+    # 연도별 target (연도 지정 target이 없으면 공통 target)
+    targets = pd.DataFrame({y: office_targets(code, y) for y in trend.columns})
+    if targets.empty:  # target이 없는 지표 → 데이터에 있는 office만 표시
+        targets = pd.DataFrame(0.0, index=trend.index, columns=trend.columns)
+    trend = trend.reindex(targets.index, fill_value=0).rename_axis('Office')
+    achievement = trend.div(targets.where(targets > 0)).mul(100).fillna(0)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(f"📈 {unit} by Year")
+        fig1, ax1 = plt.subplots(figsize=(8, 6))
+        for office, row in trend.iterrows():
+            ax1.plot(row.index.astype(str), row.values, marker='o', linewidth=2,
+                     color=OFFICE_COORDINATES.get(office, {}).get('color', '#888888'), label=office)
+        ax1.set_xlabel('Reporting Year', fontsize=12, fontweight='bold')
+        ax1.set_ylabel(f'Total {unit}', fontsize=12, fontweight='bold')
+        ax1.legend(fontsize=10)
+        ax1.grid(alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig1)
+    with col2:
+        st.subheader("🎯 Achievement by Year (%)")
+        if not (targets > 0).any().any():
+            st.info(f"ℹ️ {TARGETS_PATH}에 {code} target이 없어 달성률을 표시하지 않습니다.")
+        else:
+            fig2, ax2 = plt.subplots(figsize=(8, 6))
+            for office, row in achievement.iterrows():
+                ax2.plot(row.index.astype(str), row.values, marker='o', linewidth=2,
+                         color=OFFICE_COORDINATES.get(office, {}).get('color', '#888888'), label=office)
+            ax2.axhline(100, color='gray', linestyle='--', linewidth=1)
+            ax2.set_xlabel('Reporting Year', fontsize=12, fontweight='bold')
+            ax2.set_ylabel('Achievement (%)', fontsize=12, fontweight='bold')
+            ax2.legend(fontsize=10)
+            ax2.grid(alpha=0.3)
+            plt.tight_layout()
+            st.pyplot(fig2)
+
+    st.subheader(f"📋 {unit} by Office and Year")
+    table = trend.copy()
+    table.loc['TOTAL'] = table.sum()
+    table.columns = table.columns.astype(str)
+    st.dataframe(table.reset_index(), use_container_width=True, hide_index=True)
+
+# ------------------------------------------------------------------------------
+# Geographic drill-down view
+# ------------------------------------------------------------------------------
+def display_geo_drilldown(ds: pd.DataFrame, mask, view_key: tuple, code: str, title: str, year: int = DEFAULT_REPORTING_YEAR):
+    unit = INDICATOR_UNITS.get(code, 'Beneficiaries')
+    st.title(f"💧 WASH Program Dashboard - {title}")
+    st.markdown(f"### Geographic Drill-down (Province → District → Palika → Ward → Community) ({year})")
+    st.markdown("---")
+
+    hierarchy = build_geo_hierarchy(ds, mask, view_key, year)
+    levels = hierarchy['levels']
+    if not levels or code not in hierarchy['total']:
+        st.warning("⚠️ 드릴다운에 필요한 지역 컬럼 또는 지표 데이터가 없습니다.")
+        return
+
+    # Breadcrumb selections: 각 단계는 부모 경로로 자식 소계를 바로 조회
+    path = ()
+    cols = st.columns(len(levels))
+    for depth, lvl in enumerate(levels[:-1]):
+        options = list(hierarchy['children'][depth].get(path, pd.DataFrame()).index)
+        with cols[depth]:
+            choice = st.selectbox(lvl, ["(All)"] + options)
+        if choice == "(All)":
+            break
+        path += (choice,)
+
+    node = hierarchy['total'] if not path else hierarchy['children'][len(path) - 1][path[:-1]].loc[path[-1]]
+    node = scale_indicator_columns(node)
+    children = scale_indicator_columns(hierarchy['children'][len(path)].get(path, pd.DataFrame()))
+    child_level = levels[len(path)]
+
+    st.markdown(f"**📍 {' › '.join(('Nepal',) + path)}**")
+    c1, c2, c3 = st.columns(3)
+    with c1: st.metric(INDICATOR_NAMES[code] if code in INDICATOR_UNITS else f"{code} {unit}", f"{int(round(node[code])):,}")
+    with c2: st.metric("Schemes", f"{int(node['Schemes']):,}")
+    with c3: st.metric(f"{child_level} count", f"{len(children):,}")
+
+    if children.empty:
+        return
+
+    st.markdown("---")
+    st.markdown(f"**{child_level} subtotals ({code} {INDICATOR_NAMES[code]})**")
+    ordered = children.sort_values(code, ascending=False)
+    top = ordered.head(15)
+    if top[code].sum() > 0:
+        fig, ax = plt.subplots(figsize=(12, max(3, 0.4 * len(top))))
+        bars = ax.barh([str(i) for i in top.index], top[code], color='#0088FE', edgecolor='black')
+        ax.set_xlabel(unit, fontsize=12, fontweight='bold')
+        ax.invert_yaxis()
+        ax.grid(axis='x', alpha=0.3)
+        for b in bars:
+            w = b.get_width()
+            ax.text(w, b.get_y() + b.get_height()/2., f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
+        plt.tight_layout()
+        st.pyplot(fig)
+
+    table = ordered.reset_index().rename(columns={'index': child_level})
+    table = table[[child_level, 'Schemes'] + [c for c in INDICATOR_NAMES if c in table.columns]]
+    for c in INDICATOR_NAMES:
+        if c in table.columns:
+            table[c] = table[c].round().astype(int)
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+# ------------------------------------------------------------------------------
+# Facility indicators view: 3.1.4 Schools with WASH / HCFs with WASH
+# ------------------------------------------------------------------------------
+@st.fragment
+def display_facility_palika_details(palika_df: pd.DataFrame, plot_df: pd.DataFrame, table_key: tuple, unit: str):
+    """시설 지표 Palika Details: office 필터/Top-N 변경은 이 fragment만 다시 실행"""
+    code, year = table_key[1], table_key[2]
+    selected_office = st.selectbox("Filter by Field Office:", ["All Offices"] + list(plot_df['Office'].unique()), key=f"facility_office_{code}")
+    filtered = office_palika_rows(palika_df, table_key, selected_office)
+
+    c1, c2, c3 = st.columns(3)
+    with c1: st.metric("Palikas", len(filtered))
+    with c2: st.metric(f"Total {unit}", f"{int(filtered[unit].sum()):,}")
+    with c3: st.metric("Avg per Palika", f"{filtered[unit].mean():.1f}" if len(filtered) else "0")
+
+    n, metric = render_top_n_controls([unit] + (['Achievement'] if 'Achievement' in palika_df.columns else []), key=f"facility_{code}")
+    top_n = palika_df.loc[top_palikas(palika_df, table_key, selected_office, metric, n)]
+    if len(top_n) > 0:
+        fig2, ax2 = plt.subplots(figsize=(12, 6))
+        colors = [OFFICE_COORDINATES.get(o, {}).get('color', 'gray') for o in top_n['Office']]
+        bars = ax2.barh([f"{r['Palika']} ({r['Office']})" for _, r in top_n.iterrows()], top_n[metric], color=colors, edgecolor='black')
+        ax2.set_xlabel(metric, fontsize=12, fontweight='bold')
+        ax2.invert_yaxis()
+        ax2.grid(axis='x', alpha=0.3)
+        for b in bars:
+            w = b.get_width()
+            ax2.text(w, b.get_y() + b.get_height()/2., f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
+        plt.tight_layout()
+        st.pyplot(fig2)
+    else:
+        st.info("선택된 조건에 해당하는 Palika 데이터가 없습니다.")
+
+    st.markdown("**Complete Palika List**")
+    render_paged_table(palika_df, table_key, f"palika_list_{code}", office_palika_positions(palika_df, table_key, selected_office))
+    render_download(
+        "📥 Download Palika Data", {'Palika': filtered}, (table_key, selected_office),
+        f"palika_{unit.lower()}_{selected_office.replace(' ', '_') if selected_office != 'All Offices' else 'all'}_{year}",
+    )
+
+def display_facility_indicator(ds: pd.DataFrame, mask, view_key: tuple, code: str, year: int):
+    """시설 수 지표 페이지: 다른 지표와 같은 indicator_tables 캐시를 사용 (세부값/시나리오 없음)"""
+    unit = INDICATOR_UNITS[code]
+    title = INDICATOR_NAMES[code]
+    icon = "🏫" if code == '3.1.4' else "🏥"
+    plot_df, palika_df = indicator_tables(ds, mask, view_key, code, year, targets_version())
+    plot_df = plot_df.drop(columns=list(DISAGG_COLUMNS)).rename(columns={'Beneficiaries': unit})
+    palika_df = palika_df.drop(columns=list(DISAGG_COLUMNS)).rename(columns={'Beneficiaries': unit})
+    palika_df = palika_df[palika_df[unit] > 0]
+    has_targets = bool((plot_df['Target'] > 0).any())
+    if not has_targets:
+        plot_df = plot_df.drop(columns=['Target', 'Achievement'])
+
+    view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🏘️ Palika Details", "🌳 Geographic Drill-down", "📈 Multi-year Trend"], horizontal=True)
+    st.markdown("---")
+
+    if view_mode == "🌳 Geographic Drill-down":
+        display_geo_drilldown(ds, mask, view_key, code, title, year)
+        return
+    if view_mode == "📈 Multi-year Trend":
+        display_year_trend(ds, mask, view_key, code, title)
+        return
+
+    total = int(plot_df[unit].sum())
+    if total == 0:
+        st.warning(f"⚠️ 'Completed Projects', 'Year {year}' 조건을 만족하는 {unit} 데이터가 없습니다.")
+
+    if view_mode == "📊 Office Summary Dashboard":
+        st.title(f"{icon} WASH Program Dashboard - {title}")
+        st.markdown(f"### {unit} benefitted by Field Office ({year})")
+        st.markdown("---")
+
+        c1, c2, c3, c4 = st.columns(4)
+        with c1: st.metric(f"Total {unit}", f"{total:,}")
+        with c2: st.metric("Offices Reporting", f"{int((plot_df[unit] > 0).sum())}")
+        with c3: st.metric("Palikas Reached", f"{palika_df['Palika'].nunique():,}")
+        with c4:
+            if has_targets:
+                target = int(plot_df['Target'].sum())
+                st.metric("Overall Achievement", f"{total / target * 100:.1f}%" if target > 0 else "—")
+            else:
+                st.metric("Overall Achievement", "—")
+
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader(f"📊 {unit} by Office")
+            fig1, ax1 = plt.subplots(figsize=(8, 6))
+            colors = [OFFICE_COORDINATES.get(o, {}).get('color', '#888888') for o in plot_df['Office']]
+            bars = ax1.bar(plot_df['Office'], plot_df[unit], color=colors, edgecolor='black', linewidth=1.5)
+            if has_targets:
+                ax1.scatter(plot_df['Office'], plot_df['Target'], marker='_', s=900, color='red', linewidths=3, label='Target', zorder=3)
+                ax1.legend(fontsize=10)
+            ax1.set_xlabel('Field Office', fontsize=12, fontweight='bold')
+            ax1.set_ylabel(unit, fontsize=12, fontweight='bold')
+            ax1.grid(axis='y', alpha=0.3)
+            for b in bars:
+                h = b.get_height()
+                ax1.text(b.get_x() + b.get_width()/2., h, f'{int(h):,}', ha='center', va='bottom', fontsize=10, fontweight='bold')
+            plt.tight_layout()
+            st.pyplot(fig1)
+        with col2:
+            st.subheader("📋 Summary Table")
+            summary_df = plot_df.copy()
+            summary_df.loc[len(summary_df)] = ['TOTAL'] + [
+                summary_df[c].sum() if c != 'Achievement' else (total / summary_df['Target'].sum() * 100 if summary_df['Target'].sum() > 0 else 0.0)
+                for c in summary_df.columns[1:]
+            ]
+            if has_targets:
+                summary_df['Achievement'] = summary_df['Achievement'].apply(lambda x: f"{x:.1f}%")
+            st.dataframe(summary_df, use_container_width=True, hide_index=True)
+            render_download(
+                "📥 Download Office Data", {'Office': plot_df, 'Palika': palika_df},
+                ('facility', view_key, code, year, targets_version()), f"wash_{unit.lower()}_office_{year}",
+            )
+        if not has_targets:
+            st.caption(f"ℹ️ {TARGETS_PATH}에 indicator='{code}' 행을 추가하면 Target / Achievement가 표시됩니다.")
+
+    elif view_mode == "🏘️ Palika Details":
+        st.title(f"{icon} WASH Program Dashboard - {title}")
+        st.markdown(f"### Palika-level {unit} ({year})")
+        st.markdown("---")
+
+        table_key = (view_key, code, year, targets_version(), unit)  # 시설 표는 파생 표(값>0, 컬럼명 변경)라 키를 구분
+        display_facility_palika_details(palika_df, plot_df, table_key, unit)
+    st.caption(f"집계 기준: Progress = Completed 이고 Water supply beneficiaries reporting year = {year} 인 scheme의 '{unit}' 수 합계")
+
+# ------------------------------------------------------------------------------
+# End-year progress: indicator × office achievement matrix
+# ------------------------------------------------------------------------------
+def display_progress_matrix(ds: pd.DataFrame, mask, view_key: tuple, year: int):
+    st.title("🎯 End Year Progress against Annual target")
+    st.markdown(f"### Achievement vs target — all indicators × field offices ({year})")
+    st.markdown("---")
+
+    matrix = progress_matrix(ds, mask, view_key, year, targets_version())
+    # What-if 배율은 캐시된 결과에만 적용
+    m = matrix['Indicator'].map(scenario_multiplier)
+    matrix['Achieved'] = (matrix['Achieved'] * m).round()
+    matrix['Achievement'] = matrix['Achieved'] / matrix['Target'].where(matrix['Target'] > 0) * 100
+    matrix['History'] = [h if h is None else [round(v * k) for v in h] for h, k in zip(matrix['History'], m)]
+
+    achievement = matrix['Achievement'].dropna()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Cells with Target", f"{len(achievement)} / {len(matrix)}")
+    with c2: st.metric("On Track (≥100%)", f"{int((achievement >= 100).sum())}")
+    with c3: st.metric("Below 50%", f"{int((achievement < 50).sum())}")
+    with c4: st.metric("Median Achievement", f"{achievement.median():.1f}%" if len(achievement) else "—")
+
+    labels = [f"{c} {INDICATOR_NAMES.get(c, PENDING_INDICATORS.get(c, ''))}" for c in PROGRESS_INDICATORS]
+    offices = list(dict.fromkeys(matrix['Office']))
+    grid = matrix.set_index(['Indicator', 'Office'])
+    pct = grid['Achievement'].unstack().reindex(index=PROGRESS_INDICATORS, columns=offices)
+    done = grid['Achieved'].unstack().reindex(index=PROGRESS_INDICATORS, columns=offices)
+
+    st.subheader("🗺️ Achievement Matrix (%)")
+    fig, ax = plt.subplots(figsize=(12, 0.7 * len(pct) + 2))
+    im = ax.imshow(np.ma.masked_invalid(pct.clip(upper=150).to_numpy(dtype=float)), cmap='RdYlGn', vmin=0, vmax=150)
+    ax.set_facecolor('#EEEEEE')
+    ax.set_xticks(range(len(offices)), labels=offices)
+    ax.set_yticks(range(len(labels)), labels=labels)
+    for i in range(len(pct.index)):
+        for j in range(len(offices)):
+            p, v = pct.iat[i, j], done.iat[i, j]
+            text = "—" if pd.isna(v) else (f"{p:.0f}%\n{int(v):,}" if pd.notna(p) else f"{int(v):,}")
+            ax.text(j, i, text, ha='center', va='center', fontsize=9, fontweight='bold')
+    fig.colorbar(im, ax=ax, shrink=0.8, label='Achievement (%)')
+    plt.tight_layout()
+    st.pyplot(fig)
+
+    st.subheader("📋 Progress by Indicator and Office")
+    table = matrix.copy()
+    table.insert(1, 'Name', table['Indicator'].map(lambda c: INDICATOR_NAMES.get(c, PENDING_INDICATORS.get(c))))
+    table.insert(3, 'Unit', table['Indicator'].map(lambda c: INDICATOR_UNITS.get(c, 'Beneficiaries')))
+    st.dataframe(
+        table, use_container_width=True, hide_index=True,
+        column_config={
+            'Achieved': st.column_config.NumberColumn(format="%d"),
+            'Target': st.column_config.NumberColumn(format="%d"),
+            'Achievement': st.column_config.ProgressColumn("Achievement (%)", format="%.1f%%", min_value=0, max_value=100),
+            'History': st.column_config.LineChartColumn(f"History (→ {year})"),
+        },
+    )
+    pending = ", ".join(f"{c} {n}" for c, n in PENDING_INDICATORS.items())
+    st.caption(f"한 번의 집계(지표 × office × 연도)에서 만든 행렬 · target: {TARGETS_PATH} · "
+               f"{pending}: 아직 데이터 소스가 없어 빈 행으로 표시")
+
+# ------------------------------------------------------------------------------
+# Office pages: progress against annual target (office slice)
+# ------------------------------------------------------------------------------
+def display_office_progress(ds: pd.DataFrame, mask, view_key: tuple, office: str, year: int):
+    st.title(f"🏢 {office} Field Office - Progress against Annual target")
+    st.markdown(f"### All indicators and palika breakdown ({year})")
+    st.markdown("---")
+
+    pos = build_office_partitions(ds, view_key[0]).get(office)
+    if pos is None or len(pos) == 0:
+        st.warning(f"⚠️ {office} office 데이터가 없습니다.")
+        return
+    part = office_slice(ds, view_key[0], office)
+    part_mask = None if mask is None else mask[pos]
+
+    rows, palikas, missing = [], {}, []
+    for code in INDICATOR_NAMES:
+        try:
+            row, palika_df = apply_scenario(*office_indicator_tables(part, part_mask, view_key, office, code, year, targets_version()), code)
+        except KeyError:
+            missing.append(code)
+            continue
+        rows.append(row.assign(Indicator=code))
+        palikas[code] = palika_df
+    if not rows:
+        st.warning("⚠️ 지표 계산에 필요한 컬럼이 없습니다.")
+        return
+    summary = pd.concat(rows, ignore_index=True)
+    summary.insert(0, 'Name', summary['Indicator'].map(INDICATOR_NAMES))
+    summary.insert(1, 'Unit', summary['Indicator'].map(lambda c: INDICATOR_UNITS.get(c, 'Beneficiaries')))
+    summary = summary.set_index('Indicator')
+
+    cols = st.columns(len(summary))
+    for col, (code, r) in zip(cols, summary.iterrows()):
+        with col:
+            st.metric(r['Name'] if code in FACILITY_COLUMNS else f"{code} {r['Unit']}", f"{int(r['Beneficiaries']):,}",
+                      f"{r['Achievement']:.1f}% of {int(r['Target']):,}" if r['Target'] > 0 else None, delta_color="off")
+
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    color = OFFICE_COORDINATES.get(office, {}).get('color', '#888888')
+    with col1:
+        st.subheader("🎯 Achievement by Indicator (%)")
+        targeted = summary[summary['Target'] > 0]
+        if targeted.empty:
+            st.info(f"ℹ️ {TARGETS_PATH}에 {office} target이 없습니다.")
+        else:
+            fig1, ax1 = plt.subplots(figsize=(8, 6))
+            labels = [f"{c} {n}" for c, n in zip(targeted.index, targeted['Name'])]
+            bars = ax1.barh(labels, targeted['Achievement'], color=color, edgecolor='black', linewidth=1.5)
+            ax1.axvline(100, color='gray', linestyle='--', linewidth=1)
+            ax1.invert_yaxis()
+            ax1.set_xlabel('Achievement (%)', fontsize=12, fontweight='bold')
+            ax1.grid(axis='x', alpha=0.3)
+            for b in bars:
+                w = b.get_width()
+                ax1.text(w, b.get_y() + b.get_height()/2., f' {w:.1f}%', va='center', fontsize=10, fontweight='bold')
+            plt.tight_layout()
+            st.pyplot(fig1)
+    with col2:
+        st.subheader("📋 Indicator Summary")
+        table = summary.drop(columns='Office').reset_index()
+        table['Achievement'] = table['Achievement'].map(lambda x: f"{x:.1f}%").where(table['Target'] > 0, "—")
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
+    st.subheader(f"🏘️ {office} Palikas - All Indicators")
+    keys = ['Palika', 'District']
+    wide = None
+    for code, palika_df in palikas.items():
+        part_df = palika_df[keys + ['Beneficiaries']].rename(columns={'Beneficiaries': code})
+        wide = part_df if wide is None else wide.merge(part_df, on=keys, how='outer')
+    codes = list(palikas)
+    wide[codes] = wide[codes].fillna(0).astype(int)
+    wide = wide.sort_values(codes, ascending=False).reset_index(drop=True)
+    c1, c2, c3 = st.columns(3)
+    with c1: st.metric("Palikas", f"{wide['Palika'].nunique():,}")
+    with c2: st.metric("Districts", f"{wide['District'].nunique():,}")
+    with c3: st.metric("Scheme Rows", f"{len(part):,}")
+
+    code = st.selectbox("Top palikas by indicator:", codes, format_func=lambda c: f"{c} {INDICATOR_NAMES[c]}", key=f"office_top_{office}")
+    top = wide.nlargest(10, code)
+    top = top[top[code] > 0]
+    if not top.empty:
+        fig2, ax2 = plt.subplots(figsize=(12, 5))
+        ax2.barh(top['Palika'], top[code], color=color, edgecolor='black')
+        ax2.invert_yaxis()
+        ax2.set_xlabel(f"{INDICATOR_UNITS.get(code, 'Beneficiaries')}", fontsize=12, fontweight='bold')
+        ax2.grid(axis='x', alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig2)
+    st.dataframe(wide, use_container_width=True, hide_index=True)
+    render_download(
+        "📥 Download Palika Data", {'Palika progress': wide, 'Office summary': summary.reset_index()},
+        ('office_progress', view_key, office, year, targets_version(), scenario_key()), f"{office.lower()}_palika_progress_{year}",
+    )
+    if missing:
+        st.info(f"ℹ️ 필요한 컬럼이 없어 제외된 지표: {', '.join(missing)}")
+    st.caption(f"{office} office 행 {len(part):,}개만 사용 (데이터셋 버전당 한 번 분할) · "
+               f"{', '.join(f'{c} {n}' for c, n in PENDING_INDICATORS.items())}: 아직 데이터 소스 없음")
+
+# ------------------------------------------------------------------------------
+# 3.2 Palika scorecards (LGPAS governance / all-indicator composite)
+# ------------------------------------------------------------------------------
+def display_palika_scorecard(ds: pd.DataFrame, mask, view_key: tuple, year: int, page: str):
+    lgpas = page == "LGPAS"
+    if lgpas:
+        st.title("🏛️ LGPAS - Palika Governance Scorecard")
+        st.markdown("### Share of schemes with each local-government mechanism in place (Yes / answered)")
+    else:
+        st.title("🏘️ Palika Scorecard")
+        st.markdown(f"### Indicators ({year}), governance, cost per capita and composite score for every palika")
+    st.markdown("---")
+
+    card = build_palika_scorecard(ds, mask, view_key, year)
+    if card.empty:
+        st.warning("⚠️ palika 데이터가 없습니다.")
+        return
+    score, rank, percentile = ('LGPAS score', 'LGPAS rank', 'LGPAS percentile') if lgpas else ('Composite score', 'Rank', 'Percentile')
+    flags = [f for f in SCORECARD_FLAGS if f in card.columns]
+    codes = [c for c in INDICATOR_NAMES if c in card.columns]
+
+    best = card.loc[card[score].idxmax()] if card[score].notna().any() else None
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Palikas Scored", f"{int(card[score].notna().sum()):,} / {len(card):,}")
+    with c2: st.metric(f"Median {score}", f"{card[score].median():.1f}")
+    with c3: st.metric("Top Palika", best['Palika'] if best is not None else "—", f"{best[score]:.1f}" if best is not None else None, delta_color="off")
+    if lgpas:
+        with c4: st.metric("All Mechanisms in Place", f"{int((card[score] >= 100).sum()):,}")
+    else:
+        with c4: st.metric("Median Cost per Capita", f"NPR {card[SCORECARD_COST_COL].median():,.0f}" if card[SCORECARD_COST_COL].notna().any() else "—")
+
+    # 검색/정렬은 캐시된 palika 테이블 위에서만 (행 수 = palika 수)
+    columns = ([rank, 'Palika', 'District', 'Office', 'Schemes'] + flags + [score, percentile] if lgpas else
+               [rank, 'Palika', 'District', 'Office', 'Province', 'Schemes'] + codes + ['LGPAS score', SCORECARD_COST_COL, score, percentile])
+    c1, c2, c3, c4 = st.columns([3, 2, 2, 1])
+    with c1:
+        query = st.text_input("🔍 Search palika / district", key=f"scorecard_search_{page}")
+    with c2:
+        office = st.selectbox("Office", ["All Offices"] + [o for o in OFFICE_NAMES.values() if o in set(card['Office'])], key=f"scorecard_office_{page}")
+    with c3:
+        sort_by = st.selectbox("Sort by", [score] + [c for c in columns if c not in (score, rank)], key=f"scorecard_sort_{page}")
+    with c4:
+        ascending = st.checkbox("Ascending", key=f"scorecard_asc_{page}")
+    view = card
+    if office != "All Offices":
+        view = view[view['Office'] == office]
+    if query.strip():
+        view = view[view['_search'].str.contains(query.strip().casefold(), regex=False)]
+    view = view.sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+    scaled = [c for c in codes if scenario_multiplier(c) != 1.0]
+    if scaled:
+        view = view.copy()
+        for c in scaled:
+            view[c] = (view[c] * scenario_multiplier(c)).round().astype(int)
+    st.caption(f"{len(view):,} palikas")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(f"🏆 Top 15 by {score}")
+        top = view.nlargest(15, score)
+        if top.empty:
+            st.info("표시할 palika가 없습니다.")
+        else:
+            fig1, ax1 = plt.subplots(figsize=(8, 6))
+            colors = [OFFICE_COORDINATES.get(o, {}).get('color', '#888888') for o in top['Office']]
+            ax1.barh(top['Palika'], top[score], color=colors, edgecolor='black')
+            ax1.invert_yaxis()
+            ax1.set_xlim(0, 100)
+            ax1.set_xlabel(score, fontsize=12, fontweight='bold')
+            ax1.grid(axis='x', alpha=0.3)
+            plt.tight_layout()
+            st.pyplot(fig1)
+    with col2:
+        st.subheader("🔬 Palika Profile")
+        if view.empty:
+            st.info("표시할 palika가 없습니다.")
+        else:
+            choice = st.selectbox("Palika", view.index, format_func=lambda i: f"{view.at[i, 'Palika']} ({view.at[i, 'District']})", key=f"scorecard_palika_{page}")
+            row = view.loc[choice]
+            parts = flags if lgpas else [c for c in SCORECARD_WEIGHTS if f"_pct {c}" in card.columns]
+            values = [row[p] if lgpas else row[f"_pct {p}"] for p in parts]
+            fig2, ax2 = plt.subplots(figsize=(8, 6))
+            ax2.barh(parts, values, color=OFFICE_COORDINATES.get(row['Office'], {}).get('color', '#888888'), edgecolor='black')
+            ax2.invert_yaxis()
+            ax2.set_xlim(0, 100)
+            ax2.set_xlabel('Yes share (%)' if lgpas else 'Percentile among palikas', fontsize=12, fontweight='bold')
+            ax2.set_title(f"{row['Palika']} · rank {row[rank] if pd.notna(row[rank]) else '—'} / {len(card)}", fontsize=13, fontweight='bold')
+            ax2.grid(axis='x', alpha=0.3)
+            plt.tight_layout()
+            st.pyplot(fig2)
+
+    st.subheader("📋 Scorecard")
+    pct_col = lambda label: st.column_config.ProgressColumn(label, format="%.0f", min_value=0, max_value=100)
+    st.dataframe(
+        view[columns], use_container_width=True, hide_index=True,
+        column_config={**{f: pct_col(f"{f} (%)") for f in flags}, score: pct_col(score), 'LGPAS score': pct_col('LGPAS score')},
+    )
+    render_download(
+        "📥 Download Scorecard", {'Scorecard': view[columns]},
+        ('scorecard', view_key, year, page, office, query, sort_by, ascending, scenario_key()),
+        f"palika_scorecard_{'lgpas' if lgpas else year}",
+    )
+    if lgpas:
+        st.caption("LGPAS score = 항목별 Yes 비율의 평균 (Yes/No 응답 scheme 기준) · 순위는 점수 내림차순")
+    else:
+        st.caption("Composite score = " + " · ".join(f"{c}×{w:g}" for c, w in SCORECARD_WEIGHTS.items())
+                   + " 의 palika 간 percentile 가중 평균 (1인당 비용은 낮을수록 높은 percentile, 값이 없는 항목은 제외)")
+
+# ------------------------------------------------------------------------------
+# Program analytics: JMP ladder transition heatmap
+# ------------------------------------------------------------------------------
+def display_jmp_transitions(ds: pd.DataFrame, mask, view_key: tuple, year: int = DEFAULT_REPORTING_YEAR):
+    st.title("🪜 JMP Service Ladder Transitions")
+    st.markdown("### JMP service ladder - start × finish (수혜 인구 가중)")
+    st.markdown("---")
+
+    cube = build_jmp_cube(ds, mask, view_key)
+    if cube.empty:
+        st.warning("⚠️ JMP service ladder - start / finish 데이터가 없습니다.")
+        return
+
+    offices = cube.index.get_level_values('_office')
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        office = st.selectbox("Office", ["All Offices"] + [o for o in OFFICE_NAMES.values() if o in set(offices)], key="jmp_office")
+    office = None if office == "All Offices" else office
+    with col2:
+        palikas = cube.index.get_level_values('_palika')
+        if office is not None:
+            palikas = palikas[offices == office]
+        palika = st.selectbox("Palika", ["All Palikas"] + sorted(p for p in set(palikas) if p), key="jmp_palika")
+    palika = None if palika == "All Palikas" else palika
+    with col3:
+        years = sorted({int(y) for y in cube.index.get_level_values('_ws_year') if pd.notna(y)}, reverse=True)
+        options = ["All years"] + years
+        choice = st.selectbox("Water supply year", options, index=options.index(year) if year in options else 0, key="jmp_year")
+    year_value = None if choice == "All years" else float(choice)
+    with col4:
+        weight = st.radio("Weight", ["Beneficiaries", "Schemes"], horizontal=True, key="jmp_weight")
+        normalize = st.checkbox("Row %", key="jmp_row_pct", help="각 start 단계 안에서 finish 단계 비율")
+
+    matrix = jmp_transition_matrix(cube, weight, office, palika, year_value)
+    total = matrix.to_numpy().sum()
+    if total == 0:
+        st.info("선택한 조건에 해당하는 데이터가 없습니다.")
+        return
+    # 상승/유지/하락은 사다리 단계끼리만 비교 (Other 제외)
+    ranked = matrix.drop(index='Other', columns='Other', errors='ignore').to_numpy()
+    rank = np.arange(len(ranked))
+    up = ranked[rank[:, None] < rank[None, :]].sum()
+    same = np.trace(ranked)
+    down = ranked[rank[:, None] > rank[None, :]].sum()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric(f"Total {weight.lower()}", f"{int(total):,}")
+    with c2: st.metric("Moved up the ladder", f"{up / total * 100:.1f}%")
+    with c3: st.metric("No change", f"{same / total * 100:.1f}%")
+    with c4: st.metric("Moved down", f"{down / total * 100:.1f}%")
+
+    shown = matrix.div(matrix.sum(axis=1).where(lambda x: x > 0), axis=0).fillna(0) * 100 if normalize else matrix
+    fig, ax = plt.subplots(figsize=(10, 0.9 * len(matrix) + 2))
+    im = ax.imshow(shown.to_numpy(), cmap='Blues')
+    ax.set_xticks(range(len(shown.columns)), labels=shown.columns, rotation=30, ha='right')
+    ax.set_yticks(range(len(shown.index)), labels=shown.index)
+    ax.set_xlabel('Finish', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Start', fontsize=12, fontweight='bold')
+    threshold = shown.to_numpy().max() / 2
+    for i in range(len(shown.index)):
+        for j in range(len(shown.columns)):
+            v = shown.iat[i, j]
+            if v:
+                ax.text(j, i, f"{v:.0f}%" if normalize else f"{int(v):,}", ha='center', va='center',
+                        fontsize=9, fontweight='bold', color='white' if v > threshold else 'black')
+    fig.colorbar(im, ax=ax, shrink=0.8)
+    plt.tight_layout()
+    st.pyplot(fig)
+
+    st.dataframe(matrix.reset_index(), use_container_width=True, hide_index=True)
+    st.caption("단계 순서: " + " → ".join(JMP_LADDER) + " · 표기가 다른 값은 가장 가까운 단계로 매칭 (실패 시 Other)")
+
+# ------------------------------------------------------------------------------
+# Program analytics: WSP step funnel
+# ------------------------------------------------------------------------------
+def display_wsp_funnel(ds: pd.DataFrame, mask, view_key: tuple):
+    st.title("🛡️ Water Safety Plan Step Funnel")
+    st.markdown("### WSP 단계별 완료 scheme / 수혜 인구 (Team formation → Documentation)")
+    st.markdown("---")
+
+    funnel = build_wsp_funnel(ds, mask, view_key)
+    if funnel.empty:
+        st.warning("⚠️ WSP 단계 컬럼 데이터가 없습니다.")
+        return
+    steps = list(funnel['done'].columns)
+
+    col1, col2, col3 = st.columns(3)
+    offices = funnel.index.get_level_values('Office')
+    with col1:
+        office = st.selectbox("Office", ["All Offices"] + [o for o in OFFICE_NAMES.values() if o in set(offices)], key="wsp_office")
+    sub = funnel if office == "All Offices" else funnel.xs(office, level='Office', drop_level=False)
+    with col2:
+        palikas = sorted(p for p in set(sub.index.get_level_values('Palika')) if p)
+        palika = st.selectbox("Palika", ["All Palikas"] + palikas, key="wsp_palika")
+    if palika != "All Palikas":
+        sub = sub.xs(palika, level='Palika', drop_level=False)
+    with col3:
+        measure = st.radio("Measure", ["Schemes", "Beneficiaries"], horizontal=True, key="wsp_measure")
+
+    totals = sub.sum()
+    suffix = '' if measure == "Schemes" else '_ben'
+    base = totals[(measure, '')]
+    done = totals[f'done{suffix}'].reindex(steps)
+    reached = totals[f'reached{suffix}'].reindex(steps)
+    if base == 0:
+        st.info("선택한 조건에 해당하는 데이터가 없습니다.")
+        return
+    drops = (reached.shift(1, fill_value=base) - reached)
+    c1, c2, c3 = st.columns(3)
+    with c1: st.metric(f"{measure} with WSP data", f"{int(base):,}")
+    with c2: st.metric("Completed every step", f"{reached.iloc[-1] / base * 100:.1f}%")
+    with c3:
+        if drops.max() > 0:
+            st.metric("Largest drop-off", f"{drops.idxmax()}", f"-{drops.max() / base * 100:.1f}%p", delta_color="inverse")
+        else:
+            st.metric("Largest drop-off", "—")
+
+    fig, ax = plt.subplots(figsize=(12, 0.5 * len(steps) + 1.5))
+    y = np.arange(len(steps))
+    ax.barh(y, done, color='#C6DBEF', edgecolor='black', label='Step done (any order)')
+    bars = ax.barh(y, reached, color='#0088FE', edgecolor='black', label='Reached (all previous steps done)')
+    ax.set_yticks(y, labels=steps)
+    ax.invert_yaxis()
+    ax.set_xlabel(measure, fontsize=12, fontweight='bold')
+    ax.grid(axis='x', alpha=0.3)
+    ax.legend(fontsize=10, loc='lower right')
+    for b, d in zip(bars, done):
+        ax.text(d, b.get_y() + b.get_height()/2., f' {int(b.get_width()):,} / {int(d):,}', ha='left', va='center', fontsize=9)
+    plt.tight_layout()
+    st.pyplot(fig)
+
+    level = 'Palika' if office != "All Offices" else 'Office'
+    grouped = sub.groupby(level=level).sum()
+    table = (grouped[f'done{suffix}'].div(grouped[(measure, '')].where(lambda x: x > 0), axis=0) * 100).round(1)
+    table.insert(0, measure, grouped[(measure, '')].round().astype(int))
+    st.markdown(f"**Step completion by {level} (% of {measure.lower()} with WSP data)**")
+    st.dataframe(table.reset_index(), use_container_width=True, hide_index=True)
+    st.caption("완료 기준: Yes/Y 또는 done/completed/rehab/repair/upgrade/new 응답 · Progress 컬럼(공사 진행 상태)은 WSP 단계에서 제외")
+
+# ------------------------------------------------------------------------------
+# Program analytics: cost efficiency
+# ------------------------------------------------------------------------------
+def display_cost_efficiency(ds: pd.DataFrame, mask, view_key: tuple):
+    st.title("💰 Cost Efficiency")
+    st.markdown("### 1인당 비용 분포 · 예상 대비 실제 비용 · 재원 분담")
+    st.markdown("---")
+
+    table = build_cost_table(ds, view_key[0])
+    rows = table if mask is None else table[mask]
+    if rows[['Estimated Total', 'Actual Total']].notna().to_numpy().sum() == 0:
+        st.warning("⚠️ 비용 컬럼 데이터가 없습니다.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        group = st.selectbox("Group by", COST_GROUPS, key="cost_group")
+    with col2:
+        basis = st.radio("Cost basis", ["Actual", "Estimated"], horizontal=True, key="cost_basis")
+    summary = cost_summary(ds, mask, view_key, group, basis)
+
+    both = rows['Estimated Total'].notna() & rows['Actual Total'].notna()
+    est_both, act_both = rows.loc[both, 'Estimated Total'].sum(), rows.loc[both, 'Actual Total'].sum()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Schemes with cost data", f"{int(rows[f'{basis} Total'].notna().sum()):,}")
+    with c2: st.metric(f"Total {basis} Cost (NPR)", f"{rows[f'{basis} Total'].sum():,.0f}")
+    with c3: st.metric("Median Cost per Capita (NPR)", f"{rows[f'{basis} per capita'].median():,.0f}")
+    with c4: st.metric("Actual vs Estimated", f"{(act_both / est_both - 1) * 100:+.1f}%" if est_both > 0 else "—")
+
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📊 Cost per Capita Distribution")
+        fig1, ax1 = plt.subplots(figsize=(8, 6))
+        per_capita = {b: rows[f"{b} per capita"].dropna() for b in ("Estimated", "Actual")}
+        positive = pd.concat(per_capita.values())
+        positive = positive[positive > 0]
+        if len(positive):
+            bins = np.logspace(np.log10(positive.min()), np.log10(positive.max()), 30)
+            for b, color in (("Estimated", 'lightcoral'), ("Actual", 'steelblue')):
+                ax1.hist(per_capita[b][per_capita[b] > 0], bins=bins, alpha=0.6, color=color, edgecolor='black', label=b)
+            ax1.set_xscale('log')
+        ax1.set_xlabel('Cost per capita (NPR, log scale)', fontsize=12, fontweight='bold')
+        ax1.set_ylabel('Schemes', fontsize=12, fontweight='bold')
+        ax1.legend(fontsize=10)
+        ax1.grid(axis='y', alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig1)
+    with col2:
+        st.subheader("🎯 Estimated vs Actual Cost")
+        fig2, ax2 = plt.subplots(figsize=(8, 6))
+        pts = rows.loc[both & (rows['Estimated Total'] > 0) & (rows['Actual Total'] > 0)]
+        normal, flagged = pts[~pts['Outlier']], pts[pts['Outlier']]
+        ax2.scatter(normal['Estimated Total'], normal['Actual Total'], s=25, color='steelblue', alpha=0.7, label='Scheme')
+        ax2.scatter(flagged['Estimated Total'], flagged['Actual Total'], s=40, color='red', marker='x', label='Outlier')
+        if len(pts):
+            lo = min(pts['Estimated Total'].min(), pts['Actual Total'].min())
+            hi = max(pts['Estimated Total'].max(), pts['Actual Total'].max())
+            ax2.plot([lo, hi], [lo, hi], color='gray', linestyle='--', linewidth=1, label='Actual = Estimated')
+            ax2.set_xscale('log')
+            ax2.set_yscale('log')
+        ax2.set_xlabel('Estimated total cost (NPR)', fontsize=12, fontweight='bold')
+        ax2.set_ylabel('Actual total cost (NPR)', fontsize=12, fontweight='bold')
+        ax2.legend(fontsize=10)
+        ax2.grid(alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig2)
+
+    top = summary.head(12)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(f"📦 {basis} Cost per Capita by {group}")
+        groups = [g for g in top[group] if (rows[group] == g).any()]
+        data = [rows.loc[(rows[group] == g) & (rows[f"{basis} per capita"] > 0), f"{basis} per capita"] for g in groups]
+        fig3, ax3 = plt.subplots(figsize=(8, 6))
+        if any(len(d) for d in data):
+            ax3.boxplot([d if len(d) else [np.nan] for d in data])
+            ax3.set_xticks(range(1, len(groups) + 1), labels=[str(g)[:20] for g in groups], rotation=45, ha='right')
+            ax3.set_yscale('log')
+        ax3.set_ylabel('Cost per capita (NPR, log scale)', fontsize=12, fontweight='bold')
+        ax3.grid(axis='y', alpha=0.3)
+        plt.tight_layout()
+        st.pyplot(fig3)
+    with col2:
+        st.subheader(f"🤝 {basis} Cost Share by {group}")
+        shares = top.set_index(group)[[f"{p} share %" for p in COST_SHARES]].fillna(0)
+        fig4, ax4 = plt.subplots(figsize=(8, 0.45 * len(shares) + 2))
+        left = np.zeros(len(shares))
+        for p, color in zip(COST_SHARES, ['#FFBB28', '#0088FE', '#00C49F']):
+            ax4.barh(shares.index.astype(str), shares[f"{p} share %"], left=left, color=color, edgecolor='black', label=p)
+            left += shares[f"{p} share %"].to_numpy()
+        ax4.invert_yaxis()
+        ax4.set_xlim(0, 100)
+        ax4.set_xlabel('Share of cost (%)', fontsize=12, fontweight='bold')
+        ax4.legend(fontsize=10, loc='lower right')
+        plt.tight_layout()
+        st.pyplot(fig4)
+
+    st.subheader(f"📋 Cost Summary by {group}")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    render_download(
+        "📥 Download Cost Summary", {'Cost summary': summary}, ('cost_summary', view_key, group, basis),
+        f"cost_summary_{group.lower().replace(' ', '_')}_{basis.lower()}", key="cost_summary_csv",
+    )
+
+    outliers = rows[rows['Outlier']]
+    with st.expander(f"⚠️ 비용 이상치 scheme {len(outliers):,}개 (median/MAD, |z| > {COST_OUTLIER_Z:g})", expanded=False):
+        context = [c for c in ('ward#', 'community name') if c in ds.columns]
+        detail = pd.concat([
+            outliers[['Office', 'Palika']],
+            ds.loc[outliers.index, context],
+            outliers[['New vs Rehab', 'Estimated Total', 'Actual Total', 'Estimated per capita', 'Actual per capita',
+                      'Variance %', 'Outlier detail']].round(1),
+        ], axis=1)
+        detail.insert(0, 'CSV line', detail.index + 2)  # 헤더 = 1행
+        render_paged_table(detail, ('cost_outliers', view_key), "cost_outliers_table")
+        render_download(
+            "📥 Download Cost Outliers", {'Outliers': detail}, ('cost_outliers', view_key),
+            "cost_outliers", key="cost_outliers_csv",
+        )
+    st.caption("1인당 비용 = Total cost ÷ Total beneficiary population · Total이 비었거나 0이면 Govt+UNICEF+Community 합계 사용 · "
+               "이상치: log10(1인당 비용)과 Variance %의 modified z-score · 보고 연도와 무관하게 전체 기간 (사이드바 필터는 적용)")
+
+# ------------------------------------------------------------------------------
+# Humanitarian response (3.3): sitrep event dashboards
+# ------------------------------------------------------------------------------
+def render_sitrep_uploader(events: list):
+    """sitrep 업로드 → event store에 바로 추가 (같은 파일은 세션당 한 번)"""
+    with st.expander("📥 Ingest situation report", expanded=False):
+        st.caption(f"CSV/JSON 컬럼: date, people reached (필수) · office, district, palika, activity, male, female, pwd, report id (선택) · "
+                   f"또는 파일을 {EVENT_INBOX_DIR}/ 에 넣으면 백그라운드에서 자동 수집")
+        event = st.selectbox("Event", events, key="sitrep_event")
+        upload = st.file_uploader("Sitrep file", type=['csv', 'json', 'jsonl'], key="sitrep_upload")
+        if upload is None:
+            return
+        done = st.session_state.setdefault('ingested_sitreps', set())
+        if upload.file_id in done:
+            st.caption(f"✅ {upload.name} 수집 완료")
+            return
+        if st.button("Ingest", key="sitrep_button"):
+            try:
+                n = append_events(parse_sitrep(read_sitrep(upload, upload.name), event), source=upload.name)
+            except Exception as e:
+                st.error(f"Sitrep 수집 실패: {e}")
+                return
+            done.add(upload.file_id)
+            st.success(f"{n:,} records added" if n else "이미 수집된 sitrep입니다 (변경 없음)")
+
+def display_humanitarian_event(page: str):
+    st.title(f"🆘 {page}")
+    st.markdown("### Situation reports — people reached by day, office and palika")
+    st.markdown("---")
+
+    worker = get_precompute_worker()  # inbox 수집은 워커가 담당
+    events = [HUMANITARIAN_EVENTS[page]] if page in HUMANITARIAN_EVENTS else list(HUMANITARIAN_EVENTS.values())
+    render_sitrep_uploader(events)
+    failed = {k: v for k, v in worker['errors'].items() if k == EVENT_STORE_PATH or k.startswith(EVENT_INBOX_DIR)}
+    if failed:
+        st.warning("⚠️ " + " · ".join(f"{os.path.basename(k)}: {v}" for k, v in failed.items())
+                   + f" (실패한 파일은 {os.path.join(EVENT_INBOX_DIR, 'failed')}/ 로 이동)")
+
+    agg = event_aggregates()
+    daily = agg['daily']
+    if daily is not None and page in HUMANITARIAN_EVENTS:
+        daily = daily[daily.index.get_level_values('event') == events[0]]
+    if daily is None or daily.empty:
+        st.info(f"ℹ️ 아직 수집된 sitrep이 없습니다. 위에서 업로드하거나 {EVENT_INBOX_DIR}/ 폴더에 파일을 넣으세요.")
+        return
+
+    by_day = daily.groupby(level='date')[EVENT_VALUE_COLS + ['reports']].sum()
+    by_day.index = pd.to_datetime(by_day.index)
+    by_day = by_day.reindex(pd.date_range(by_day.index.min(), by_day.index.max()), fill_value=0)
+    reached = by_day['people_reached']
+    last = reached.iloc[-EVENT_ROLLING_DAYS:].sum()
+    previous = reached.iloc[-2 * EVENT_ROLLING_DAYS:-EVENT_ROLLING_DAYS].sum()
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("People Reached", f"{int(reached.sum()):,}")
+    with c2: st.metric(f"Last {EVENT_ROLLING_DAYS} Days", f"{int(last):,}", f"{int(last - previous):+,}")
+    with c3: st.metric("Palikas Reached", f"{daily.index.get_level_values('palika').nunique():,}")
+    with c4: st.metric("Records", f"{int(by_day['reports'].sum()):,}")
+
+    st.subheader("📈 People Reached by Day")
+    fig1, ax1 = plt.subplots(figsize=(12, 5))
+    ax1.bar(by_day.index, reached, color='#C6DBEF', edgecolor='black', label='Daily')
+    ax1.plot(by_day.index, reached.rolling(EVENT_ROLLING_DAYS, min_periods=1).mean(), color='#0088FE', linewidth=2,
+             label=f'{EVENT_ROLLING_DAYS}-day average')
+    ax1.set_ylabel('People reached', fontsize=12, fontweight='bold')
+    ax1.grid(axis='y', alpha=0.3)
+    ax2 = ax1.twinx()
+    ax2.plot(by_day.index, reached.cumsum(), color='darkorange', linestyle='--', linewidth=2, label='Cumulative')
+    ax2.set_ylabel('Cumulative', fontsize=12, fontweight='bold')
+    lines = ax1.get_legend_handles_labels()
+    more = ax2.get_legend_handles_labels()
+    ax1.legend(lines[0] + more[0], lines[1] + more[1], fontsize=10, loc='upper left')
+    fig1.autofmt_xdate()
+    plt.tight_layout()
+    st.pyplot(fig1)
+
+    by_office = daily.groupby(level='office')[EVENT_VALUE_COLS + ['reports']].sum().sort_values('people_reached', ascending=False)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("🏢 People Reached by Office")
+        fig2, ax2 = plt.subplots(figsize=(8, 6))
+        colors = [OFFICE_COORDINATES.get(o, {}).get('color', '#888888') for o in by_office.index]
+        bars = ax2.bar(by_office.index, by_office['people_reached'], color=colors, edgecolor='black', linewidth=1.5)
+        ax2.set_ylabel('People reached', fontsize=12, fontweight='bold')
+        ax2.grid(axis='y', alpha=0.3)
+        for b in bars:
+            h = b.get_height()
+            ax2.text(b.get_x() + b.get_width()/2., h, f'{int(h):,}', ha='center', va='bottom', fontsize=10, fontweight='bold')
+        plt.tight_layout()
+        st.pyplot(fig2)
+    with col2:
+        st.subheader("📋 Office Summary")
+        table = by_office.astype(int).reset_index()
+        table.columns = ['Office', 'People Reached', 'Male', 'Female', 'PWD', 'Records']
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        if len(events) > 1:
+            by_event = daily.groupby(level='event')['people_reached'].sum().astype(int)
+            st.dataframe(by_event.rename('People Reached').rename_axis('Event').reset_index(), use_container_width=True, hide_index=True)
+
+    st.subheader("🏘️ People Reached by Palika")
+    by_palika = daily.groupby(level=['office', 'palika'])[EVENT_VALUE_COLS + ['reports']].sum().astype(int)
+    by_palika = by_palika.sort_values('people_reached', ascending=False).reset_index()
+    by_palika.columns = ['Office', 'Palika', 'People Reached', 'Male', 'Female', 'PWD', 'Records']
+    st.dataframe(by_palika, use_container_width=True, hide_index=True)
+    render_download(
+        "📥 Download Palika Data", {'Palika': by_palika}, ('humanitarian', page, agg['offset']),
+        f"{'_'.join(events) if len(events) == 1 else 'emergency_response'}_palika",
+    )
+
+    recent = agg['recent']
+    recent = recent[recent['event'].isin(events)]
+    with st.expander(f"🗂️ Latest records ({len(recent):,})", expanded=False):
+        shown = ['received', 'event', 'date', 'office', 'palika', 'activity', 'people_reached', 'report_id', 'source']
+        st.dataframe(recent[[c for c in shown if c in recent.columns]].iloc[::-1], use_container_width=True, hide_index=True)
+    st.caption(f"Event store: {EVENT_STORE_PATH} (append-only, {agg['reports']:,} records) · "
+               f"새로 추가된 줄만 읽어 누적 집계에 반영 · inbox: {EVENT_INBOX_DIR}/")
+
+# ------------------------------------------------------------------------------
+# Data management: data-quality profile
+# ------------------------------------------------------------------------------
+def display_data_quality(ds: pd.DataFrame, mask, view_key: tuple):
+    st.title("🩺 Data Quality Profile")
+    st.markdown("### 결측 · 파싱 실패 · 범위 초과 · 합계 불일치 · 미매핑 Office 점검")
+    st.markdown("---")
+
+    profile = profile_dataset(ds, view_key[0])
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Rows", f"{profile['rows']:,}")
+    with c2: st.metric("Empty rows", f"{profile['empty_rows']:,}")
+    with c3: st.metric("Rows with issues", f"{profile['issue_rows']:,}")
+    with c4: st.metric("Missing standard columns", f"{int((~profile['expected']['Present']).sum()):,}")
+
+    missing = profile['expected'][~profile['expected']['Present']]
+    if not missing.empty:
+        st.warning("⚠️ 다음 표준 컬럼을 찾지 못했습니다 (관련 지표가 계산되지 않거나 기본값으로 대체됨): "
+                   + ", ".join(missing['Standard column']))
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        st.subheader("🚩 Checks")
+        st.dataframe(profile['checks'], use_container_width=True, hide_index=True)
+        if not profile['unmapped_offices'].empty:
+            st.markdown("**Unmapped office values** (현재 'Unknown'으로 집계에서 제외됨)")
+            st.dataframe(profile['unmapped_offices'].rename_axis('office').reset_index(name='Rows'),
+                         use_container_width=True, hide_index=True)
+    with col2:
+        st.subheader("📋 Column profile")
+        st.dataframe(profile['columns'], use_container_width=True, hide_index=True)
+
+    st.subheader("🔍 Rows with issues")
+    rows = profile['row_issues']
+    render_paged_table(rows, ('dq_issues', view_key[0]), "dq_issues_table")
+    if not rows.empty:
+        render_download("📥 Download issue list", {'Issues': rows}, ('dq_issues', view_key[0]), "data_quality_issues")
+    st.caption(f"범위: 수혜 인구 0–{DQ_BENEFICIARY_MAX:,} / 연도 {DQ_YEAR_RANGE[0]}–{DQ_YEAR_RANGE[1]} · "
+               "Null %·Unique는 빈 행을 제외하고 계산")
+
+    st.subheader("📦 Export dataset")
+    render_dataset_download(ds, mask, view_key)
+    st.caption(f"사이드바 필터가 적용된 전체 scheme (표준 컬럼) · 최대 {EXPORT_MAX_ROWS:,}행 · "
+               f"{EXPORT_CHUNK_ROWS:,}행 단위로 {EXPORT_DIR}/에 기록 후 재사용")
+
+# ------------------------------------------------------------------------------
+# Data management: version history & diff
+# ------------------------------------------------------------------------------
+def display_version_diff(path: str, year: int = DEFAULT_REPORTING_YEAR):
+    st.title("🗂️ Dataset Versions & Diff")
+    st.markdown(f"### 버전별 스냅샷 비교 (added / removed / changed schemes, {year})")
+    st.markdown("---")
+
+    history = snapshot_index()
+    history = history[history['source'] == os.path.abspath(path)].drop_duplicates('hash', keep='last')
+    if history.empty:
+        st.info("아직 저장된 스냅샷이 없습니다. 백그라운드 워커가 현재 버전을 곧 저장합니다.")
+        return
+    st.dataframe(
+        history.assign(hash=history['hash'].str[:12])[['ingested_at', 'hash', 'rows', 'bytes']]
+        .rename(columns={'ingested_at': 'Ingested', 'hash': 'Content hash', 'rows': 'Rows', 'bytes': 'Bytes'}),
+        use_container_width=True, hide_index=True
+    )
+    if len(history) < 2:
+        st.info("비교하려면 두 개 이상의 버전이 필요합니다 (WASH.csv를 교체하면 새 스냅샷이 저장됩니다).")
+        return
+
+    labels = {
+        h: f"{t} · {h[:12]} · {r:,} rows"
+        for h, t, r in zip(history['hash'], history['ingested_at'], history['rows'])
+    }
+    hashes = list(labels)
+    col1, col2 = st.columns(2)
+    with col1:
+        old = st.selectbox("Previous version", hashes, index=len(hashes) - 2, format_func=labels.get)
+    with col2:
+        new = st.selectbox("Current version", hashes, index=len(hashes) - 1, format_func=labels.get)
+    if old == new:
+        st.info("서로 다른 두 버전을 선택하세요.")
+        return
+
+    diff = diff_snapshots(old, new, year)
+    counts = diff['counts']
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Added schemes", f"{counts['added']:,}")
+    with c2: st.metric("Removed schemes", f"{counts['removed']:,}")
+    with c3: st.metric("Changed schemes", f"{counts['changed']:,}")
+    with c4: st.metric("Unchanged", f"{counts['unchanged']:,}")
+
+    st.markdown("---")
+    st.subheader("📊 Indicator delta")
+    st.dataframe(diff['indicators'].reset_index(), use_container_width=True, hide_index=True)
+    st.subheader("🏢 Net delta by Office")
+    st.dataframe(diff['offices'].reset_index(), use_container_width=True, hide_index=True)
+
+    tab_added, tab_removed, tab_changed = st.tabs(["➕ Added", "➖ Removed", "✏️ Changed"])
+    with tab_added:
+        render_paged_table(diff['added'], ('snapshot_diff', old, new, year, 'added'), "diff_added_table")
+    with tab_removed:
+        render_paged_table(diff['removed'], ('snapshot_diff', old, new, year, 'removed'), "diff_removed_table")
+    with tab_changed:
+        if not diff['fields'].empty:
+            st.markdown("**Rows changed per field**")
+            st.dataframe(diff['fields'].rename_axis('Field').reset_index(), use_container_width=True, hide_index=True)
+        render_paged_table(diff['changed'], ('snapshot_diff', old, new, year, 'changed'), "diff_changed_table")
+    st.caption("행 키: " + " + ".join(SNAPSHOT_KEY_COLS) + " (같은 키의 n번째 등장 순서 포함)")
+
+# ------------------------------------------------------------------------------
+# Data management: duplicate schemes
+# ------------------------------------------------------------------------------
+def display_duplicates(ds: pd.DataFrame, mask, view_key: tuple, year: int = DEFAULT_REPORTING_YEAR):
+    st.title("🧬 Duplicate Schemes")
+    st.markdown(f"### 같은 community/ward 중복 보고 탐지 및 중복 제거 시 지표 변화 ({year})")
+    st.markdown("---")
+
+    raw_cols = [c for c in ds.columns if not c.startswith('_')]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        identity = st.multiselect(
+            "Identity columns", raw_cols,
+            default=[c for c in DUPLICATE_IDENTITY_COLS if c in raw_cols], key="dup_identity"
+        )
+    with col2:
+        distinct = st.multiselect(
+            "Distinct when different", raw_cols,
+            default=[c for c in DUPLICATE_DISTINCT_COLS if c in raw_cols], key="dup_distinct",
+            help="값이 다르면 같은 community라도 별개 scheme으로 취급 (예: New vs Rehab)"
+        )
+    with col3:
+        drop_types = st.multiselect(
+            "Drop when deduplicating", DUPLICATE_MATCH_TYPES,
+            default=DUPLICATE_MATCH_TYPES[:2], key="dup_drop"
+        )
+    if not identity:
+        st.warning("⚠️ Identity 컬럼을 하나 이상 선택하세요.")
+        return
+
+    duplicates = find_duplicates(ds, view_key[0], tuple(identity), tuple(distinct))
+    flagged = duplicates['match'] != ''
+    if mask is not None:
+        flagged &= mask
+    counts = duplicates.loc[flagged, 'match'].value_counts()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Duplicate groups", f"{duplicates.loc[flagged, 'group'].nunique():,}")
+    for col, kind in zip((c2, c3, c4), DUPLICATE_MATCH_TYPES):
+        with col: st.metric(f"{kind} duplicates", f"{int(counts.get(kind, 0)):,}")
+    if not flagged.any():
+        st.success("✅ 현재 규칙으로 탐지된 중복이 없습니다.")
+        return
+
+    indicators, offices = duplicate_impact(ds, mask, duplicates, drop_types, year)
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("📊 Indicator change under deduplication")
+        st.dataframe(indicators.reset_index(), use_container_width=True, hide_index=True)
+    with col2:
+        st.subheader("🏢 Beneficiaries removed by Office")
+        st.dataframe(offices.reset_index(), use_container_width=True, hide_index=True)
+
+    st.subheader("🔍 Duplicate groups")
+    values = indicator_values(ds, year).round().astype(int)
+    shown = list(dict.fromkeys(identity + distinct))
+    table = pd.concat([duplicates[flagged], ds.loc[flagged, shown], values[flagged]], axis=1)
+    table = table.sort_values('group', kind='stable')  # 그룹 내 파일 순서 유지 → Original이 먼저
+    table.insert(2, 'Dropped', table['match'].isin(drop_types))
+    render_paged_table(table, ('duplicates', view_key, year, tuple(identity), tuple(distinct), tuple(drop_types)), "duplicates_table")
+    render_download(
+        "📥 Download duplicate report", {'Duplicates': table},
+        ('duplicates', view_key, year, tuple(identity), tuple(distinct), tuple(drop_types)), f"duplicate_schemes_{year}",
+    )
+    st.caption("Exact = 모든 컬럼 동일 · Same identity = 공백/대소문자 정규화 후 identity 동일 · Near = 문자/숫자만 비교 시 동일")
+
+# ------------------------------------------------------------------------------
+# Data management: place-name reconciliation
+# ------------------------------------------------------------------------------
+def display_place_reconciliation(ds: pd.DataFrame, view_key: tuple):
+    st.title("🗺️ Place Name Reconciliation")
+    st.markdown("### District / Palika 표기 → gazetteer 표기 매칭 결과")
+    st.markdown("---")
+
+    gazetteer_key = gazetteer_version()
+    if gazetteer_key < 0:
+        st.warning(f"⚠️ {GAZETTEER_PATH} 파일이 없어 공백/대소문자 정리만 적용됩니다.")
+        return
+    report = place_reconciliation(ds, view_key[0], gazetteer_key)
+    counts = report['Status'].value_counts()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("Unique raw names", f"{len(report):,}")
+    with c2: st.metric("Exact", f"{int(counts.get('Exact', 0)):,}")
+    with c3: st.metric("Reconciled", f"{int(counts.get('Reconciled', 0)):,}")
+    with c4: st.metric("Unmatched", f"{int(counts.get('Unmatched', 0)):,}")
+
+    order = {'Unmatched': 0, 'Reconciled': 1, 'Exact': 2}
+    report = report.sort_values(['Status', 'Level', 'Raw'], key=lambda s: s.map(order) if s.name == 'Status' else s)
+    st.dataframe(report, use_container_width=True, hide_index=True)
+    st.caption(
+        f"Gazetteer: {GAZETTEER_PATH} · 매칭 기준 ratio ≥ {PLACE_MATCH_THRESHOLD:g} · "
+        "Unmatched 이름은 원본 표기를 그대로 사용합니다 (gazetteer에 추가하면 다음 데이터 버전부터 반영)."
+    )
+
 # ------------------------------------------------------------------------------
 # Main app logic
 # ------------------------------------------------------------------------------
+run_page = page_runner(file_path, main_menu == "3.3 Arinita", refresh_seconds)
 try:
     if main_menu == "3.1 Siddhi Shrestha":
 
         # -------------------- 3.1.1 --------------------
         if page == "3.1.1 Safe water access 🚰":
-            df_raw = load_data(file_path)
+            ds, mask, view_key, year = load_dashboard_data(file_path)
             if show_columns:
                 st.sidebar.write("📄 CSV Columns (현재 표준명 적용 후):")
-                st.sidebar.write(list(df_raw.columns))
+                st.sidebar.write(source_columns(ds))
 
-            plot_df = process_office_data(df_raw)
-            palika_df = process_palika_data(df_raw)
+            plot_df, palika_df = apply_scenario(*indicator_tables(ds, mask, view_key, '3.1.1', year, targets_version()), '3.1.1')
+            table_key = (view_key, '3.1.1', year, targets_version())
+            palika_parts = palika_partitions(palika_df, table_key)
 
             if plot_df.empty:
-                st.warning("⚠️ 'Completed Projects', 'Safe Water (Yes/Y)', 'Year 2025' 조건을 만족하는 데이터가 없습니다.")
+                st.warning(f"⚠️ 'Completed Projects', 'Safe Water (Yes/Y)', 'Year {year}' 조건을 만족하는 데이터가 없습니다.")
 
-            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis"], horizontal=True)
+            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis", "🌳 Geographic Drill-down", "📈 Multi-year Trend"], horizontal=True)
             st.markdown("---")
 
             total_ben = plot_df['Beneficiaries'].sum()
             total_target = plot_df['Target'].sum()
             total_ach = (total_ben / total_target * 100) if total_target > 0 else 0.0
-            total_palikas = len(palika_df['Palika'].unique())
+            total_palikas = palika_parts['total']
 
             if view_mode == "📊 Office Summary Dashboard":
                 st.title("💧 WASH Program Dashboard - Safe Water Access")
-                st.markdown("### Total Beneficiaries by Field Office (2025)")
+                st.markdown(f"### Total Beneficiaries by Field Office ({year})")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -826,7 +4288,7 @@ try:
                     st.pyplot(fig3)
                 with col2:
                     st.subheader("📋 Summary Table")
-                    summary_df = plot_df.copy()
+                    summary_df = plot_df[['Office', 'Beneficiaries', 'Target', 'Achievement']].copy()
                     summary_df['Beneficiaries'] = summary_df['Beneficiaries'].apply(lambda x: f"{x:,}")
                     summary_df['Target'] = summary_df['Target'].apply(lambda x: f"{x:,}")
                     summary_df['Achievement'] = summary_df['Achievement'].apply(lambda x: f"{x:.1f}%")
@@ -843,17 +4305,23 @@ try:
                     st.markdown("---")
                     st.subheader("📊 Detailed Data Table (Office Level)")
                     st.dataframe(plot_df, use_container_width=True, hide_index=True)
-                    csv = plot_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Office Data as CSV",
-                        data=csv,
-                        file_name="wash_beneficiaries_office_2025.csv",
-                        mime="text/csv"
+                    render_download(
+                        "📥 Download Office Data", {'Office': plot_df, 'Palika': palika_df},
+                        (table_key, scenario_key()), f"wash_beneficiaries_office_{year}",
                     )
 
+                st.markdown("---")
+                display_disaggregation(ds, mask, view_key, '3.1.1', plot_df, year)
+
+            elif view_mode == "🌳 Geographic Drill-down":
+                display_geo_drilldown(ds, mask, view_key, '3.1.1', "Safe Water Access", year)
+
+            elif view_mode == "📈 Multi-year Trend":
+                display_year_trend(ds, mask, view_key, '3.1.1', "Safe Water Access")
+
             elif view_mode == "🗺️ Nepal Map & Palika Analysis":
                 st.title("💧 WASH Program Dashboard - Safe Water Access")
-                st.markdown("### Field Offices Map and Palika-Level Analysis (2025)")
+                st.markdown(f"### Field Offices Map and Palika-Level Analysis ({year})")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -869,7 +4337,7 @@ try:
                 with tab1:
                     st.subheader("🗺️ Field Offices Distribution in Nepal")
                     st.markdown("**마커를 클릭하면 상세 정보를 볼 수 있습니다.** 마커 크기는 수혜자 수를 반영합니다.")
-                    nepal_map = create_nepal_map(plot_df, palika_df)
+                    nepal_map = create_nepal_map(plot_df, palika_parts['palikas'], year)
                     st_folium(nepal_map, width=1200, height=600)
 
                     st.markdown("---")
@@ -880,7 +4348,7 @@ try:
                             with cols[idx]:
                                 office_name = row['Office']
                                 color = OFFICE_COORDINATES.get(office_name, {}).get('color', '#888888')
-                                palikas_count = len(palika_df[palika_df['Office'] == office_name]['Palika'].unique())
+                                palikas_count = palika_parts['palikas'].get(office_name, 0)
                                 st.markdown(f"""
                                 <div style="border-left: 4px solid {color}; padding: 10px; background-color: #f0f2f6; border-radius: 5px;">
                                     <h3 style="color: {color}; margin: 0;">{office_name}</h3>
@@ -919,76 +4387,33 @@ try:
                         st.pyplot(fig2)
 
                 with tab3:
-                    st.subheader("🏘️ Palika-Level Beneficiary Details")
-                    selected_office = st.selectbox("Filter by Field Office:", ["All Offices"] + list(plot_df['Office'].unique()))
-                    if selected_office == "All Offices":
-                        filtered_palika_df = palika_df
-                    else:
-                        filtered_palika_df = palika_df[palika_df['Office'] == selected_office]
-
-                    c1, c2, c3 = st.columns(3)
-                    with c1: st.metric("Palikas", len(filtered_palika_df))
-                    with c2: st.metric("Total Beneficiaries", f"{filtered_palika_df['Beneficiaries'].sum():,}")
-                    with c3:
-                        avg_ben = int(filtered_palika_df['Beneficiaries'].mean()) if len(filtered_palika_df) > 0 else 0
-                        st.metric("Avg per Palika", f"{avg_ben:,}")
-
-                    st.markdown("---")
-                    st.markdown("**Top 10 Palikas by Beneficiaries**")
-                    top_10 = filtered_palika_df.sort_values('Beneficiaries', ascending=False).head(10).copy()
-                    if len(top_10) > 0:
-                        top_10['Color'] = top_10['Office'].apply(lambda x: OFFICE_COORDINATES.get(x, {}).get('color', 'gray'))
-                        fig3, ax3 = plt.subplots(figsize=(12, 6))
-                        bars = ax3.barh(top_10['Palika'], top_10['Beneficiaries'], color=top_10['Color'], edgecolor='black')
-                        ax3.set_xlabel('Total Beneficiaries', fontsize=12, fontweight='bold')
-                        ax3.invert_yaxis()
-                        ax3.grid(axis='x', alpha=0.3)
-                        palika_labels = [f"{r['Palika']} ({r['Office']})" for _, r in top_10.iterrows()]
-                        ax3.set_yticks(list(range(len(palika_labels))))
-                        ax3.set_yticklabels(palika_labels)
-                        for b in bars:
-                            w = b.get_width()
-                            ax3.text(w, b.get_y() + b.get_height()/2., f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
-                        plt.tight_layout()
-                        st.pyplot(fig3)
-                    else:
-                        st.info("선택된 조건에 해당하는 Palika 데이터가 없습니다.")
-
-                    st.markdown("---")
-                    st.markdown("**Complete Palika List**")
-                    st.dataframe(filtered_palika_df, use_container_width=True, hide_index=True)
-                    csv = filtered_palika_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Palika Data as CSV",
-                        data=csv,
-                        file_name=f"palika_water_safe_communities_{selected_office.replace(' ', '_') if selected_office!='All Offices' else 'all'}.csv",
-                        mime="text/csv"
-                    )
+                    display_palika_details(palika_df, plot_df, table_key, "water_safe_communities")
 
         # -------------------- 3.1.2 --------------------
         elif page == "3.1.2 Water-safe communities 🏘️":
-            df_raw = load_data(file_path)
+            ds, mask, view_key, year = load_dashboard_data(file_path)
             if show_columns:
                 st.sidebar.write("📄 CSV Columns (현재 표준명 적용 후):")
-                st.sidebar.write(list(df_raw.columns))
+                st.sidebar.write(source_columns(ds))
 
-            plot_df = process_office_data_312(df_raw)
-            palika_df = process_palika_data_312(df_raw)
+            plot_df, palika_df = apply_scenario(*indicator_tables(ds, mask, view_key, '3.1.2', year, targets_version()), '3.1.2')
+            table_key = (view_key, '3.1.2', year, targets_version())
+            palika_parts = palika_partitions(palika_df, table_key)
 
             if plot_df.empty:
-                st.warning("⚠️ 'Water-safe Communities (Yes/Y)' 및 'WSC Year 2025' 조건을 만족하는 데이터가 없습니다.")
+                st.warning(f"⚠️ 'Water-safe Communities (Yes/Y)' 및 'WSC Year {year}' 조건을 만족하는 데이터가 없습니다.")
 
-            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis"], horizontal=True)
+            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis", "🌳 Geographic Drill-down", "📈 Multi-year Trend"], horizontal=True)
             st.markdown("---")
 
             total_ben = plot_df['Beneficiaries'].sum()
             total_target = plot_df['Target'].sum()
             total_ach = (total_ben / total_target * 100) if total_target > 0 else 0.0
-            total_palikas = len(palika_df['Palika'].unique())
+            total_palikas = palika_parts['total']
 
             if view_mode == "📊 Office Summary Dashboard":
                 st.title("💧 WASH Program Dashboard - Water-safe Communities")
-                st.markdown("### Total Beneficiaries by Field Office (2025)")
+                st.markdown(f"### Total Beneficiaries by Field Office ({year})")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -1055,7 +4480,7 @@ try:
                     st.pyplot(fig3)
                 with col2:
                     st.subheader("📋 Summary Table")
-                    summary_df = plot_df.copy()
+                    summary_df = plot_df[['Office', 'Beneficiaries', 'Target', 'Achievement']].copy()
                     summary_df['Beneficiaries'] = summary_df['Beneficiaries'].apply(lambda x: f"{x:,}")
                     summary_df['Target'] = summary_df['Target'].apply(lambda x: f"{x:,}")
                     summary_df['Achievement'] = summary_df['Achievement'].apply(lambda x: f"{x:.1f}%")
@@ -1072,17 +4497,23 @@ try:
                     st.markdown("---")
                     st.subheader("📊 Detailed Data Table (Office Level)")
                     st.dataframe(plot_df, use_container_width=True, hide_index=True)
-                    csv = plot_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Office Data as CSV",
-                        data=csv,
-                        file_name="wash_water_safe_communities_office_2025.csv",
-                        mime="text/csv"
+                    render_download(
+                        "📥 Download Office Data", {'Office': plot_df, 'Palika': palika_df},
+                        (table_key, scenario_key()), f"wash_water_safe_communities_office_{year}",
                     )
 
+                st.markdown("---")
+                display_disaggregation(ds, mask, view_key, '3.1.2', plot_df, year)
+
+            elif view_mode == "🌳 Geographic Drill-down":
+                display_geo_drilldown(ds, mask, view_key, '3.1.2', "Water-safe Communities", year)
+
+            elif view_mode == "📈 Multi-year Trend":
+                display_year_trend(ds, mask, view_key, '3.1.2', "Water-safe Communities")
+
             elif view_mode == "🗺️ Nepal Map & Palika Analysis":
                 st.title("💧 WASH Program Dashboard - Water-safe Communities")
-                st.markdown("### Field Offices Map and Palika-Level Analysis (2025)")
+                st.markdown(f"### Field Offices Map and Palika-Level Analysis ({year})")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -1097,7 +4528,7 @@ try:
                 with tab1:
                     st.subheader("🗺️ Field Offices Distribution in Nepal")
                     st.markdown("**마커를 클릭하면 상세 정보를 볼 수 있습니다.** 마커 크기는 수혜자 수를 반영합니다.")
-                    nepal_map = create_nepal_map(plot_df, palika_df)
+                    nepal_map = create_nepal_map(plot_df, palika_parts['palikas'], year)
                     st_folium(nepal_map, width=1200, height=600)
 
                     st.markdown("---")
@@ -1108,7 +4539,7 @@ try:
                             with cols[idx]:
                                 office_name = row['Office']
                                 color = OFFICE_COORDINATES.get(office_name, {}).get('color', '#888888')
-                                palikas_count = len(palika_df[palika_df['Office'] == office_name]['Palika'].unique())
+                                palikas_count = palika_parts['palikas'].get(office_name, 0)
                                 st.markdown(f"""
                                 <div style="border-left: 4px solid {color}; padding: 10px; background-color: #f0f2f6; border-radius: 5px;">
                                     <h3 style="color: {color}; margin: 0;">{office_name}</h3>
@@ -1147,77 +4578,35 @@ try:
                         st.pyplot(fig2)
 
                 with tab3:
-                    st.subheader("🏘️ Palika-Level Beneficiary Details")
-                    selected_office = st.selectbox("Filter by Field Office:", ["All Offices"] + list(plot_df['Office'].unique()))
-                    if selected_office == "All Offices":
-                        filtered_palika_df = palika_df
-                    else:
-                        filtered_palika_df = palika_df[palika_df['Office'] == selected_office]
-
-                    c1, c2, c3 = st.columns(3)
-                    with c1: st.metric("Palikas", len(filtered_palika_df))
-                    with c2: st.metric("Total Beneficiaries", f"{filtered_palika_df['Beneficiaries'].sum():,}")
-                    with c3:
-                        avg_ben = int(filtered_palika_df['Beneficiaries'].mean()) if len(filtered_palika_df) > 0 else 0
-                        st.metric("Avg per Palika", f"{avg_ben:,}")
-
-                    st.markdown("---")
-                    st.markdown("**Top 10 Palikas by Beneficiaries**")
-                    top_10 = filtered_palika_df.sort_values('Beneficiaries', ascending=False).head(10).copy()
-                    if len(top_10) > 0:
-                        top_10['Color'] = top_10['Office'].apply(lambda x: OFFICE_COORDINATES.get(x, {}).get('color', 'gray'))
-                        fig3, ax3 = plt.subplots(figsize=(12, 6))
-                        bars = ax3.barh(top_10['Palika'], top_10['Beneficiaries'], color=top_10['Color'], edgecolor='black')
-                        ax3.set_xlabel('Total Beneficiaries', fontsize=12, fontweight='bold')
-                        ax3.invert_yaxis()
-                        ax3.grid(axis='x', alpha=0.3)
-                        palika_labels = [f"{r['Palika']} ({r['Office']})" for _, r in top_10.iterrows()]
-                        ax3.set_yticks(list(range(len(palika_labels))))
-                        ax3.set_yticklabels(palika_labels)
-                        for b in bars:
-                            w = b.get_width()
-                            ax3.text(w, b.get_y() + b.get_height()/2., f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
-                        plt.tight_layout()
-                        st.pyplot(fig3)
-                    else:
-                        st.info("선택된 조건에 해당하는 Palika 데이터가 없습니다.")
-
-                    st.markdown("---")
-                    st.markdown("**Complete Palika List**")
-                    st.dataframe(filtered_palika_df, use_container_width=True, hide_index=True)
-                    csv = filtered_palika_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Palika Data as CSV",
-                        data=csv,
-                        file_name=f"palika_water_safe_communities_{selected_office.replace(' ', '_') if selected_office!='All Offices' else 'all'}.csv",
-                        mime="text/csv"
-                    )
+                    display_palika_details(palika_df, plot_df, table_key, "water_safe_communities")
 
         # -------------------- 3.1.3 (NEW) --------------------
         elif page == "3.1.3 Basic sanitation gained ":
-            df_raw = load_data(file_path)
+            ds, mask, view_key, year = load_dashboard_data(file_path)
             if show_columns:
                 st.sidebar.write("📄 CSV Columns (현재 표준명 적용 후):")
-                st.sidebar.write(list(df_raw.columns))
+                st.sidebar.write(source_columns(ds))
 
-            plot_df = process_office_data_313(df_raw)
-            palika_df = process_palika_data_313(df_raw)
+            _warn_san_year_fallback(ds)
+            plot_df, palika_df = apply_scenario(*indicator_tables(ds, mask, view_key, '3.1.3', year, targets_version()), '3.1.3')
+            table_key = (view_key, '3.1.3', year, targets_version())
+            palika_parts = palika_partitions(palika_df, table_key)
 
             if plot_df.empty:
-                st.warning("⚠️ 'Completed Projects' 및 'Sanitation Year 2025' 조건을 만족하는 데이터가 없습니다. (3.1.3)")
+                st.warning(f"⚠️ 'Completed Projects' 및 'Sanitation Year {year}' 조건을 만족하는 데이터가 없습니다. (3.1.3)")
 
-            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis"], horizontal=True)
+            view_mode = st.radio("Select View:", ["📊 Office Summary Dashboard", "🗺️ Nepal Map & Palika Analysis", "🌳 Geographic Drill-down", "📈 Multi-year Trend"], horizontal=True)
             st.markdown("---")
 
             total_ben = plot_df['Beneficiaries'].sum()
             total_target = plot_df['Target'].sum()
             total_ach = (total_ben / total_target * 100) if total_target > 0 else 0.0
-            total_palikas = len(palika_df['Palika'].unique())
+            total_palikas = palika_parts['total']
 
             if view_mode == "📊 Office Summary Dashboard":
                 st.title("💧 WASH Program Dashboard - Basic Sanitation Gained")
-                st.markdown("### Total Beneficiaries by Field Office (2025)")
-                st.caption(f"Assumption: Beneficiaries = Additional toilets built × {SAN_BENEFICIARY_PER_TOILET}")
+                st.markdown(f"### Total Beneficiaries by Field Office ({year})")
+                st.caption(f"Assumption: Beneficiaries = Additional toilets built × {people_per_toilet():g}")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -1284,7 +4673,7 @@ try:
                     st.pyplot(fig3)
                 with col2:
                     st.subheader("📋 Summary Table")
-                    summary_df = plot_df.copy()
+                    summary_df = plot_df[['Office', 'Beneficiaries', 'Target', 'Achievement']].copy()
                     summary_df['Beneficiaries'] = summary_df['Beneficiaries'].apply(lambda x: f"{x:,}")
                     summary_df['Target'] = summary_df['Target'].apply(lambda x: f"{x:,}")
                     summary_df['Achievement'] = summary_df['Achievement'].apply(lambda x: f"{x:.1f}%")
@@ -1301,18 +4690,24 @@ try:
                     st.markdown("---")
                     st.subheader("📊 Detailed Data Table (Office Level)")
                     st.dataframe(plot_df, use_container_width=True, hide_index=True)
-                    csv = plot_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Office Data as CSV",
-                        data=csv,
-                        file_name="wash_basic_sanitation_gained_office_2025.csv",
-                        mime="text/csv"
+                    render_download(
+                        "📥 Download Office Data", {'Office': plot_df, 'Palika': palika_df},
+                        (table_key, scenario_key()), f"wash_basic_sanitation_gained_office_{year}",
                     )
 
+                st.markdown("---")
+                display_disaggregation(ds, mask, view_key, '3.1.3', plot_df, year)
+
+            elif view_mode == "🌳 Geographic Drill-down":
+                display_geo_drilldown(ds, mask, view_key, '3.1.3', "Basic Sanitation Gained", year)
+
+            elif view_mode == "📈 Multi-year Trend":
+                display_year_trend(ds, mask, view_key, '3.1.3', "Basic Sanitation Gained")
+
             elif view_mode == "🗺️ Nepal Map & Palika Analysis":
                 st.title("💧 WASH Program Dashboard - Basic Sanitation Gained")
-                st.markdown("### Field Offices Map and Palika-Level Analysis (2025)")
-                st.caption(f"Assumption: Beneficiaries = Additional toilets built × {SAN_BENEFICIARY_PER_TOILET}")
+                st.markdown(f"### Field Offices Map and Palika-Level Analysis ({year})")
+                st.caption(f"Assumption: Beneficiaries = Additional toilets built × {people_per_toilet():g}")
                 st.markdown("---")
 
                 c1, c2, c3, c4 = st.columns(4)
@@ -1327,7 +4722,7 @@ try:
                 with tab1:
                     st.subheader("🗺️ Field Offices Distribution in Nepal")
                     st.markdown("**마커를 클릭하면 상세 정보를 볼 수 있습니다.** 마커 크기는 수혜자 수를 반영합니다.")
-                    nepal_map = create_nepal_map(plot_df, palika_df)
+                    nepal_map = create_nepal_map(plot_df, palika_parts['palikas'], year)
                     st_folium(nepal_map, width=1200, height=600)
 
                     st.markdown("---")
@@ -1338,7 +4733,7 @@ try:
                             with cols[idx]:
                                 office_name = row['Office']
                                 color = OFFICE_COORDINATES.get(office_name, {}).get('color', '#888888')
-                                palikas_count = len(palika_df[palika_df['Office'] == office_name]['Palika'].unique())
+                                palikas_count = palika_parts['palikas'].get(office_name, 0)
                                 st.markdown(f"""
                                 <div style="border-left: 4px solid {color}; padding: 10px; background-color: #f0f2f6; border-radius: 5px;">
                                     <h3 style="color: {color}; margin: 0;">{office_name}</h3>
@@ -1377,51 +4772,15 @@ try:
                         st.pyplot(fig2)
 
                 with tab3:
-                    st.subheader("🏘️ Palika-Level Beneficiary Details")
-                    selected_office = st.selectbox("Filter by Field Office:", ["All Offices"] + list(plot_df['Office'].unique()))
-                    if selected_office == "All Offices":
-                        filtered_palika_df = palika_df
-                    else:
-                        filtered_palika_df = palika_df[palika_df['Office'] == selected_office]
-
-                    c1, c2, c3 = st.columns(3)
-                    with c1: st.metric("Palikas", len(filtered_palika_df))
-                    with c2: st.metric("Total Beneficiaries", f"{filtered_palika_df['Beneficiaries'].sum():,}")
-                    with c3:
-                        avg_ben = int(filtered_palika_df['Beneficiaries'].mean()) if len(filtered_palika_df) > 0 else 0
-                        st.metric("Avg per Palika", f"{avg_ben:,}")
-
-                    st.markdown("---")
-                    st.markdown("**Top 10 Palikas by Beneficiaries**")
-                    top_10 = filtered_palika_df.sort_values('Beneficiaries', ascending=False).head(10).copy()
-                    if len(top_10) > 0:
-                        top_10['Color'] = top_10['Office'].apply(lambda x: OFFICE_COORDINATES.get(x, {}).get('color', 'gray'))
-                        fig3, ax3 = plt.subplots(figsize=(12, 6))
-                        bars = ax3.barh(top_10['Palika'], top_10['Beneficiaries'], color=top_10['Color'], edgecolor='black')
-                        ax3.set_xlabel('Total Beneficiaries', fontsize=12, fontweight='bold')
-                        ax3.invert_yaxis()
-                        ax3.grid(axis='x', alpha=0.3)
-                        palika_labels = [f"{r['Palika']} ({r['Office']})" for _, r in top_10.iterrows()]
-                        ax3.set_yticks(list(range(len(palika_labels))))
-                        ax3.set_yticklabels(palika_labels)
-                        for b in bars:
-                            w = b.get_width()
-                            ax3.text(w, b.get_y() + b.get_height()/2., f'{int(w):,}', ha='left', va='center', fontsize=9, fontweight='bold')
-                        plt.tight_layout()
-                        st.pyplot(fig3)
-                    else:
-                        st.info("선택된 조건에 해당하는 Palika 데이터가 없습니다.")
+                    display_palika_details(palika_df, plot_df, table_key, "basic_sanitation_gained")
 
-                    st.markdown("---")
-                    st.markdown("**Complete Palika List**")
-                    st.dataframe(filtered_palika_df, use_container_width=True, hide_index=True)
-                    csv = filtered_palika_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Palika Data as CSV",
-                        data=csv,
-                        file_name=f"palika_basic_sanitation_gained_{selected_office.replace(' ', '_') if selected_office!='All Offices' else 'all'}.csv",
-                        mime="text/csv"
-                    )
+        # -------------------- 3.1.4 / HCF --------------------
+        elif page in ("3.1.4 Schools with WASH ", "HCFs with WASH "):
+            ds, mask, view_key, year = load_dashboard_data(file_path)
+            if show_columns:
+                st.sidebar.write("📄 CSV Columns (현재 표준명 적용 후):")
+                st.sidebar.write(source_columns(ds))
+            run_page(display_facility_indicator, ds, mask, view_key, '3.1.4' if page.startswith("3.1.4") else 'HCF', year)
 
         else:
             # Other indicators under Siddhi Shrestha - show "Ongoing"
@@ -1429,35 +4788,50 @@ try:
 
     # -------------------- Non-3.1 selections (safe placeholders) --------------------
     elif main_menu == "3.2 Dandi Ram":
-        display_coming_soon(f"3.2 Dandi Ram - {page}")
+        ds, mask, view_key, year = load_dashboard_data(file_path)
+        run_page(display_palika_scorecard, ds, mask, view_key, year, page)
 
     elif main_menu == "3.3 Arinita":
-        display_coming_soon(f"3.3 Arinita - {page}")
-
-    elif main_menu == "Janakpur":
-        display_coming_soon(f"Janakpur - {page}")  # Progress against Annual target
+        run_page(display_humanitarian_event, page)
 
-    elif main_menu == "Dhangadi":
-        display_coming_soon(f"Dhangadi - {page}")  # Progress against Annual target
-
-    elif main_menu == "Bhairahawa":
-        display_coming_soon(f"Bhairahawa - {page}")  # Progress against Annual target
-
-    elif main_menu == "Surkhet":
-        display_coming_soon(f"Surkhet - {page}")  # Progress against Annual target
+    elif main_menu in FIELD_OFFICES:
+        # Janakpur / Dhangadi / Bhairahawa / Surkhet → Progress against Annual target
+        ds, mask, view_key, year = load_dashboard_data(file_path)
+        run_page(display_office_progress, ds, mask, view_key, main_menu, year)
 
     elif main_menu == "End Year Progress against Annual target":
-        display_coming_soon("End Year Progress against Annual target")
+        ds, mask, view_key, year = load_dashboard_data(file_path)
+        run_page(display_progress_matrix, ds, mask, view_key, year)
+
+    elif main_menu == "📊 Program Analytics":
+        ds, mask, view_key, year = load_dashboard_data(file_path)
+        if page == "JMP Ladder Transitions":
+            run_page(display_jmp_transitions, ds, mask, view_key, year)
+        elif page == "WSP Step Funnel":
+            run_page(display_wsp_funnel, ds, mask, view_key)
+        elif page == "Cost Efficiency":
+            run_page(display_cost_efficiency, ds, mask, view_key)
+
+    elif main_menu == "🛠️ Data Management":
+        ds, mask, view_key, year = load_dashboard_data(file_path)
+        if page == "Data Quality Profile":
+            run_page(display_data_quality, ds, mask, view_key)
+        elif page == "Version History & Diff":
+            run_page(display_version_diff, file_path, year)
+        elif page == "Duplicate Schemes":
+            run_page(display_duplicates, ds, mask, view_key, year)
+        elif page == "Place Names":
+            run_page(display_place_reconciliation, ds, view_key)
 
     # Footer / Filters info
     if main_menu == "3.1 Siddhi Shrestha":
         if page == "3.1.1 Safe water access 🚰":
-            st.markdown("**Filters Applied:** Completed Projects · Safe Water (Yes/Y) · Year 2025 (Based on WASH.csv)")
+            st.markdown(f"**Filters Applied:** Completed Projects · Safe Water (Yes/Y) · Year {year} (Based on WASH.csv)")
         elif page == "3.1.2 Water-safe communities 🏘️":
-            st.markdown("**Filters Applied:** Community Declared Water Safe (Yes/Y) · WSC Year 2025 (Based on WASH.csv)")
+            st.markdown(f"**Filters Applied:** Community Declared Water Safe (Yes/Y) · WSC Year {year} (Based on WASH.csv)")
         elif page == "3.1.3 Basic sanitation gained ":
-            st.markdown("**Filters Applied:** Completed Projects · Sanitation Year 2025 (Based on WASH.csv)")
-            st.caption(f"Assumption: Beneficiaries = Additional toilets built × {SAN_BENEFICIARY_PER_TOILET}")
+            st.markdown(f"**Filters Applied:** Completed Projects · Sanitation Year {year} (Based on WASH.csv)")
+            st.caption(f"Assumption: Beneficiaries = Additional toilets built × {people_per_toilet():g}")
         else:
             st.markdown(f"**Data Source:** {file_path}")
     else:
@@ -1472,8 +4846,12 @@ except FileNotFoundError:
     st.write("3. 파일 경로를 직접 입력해보세요")
 except KeyError as ke:
     st.error(f"❌ Error: 필요한 컬럼을 찾을 수 없습니다.\n{str(ke)}")
-    st.info("💡 **해결 방법:** CSV 헤더(컬럼명)를 확인하고, 데이터 컬럼명이 본 코드의 기대 표준명과 크게 다를 경우 상단의 'CSV 컬럼 확인(디버그)' 옵션을 켜서 실제 컬럼명을 확인한 뒤 매핑 사전에 변형명을 추가해 주세요.")
+    st.info("💡 **해결 방법:** CSV 헤더(컬럼명)를 확인하고, 데이터 컬럼명이 본 코드의 기대 표준명과 크게 다를 경우 상단의 'CSV 컬럼 확인(디버그)' 옵션을 켜서 실제 컬럼명을 확인한 뒤 매핑 사전에 변형명을 추가해 주세요. "
+            "누락 컬럼 전체 목록은 '🛠️ Data Management › Data Quality Profile'에서 확인할 수 있습니다.")
 except Exception as e:
     st.error(f"❌ Error loading data or rendering dashboard: {str(e)}")
     # import traceback
    
+
+if auto_refresh and not run_page.live:
+    watch_for_updates(file_path, main_menu == "3.3 Arinita", refresh_seconds)
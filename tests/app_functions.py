@@ -0,0 +1,31 @@
+"""
+app(8.1).py는 Streamlit 스크립트라 import하면 페이지 전체가 실행됨.
+테스트는 필요한 최상위 함수/상수만 소스에서 골라 (캐시 decorator 없이) 실행한다.
+"""
+import ast
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app(8.1).py")
+
+def load(*names: str, **namespace) -> dict:
+    """names에 해당하는 def/대입문을 소스 순서대로 실행한 namespace 반환 (namespace로 의존성 주입 가능)"""
+    with open(APP_PATH, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in names:
+            node.decorator_list = []
+            nodes.append(node)
+        elif isinstance(node, ast.Assign) and any(getattr(t, 'id', None) in names for t in node.targets):
+            nodes.append(node)
+    found = {n.name if isinstance(n, ast.FunctionDef) else n.targets[0].id for n in nodes}
+    missing = set(names) - found
+    if missing:
+        raise LookupError(f"not found in {APP_PATH}: {sorted(missing)}")
+    ns = {'np': np, 'pd': pd, 'os': os, 'hashlib': hashlib, **namespace}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), APP_PATH, 'exec'), ns)
+    return ns
@@ -0,0 +1,53 @@
+import os
+
+from app_functions import load
+
+app = load('dataset_version', '_version_size', 'content_hash', '_file_meta', '_detect_append')
+
+HEADER = b"office,palika,year,beneficiaries\r\n"
+ROWS = b"".join(f"Janakpur,P{i},2024,{i * 10}\r\n".encode() for i in range(500))
+APPENDED = b"Surkhet,Birendranagar,2025,40\r\n"
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return app['dataset_version'](str(path))
+
+
+def test_pure_append_returns_previous_size(tmp_path):
+    path = tmp_path / "WASH.csv"
+    old = write(path, HEADER + ROWS)
+    meta = app['_file_meta'](str(path), old)
+    new = write(path, HEADER + ROWS + APPENDED)
+    assert app['_detect_append'](str(path), meta, new) == len(HEADER + ROWS)
+
+
+def test_same_length_edit_before_tail_plus_append_is_revision(tmp_path):
+    path = tmp_path / "WASH.csv"
+    old = write(path, HEADER + ROWS)
+    meta = app['_file_meta'](str(path), old)
+    # 끝부분이 아닌 앞쪽 행의 연도를 같은 길이로 수정 (2024 → 2025) 후 append
+    edited = ROWS.replace(b"Janakpur,P3,2024,", b"Janakpur,P3,2025,", 1)
+    assert len(edited) == len(ROWS) and edited != ROWS
+    new = write(path, HEADER + edited + APPENDED)
+    assert app['_detect_append'](str(path), meta, new) is None
+
+
+def test_header_change_is_revision(tmp_path):
+    path = tmp_path / "WASH.csv"
+    old = write(path, HEADER + ROWS)
+    meta = app['_file_meta'](str(path), old)
+    new = write(path, HEADER.replace(b"year", b"yr__") + ROWS + APPENDED)
+    assert app['_detect_append'](str(path), meta, new) is None
+
+
+def test_shrink_or_missing_newline_is_not_append(tmp_path):
+    path = tmp_path / "WASH.csv"
+    old = write(path, HEADER + ROWS.rstrip(b"\r\n"))
+    meta = app['_file_meta'](str(path), old)
+    assert not meta['ends_with_newline']
+    new = write(path, HEADER + ROWS + APPENDED)
+    assert app['_detect_append'](str(path), meta, new) is None
+    os.truncate(path, 10)
+    assert app['_detect_append'](str(path), meta, app['dataset_version'](str(path))) is None
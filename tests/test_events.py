@@ -0,0 +1,52 @@
+import contextlib
+import fcntl
+import io
+import threading
+import time
+
+import pandas as pd
+
+from app_functions import load
+
+app = load('EVENT_STORE_PATH', 'EVENT_KEYS', 'EVENT_VALUE_COLS', 'EVENT_RECENT_ROWS', '_event_state', 'event_aggregates',
+           '_store_lock', 'append_events', contextlib=contextlib, fcntl=fcntl, io=io, threading=threading, time=time)
+app['_store_lock'] = contextlib.contextmanager(app['_store_lock'])  # load()는 decorator를 빼고 실행함
+append_events, event_aggregates = app['append_events'], app['event_aggregates']
+
+
+def records(people=10):
+    return pd.DataFrame([{
+        'event': 'flood-2024', 'date': '2024-07-01', 'office': 'Janakpur', 'district': 'Dhanusha',
+        'palika': 'Janakpur', 'activity': 'WASH', 'people_reached': float(people), 'male': 4.0,
+        'female': 6.0, 'pwd': 0.0, 'report_id': 'r1',
+    }])
+
+
+def test_concurrent_duplicate_sitrep_is_stored_once(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    added = []
+    start = threading.Barrier(8)
+
+    def upload():
+        start.wait()
+        added.append(append_events(records(), source='upload.csv', path=path))
+
+    threads = [threading.Thread(target=upload) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(added) == [0] * 7 + [1]
+    assert event_aggregates(path)['reports'] == 1
+
+
+def test_lines_without_batch_field_are_folded(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text('{"event": "flood-2024", "date": "2024-07-01", "people_reached": 5}\n', encoding='utf-8')
+    agg = event_aggregates(str(path))
+    assert agg['reports'] == 1 and agg['batches'] == set()
+    assert append_events(records(), source='upload.csv', path=str(path)) == 1
+    assert append_events(records(), source='upload.csv', path=str(path)) == 0
+    agg = event_aggregates(str(path))
+    assert agg['reports'] == 2 and len(agg['batches']) == 1
+    assert agg['daily']['people_reached'].sum() == 10
@@ -0,0 +1,28 @@
+import numpy as np
+
+from app_functions import load
+
+app = load('combine_filter_masks')
+
+INDEX = {
+    'n': 5,
+    'fields': {
+        'Office': {'options': ['Janakpur', 'Surkhet'], 'rows': {'Janakpur': np.array([0, 1]), 'Surkhet': np.array([2, 3, 4])}},
+        'Status': {'options': ['Completed'], 'rows': {'Completed': np.array([1, 2])}},
+    },
+}
+
+
+def test_or_within_field_and_across_fields():
+    mask = app['combine_filter_masks'](INDEX, {'Office': ['Janakpur', 'Surkhet'], 'Status': ['Completed']})
+    assert mask.tolist() == [False, True, True, False, False]
+
+
+def test_no_selection_is_none():
+    assert app['combine_filter_masks'](INDEX, {'Office': [], 'Status': []}) is None
+
+
+def test_stale_value_is_skipped():
+    # 이전 데이터 버전에서 저장된 선택값이 새 인덱스에 없으면 무시
+    mask = app['combine_filter_masks'](INDEX, {'Office': ['Janakpur', 'Dhangadi']})
+    assert mask.tolist() == [True, True, False, False, False]
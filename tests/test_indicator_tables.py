@@ -0,0 +1,87 @@
+import io
+import re
+
+import pandas as pd
+
+from app_functions import load
+
+TARGETS = pd.Series({'Janakpur': 100.0, 'Surkhet': 0.0})
+
+app = load('DISAGG_COLUMNS', 'INDICATOR_VALUE_COLS', '_whole', '_office_rows', office_targets=lambda code, year: TARGETS)
+
+
+def office_totals(beneficiaries):
+    return pd.DataFrame(
+        {'Beneficiaries': beneficiaries, 'Male': [10.6, 0.0], 'Female': [20.5, 0.0], 'PWD': [0.0, 0.0]},
+        index=['Janakpur', 'Surkhet'],
+    )
+
+
+def test_truncated_office_totals_keep_raw_achievement():
+    out = app['_office_rows'](office_totals([50.7, 3.0]), '3.1.1', 2025, rounding=False)
+    assert out['Office'].tolist() == ['Janakpur']
+    assert out[['Beneficiaries', 'Male', 'Female']].iloc[0].tolist() == [50, 10, 20]
+    assert out['Achievement'].iloc[0] == 50.7
+
+
+def test_rounded_office_totals_keep_raw_achievement():
+    out = app['_office_rows'](office_totals([50.7, 3.0]), '3.1.3', 2025)
+    assert out[['Beneficiaries', 'Male', 'Female']].iloc[0].tolist() == [51, 11, 20]
+    assert out['Achievement'].iloc[0] == 50.7
+
+
+# append 버전: 원시 합계를 합친 뒤 한 번만 정수화 → 전체 파일 재빌드와 같은 값
+LINEAGE = {}
+
+pipeline = load(
+    'DEFAULT_REPORTING_YEAR', 'SAN_BENEFICIARY_PER_TOILET', 'DISAGG_COLUMNS', 'STANDARD_COLUMNS', 'OFFICE_NAMES',
+    'INDICATOR_NAMES', 'INDICATOR_YEAR_COLS', 'FACILITY_COLUMNS', 'INDICATOR_VALUE_COLS', 'TRUNCATED_INDICATORS',
+    '_normalize_col', 'robust_rename_columns', 'standardize_columns', '_version_size', '_read_csv_bytes', 'load_data',
+    '_clean_lower', '_to_number', '_to_year', '_is_yes', 'canonical_offices', '_clean_place', 'canonical_districts',
+    'canonical_palikas', 'normalize_dataset', 'prepare_dataset', 'prepare_tail', 'ensure_columns', '_with_mask',
+    'indicator_condition', 'indicator_value', 'indicator_frame', '_whole', '_office_rows', '_join_palika_targets',
+    '_palika_summary', '_palika_sums', '_palika_rows', 'process_office_data', 'process_palika_data',
+    'process_office_data_312', 'process_palika_data_312', 'process_office_data_313', 'process_palika_data_313',
+    'process_office_data_314', 'process_palika_data_314', 'process_office_data_hcf', 'process_palika_data_hcf',
+    'INDICATOR_PROCESSORS', 'indicator_tables', 'indicator_sums', '_indicator_sums',
+    'build_year_trend', 'year_trend_sums', '_year_trend',
+    io=io, re=re, dataset_lineage=LINEAGE.get, match_place=lambda kind, raw, district=None: (None, 0.0),
+    office_targets=lambda code, year: pd.Series({'Janakpur': 100.0, 'Surkhet': 50.0}),
+    palika_targets=lambda code, year: pd.Series(dtype=float),
+)
+
+HEADER = ("office,palika,district,province2,progress,"
+          "water quality test carried out within last one year shows safe water?,"
+          "water supply beneficiaries reporting year,community declared water safe?,wsc reporting year,"
+          "additional toilets built,sanitation beneficiaries reporting year,"
+          "total beneficiary population # (current),beneficiary population male # (current),"
+          "beneficiary population female # (current),beneficiary population person with disability # (current)\r\n")
+
+
+def row(office, palika, total, male, female):
+    return (f"{office},{palika},Dhanusha,Madhesh,Completed,Yes,2025,Yes,2025,3,2025,"
+            f"{total},{male},{female},0.6\r\n")
+
+
+def test_append_merge_matches_full_rebuild_with_fractional_values(tmp_path):
+    base = HEADER + row('Janakpur', 'Mithila', 20.6, 10.4, 10.6) + row('Surkhet', 'Birendranagar', 5, 2.5, 2.5)
+    tail = row('Janakpur', 'Mithila', 20.6, 10.4, 10.6) + row('Janakpur', 'Sabaila', 7.7, 3.5, 4.2)
+    path = tmp_path / 'WASH.csv'
+    path.write_bytes((base + tail).encode())
+    parent, appended, full = (f"{path}:{i}:{n}" for i, n in ((1, len(base)), (2, len(base + tail)), (3, len(base + tail))))
+    LINEAGE[appended] = {'path': str(path), 'parent': parent, 'offset': len(base)}
+
+    merged_ds = pipeline['prepare_dataset'](str(path), appended)
+    full_ds = pipeline['prepare_dataset'](str(path), full)
+    for code in ('3.1.1', '3.1.2', '3.1.3'):
+        merged = pipeline['indicator_tables'](merged_ds, None, (appended, ()), code, 2025)
+        rebuilt = pipeline['indicator_tables'](full_ds, None, (full, ()), code, 2025)
+        for got, want in zip(merged, rebuilt):
+            pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True))
+        pd.testing.assert_frame_equal(
+            pipeline['build_year_trend'](merged_ds, None, (appended, ()), code),
+            pipeline['build_year_trend'](full_ds, None, (full, ()), code),
+        )
+    office, palika = pipeline['indicator_tables'](merged_ds, None, (appended, ()), '3.1.1', 2025)
+    assert office.set_index('Office').loc['Janakpur', ['Beneficiaries', 'Male', 'Female']].tolist() == [48, 24, 25]
+    assert palika.set_index('Palika').loc['Mithila', ['Beneficiaries', 'Male', 'Female']].tolist() == [41, 20, 21]
@@ -0,0 +1,45 @@
+import re
+
+import pandas as pd
+
+from app_functions import load
+
+app = load('_join_labels', '_parse_number', '_to_year', 'profile_dataset', 'DQ_POPULATION_COLS',
+           'DQ_YEAR_COLS', 'DQ_BENEFICIARY_MAX', 'DQ_YEAR_RANGE', 'STANDARD_COLUMNS', re=re)
+profile_dataset = app['profile_dataset']
+TOTAL, MALE, FEMALE, PWD = app['DQ_POPULATION_COLS'].values()
+
+
+def frame(rows):
+    ds = pd.DataFrame(rows, columns=['office', TOTAL, MALE, FEMALE, PWD, 'wsc reporting year'])
+    ds['_office'] = ds['office'].where(ds['office'].isin(['Janakpur']), 'Unknown')
+    return ds
+
+
+def test_join_labels_skips_blanks_and_keeps_column_order():
+    labels = pd.DataFrame([['a', '', 'b'], ['', '', ''], ['', 'c', 'd']], index=[4, 7, 9])
+    assert app['_join_labels'](labels).tolist() == ['a, b', '', 'c, d']
+
+
+def test_issue_strings_for_flagged_rows_only():
+    ds = frame([
+        ['Janakpur', '100', '40', '60', '1', '2024'],
+        ['', 'abc', '40', '60', '1', '2040'],
+        ['X', '-5', '50', '50', '200', '2024'],
+    ])
+    rows = profile_dataset(ds, 'v')['row_issues']
+    assert rows['CSV line'].tolist() == [3, 4]
+    assert rows['Issues'].tolist() == [
+        'Missing office, Unparsable number, Year out of range',
+        'Unmapped office, Beneficiaries out of range, Male + Female ≠ Total, PWD > Total',
+    ]
+    assert rows['Detail'].tolist() == [
+        f'unparsable: {TOTAL}, out of range: wsc reporting year',
+        f'out of range: {TOTAL}, male+female 100 vs total -5',
+    ]
+
+
+def test_clean_data_has_no_issue_rows():
+    rows = profile_dataset(frame([['Janakpur', '100', '40', '60', '1', '2024']]), 'v')['row_issues']
+    assert rows.empty
+    assert list(rows.columns) == ['CSV line', 'office', 'Issues', 'Detail']
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from app_functions import load
+
+app = load('top_n_positions')
+top_n_positions = app['top_n_positions']
+
+
+def stable_top(values, n):
+    s = pd.Series(values, dtype=float).dropna()
+    return s.sort_values(ascending=False, kind='stable').head(n).index.to_numpy()
+
+
+def test_ties_at_cutoff_keep_original_order():
+    values = [0, 3, 0, 1, 1, 1, 0, 3, 2, 3, 0, 2, 1, 2, 3, 1, 2, 0, 1, 3,
+              1, 2, 1, 0, 1, 2, 1, 3, 1, 2, 3, 3, 1, 0, 2, 2, 3, 1, 1, 0]
+    result = top_n_positions(np.array(values), 10)
+    assert result.tolist() == stable_top(values, 10).tolist()
+    assert result[-1] == 8
+
+
+def test_matches_stable_sort_on_random_ties():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        size = int(rng.integers(1, 60))
+        values = rng.integers(0, 5, size).astype(float)
+        values[rng.random(size) < 0.1] = np.nan
+        n = int(rng.integers(1, 20))
+        assert top_n_positions(values, n).tolist() == stable_top(values, n).tolist()
+
+
+def test_nan_excluded_and_short_input():
+    assert top_n_positions(np.array([np.nan, 2.0, np.nan, 5.0]), 10).tolist() == [3, 1]
+    assert top_n_positions(np.array([]), 5).tolist() == []